@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Change Region Extraction - Baseline vs Inspection Difference Map
+Aligns the inspection frame to its baseline, builds a difference map and
+returns padded bounding boxes around connected change regions so the
+detector only has to look where something actually changed.
+"""
+
+import sys
+import cv2
+import numpy as np
+
+
+class ChangeRegionExtractor:
+    def __init__(self,
+                 diff_threshold=35,
+                 min_region_area=64,
+                 padding=32,
+                 max_change_fraction=0.4,
+                 align_size=512,
+                 max_regions=16):
+        """
+        Change region extractor
+
+        Args:
+            diff_threshold: Minimum per-pixel intensity difference (0-255) counted as change
+            min_region_area: Minimum connected component area (pixels, full resolution)
+            padding: Pixels added around every change region before cropping
+            max_change_fraction: Above this changed-area ratio ROI inference is not worth it
+            align_size: Longest side used when estimating the alignment
+            max_regions: Upper bound on the number of crops handed to the detector
+        """
+        self.diff_threshold = diff_threshold
+        self.min_region_area = min_region_area
+        self.padding = padding
+        self.max_change_fraction = max_change_fraction
+        self.align_size = align_size
+        self.max_regions = max_regions
+
+    def estimate_alignment(self, ref_gray, target_gray):
+        """
+        Estimate the euclidean warp that maps the reference frame onto the target frame
+
+        Returns:
+            tuple: (2x3 warp matrix at full resolution, method name)
+        """
+        h, w = target_gray.shape[:2]
+        scale = min(1.0, self.align_size / float(max(h, w)))
+        small_size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        ref_small = cv2.resize(ref_gray, small_size).astype(np.float32)
+        target_small = cv2.resize(target_gray, small_size).astype(np.float32)
+
+        # Translation estimate first - cheap and a good ECC initialisation
+        (dx, dy), _ = cv2.phaseCorrelate(target_small, ref_small)
+        warp = np.array([[1.0, 0.0, dx], [0.0, 1.0, dy]], dtype=np.float32)
+        method = 'phase'
+
+        try:
+            criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 50, 1e-4)
+            _, warp = cv2.findTransformECC(
+                target_small, ref_small, warp, cv2.MOTION_EUCLIDEAN, criteria, None, 5
+            )
+            method = 'ecc'
+        except cv2.error:
+            pass
+
+        # Scale translation back to full resolution
+        warp = warp.copy()
+        warp[0, 2] /= scale
+        warp[1, 2] /= scale
+        return warp, method
+
+    def difference_map(self, ref_img, target_img):
+        """
+        Build an aligned absolute difference map between reference and target
+
+        Returns:
+            tuple: (difference map uint8, valid-pixel mask, alignment method)
+        """
+        h, w = target_img.shape[:2]
+        if ref_img.shape[:2] != (h, w):
+            ref_img = cv2.resize(ref_img, (w, h))
+
+        ref_gray = cv2.cvtColor(ref_img, cv2.COLOR_BGR2GRAY) if ref_img.ndim == 3 else ref_img
+        target_gray = cv2.cvtColor(target_img, cv2.COLOR_BGR2GRAY) if target_img.ndim == 3 else target_img
+
+        warp, method = self.estimate_alignment(ref_gray, target_gray)
+
+        # Warp reference into the target frame; track which pixels are actually covered
+        flags = cv2.INTER_LINEAR + cv2.WARP_INVERSE_MAP
+        aligned_ref = cv2.warpAffine(ref_img, warp, (w, h), flags=flags)
+        valid = cv2.warpAffine(np.full((h, w), 255, dtype=np.uint8), warp, (w, h), flags=flags)
+
+        # Blur before differencing so sensor noise and sub-pixel misalignment do not register
+        aligned_ref = cv2.GaussianBlur(aligned_ref, (5, 5), 0)
+        target_blur = cv2.GaussianBlur(target_img, (5, 5), 0)
+        diff = cv2.absdiff(target_blur, aligned_ref)
+        if diff.ndim == 3:
+            diff = diff.max(axis=2)
+
+        valid = cv2.erode(valid, np.ones((5, 5), np.uint8))
+        diff[valid == 0] = 0
+        return diff, valid, method
+
+    def extract_regions(self, ref_img, target_img):
+        """
+        Extract padded change regions in target image coordinates
+
+        Returns:
+            dict: regions ([x1, y1, x2, y2] lists), changed_fraction, alignment, use_roi
+        """
+        h, w = target_img.shape[:2]
+        diff, valid, method = self.difference_map(ref_img, target_img)
+
+        _, mask = cv2.threshold(diff, self.diff_threshold, 255, cv2.THRESH_BINARY)
+        # Remove speckle, then join fragments of the same hotspot
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((9, 9), np.uint8))
+
+        valid_pixels = max(1, int(np.count_nonzero(valid)))
+        changed_fraction = float(np.count_nonzero(mask)) / valid_pixels
+
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        boxes = []
+        for label in range(1, count):
+            x, y, bw, bh, area = stats[label]
+            if area < self.min_region_area:
+                continue
+            boxes.append([
+                max(0, int(x) - self.padding),
+                max(0, int(y) - self.padding),
+                min(w, int(x + bw) + self.padding),
+                min(h, int(y + bh) + self.padding)
+            ])
+
+        boxes = self._merge_overlapping(boxes)
+        roi_area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in boxes)
+        roi_fraction = roi_area / float(w * h) if w and h else 0.0
+
+        use_roi = (changed_fraction <= self.max_change_fraction and
+                   roi_fraction <= self.max_change_fraction and
+                   len(boxes) <= self.max_regions)
+
+        return {
+            'regions': boxes,
+            'changed_fraction': changed_fraction,
+            'roi_fraction': roi_fraction,
+            'alignment': method,
+            'use_roi': use_roi
+        }
+
+    def _merge_overlapping(self, boxes):
+        """Merge padded boxes that overlap so no area is inferred twice"""
+        merged = [list(b) for b in boxes]
+        changed = True
+        while changed:
+            changed = False
+            result = []
+            while merged:
+                current = merged.pop()
+                i = 0
+                while i < len(merged):
+                    other = merged[i]
+                    if (current[0] < other[2] and other[0] < current[2] and
+                            current[1] < other[3] and other[1] < current[3]):
+                        current = [min(current[0], other[0]), min(current[1], other[1]),
+                                   max(current[2], other[2]), max(current[3], other[3])]
+                        merged.pop(i)
+                        changed = True
+                    else:
+                        i += 1
+                result.append(current)
+            merged = result
+        merged.sort(key=lambda b: (b[1], b[0]))
+        return merged
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python change_regions.py <reference_image> <target_image>")
+        return
+
+    ref_img = cv2.imread(sys.argv[1])
+    target_img = cv2.imread(sys.argv[2])
+    if ref_img is None or target_img is None:
+        print("Error: One or both image paths are invalid.")
+        return
+
+    extractor = ChangeRegionExtractor()
+    info = extractor.extract_regions(ref_img, target_img)
+    print(f"Alignment: {info['alignment']}")
+    print(f"Changed fraction: {info['changed_fraction']:.3f}")
+    print(f"ROI fraction: {info['roi_fraction']:.3f} (use ROI: {info['use_roi']})")
+    for i, region in enumerate(info['regions'], 1):
+        print(f"  {i}. {region}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,27 +7,48 @@ Simple detector that completely ignores low-confidence detections
 import os
 import sys
 import json
+import logging
 import cv2
 import numpy as np
 from pathlib import Path
 
+from image_source import image_name, is_in_memory, load_image, model_source
+from pipeline_metrics import stage
+
+logger = logging.getLogger(__name__)
+
 class CleanThermalDetector:
     def __init__(self, 
                  model_path=None,
-                 confidence_threshold=0.5):
+                 confidence_threshold=0.5,
+                 imgsz=640,
+                 model_provider=None,
+                 verbose=True,
+                 save_results=True):
         """
         Clean thermal detector
         
         Args:
             model_path: Path to YOLO model
             confidence_threshold: Minimum confidence to show detection
+            imgsz: Inference size used for full-frame detection
+            model_provider: Shared ModelProvider; when set the detector serves its model
+                            (and follows its reloads) instead of loading model_path itself
+            verbose: Print banners and per-detection lines; False keeps the detector off
+                     stdout (errors still go to the module logger)
+            save_results: Draw and write the annotated image and detection JSON to
+                          clean_detection_results/; when False detect() returns no image
         """
         self.confidence_threshold = confidence_threshold
+        self.imgsz = imgsz
+        self.verbose = verbose
+        self.save_results = save_results
         
         # Load YOLO model
         self.model_path = self._find_model(model_path)
         self.model = None
         self.class_names = None
+        self.model_provider = model_provider
         
     def _find_model(self, provided_path):
         """Find YOLO model"""
@@ -46,48 +67,65 @@ class CleanThermalDetector:
                 return path
         return "yolov8n.pt"
     
+    def _patch_torch_load(self):
+        """PyTorch compatibility fix for weights_only parameter"""
+        import torch
+        
+        original_torch_load = torch.load
+        def patched_torch_load(f, map_location=None, pickle_module=None, weights_only=None, **kwargs):
+            if isinstance(f, str) and f.endswith('.pt'):
+                weights_only = False
+            elif hasattr(f, 'name') and f.name.endswith('.pt'):
+                weights_only = False
+            return original_torch_load(f, map_location=map_location, pickle_module=pickle_module, 
+                                     weights_only=weights_only, **kwargs)
+        torch.load = patched_torch_load
+    
     def load_model(self):
-        """Load YOLO model"""
+        """Load YOLO model (ONNX Runtime when available, PyTorch otherwise)"""
         try:
-            from ultralytics import YOLO
-            import torch
-            
-            # PyTorch compatibility fix
-            original_torch_load = torch.load
-            def patched_torch_load(f, map_location=None, pickle_module=None, weights_only=None, **kwargs):
-                if isinstance(f, str) and f.endswith('.pt'):
-                    weights_only = False
-                elif hasattr(f, 'name') and f.name.endswith('.pt'):
-                    weights_only = False
-                return original_torch_load(f, map_location=map_location, pickle_module=pickle_module, 
-                                         weights_only=weights_only, **kwargs)
-            torch.load = patched_torch_load
+            if self.model_provider is not None:
+                self.model = self.model_provider.get()
+                self.model_path = self.model_provider.model_path
+                self._set_class_names()
+                if self.verbose:
+                    print(f"Using shared model {self.model_provider.version}")
+                return True
             
-            print(f"Loading YOLO model: {self.model_path}")
-            self.model = YOLO(self.model_path)
+            from onnx_backend import load_inference_model
             
-            # Set class names
-            if "yolov8p2" in self.model_path or "runs/detect" in self.model_path:
-                self.class_names = {
-                    0: 'Faulty',
-                    1: 'faulty_loose_joint', 
-                    2: 'faulty_point_overload',
-                    3: 'potential_faulty',
-                    4: 'normal'
-                }
-                print("Using custom thermal model")
-            else:
-                self.class_names = self.model.names
-                print("Using pretrained model")
+            if self.verbose:
+                print(f"Loading YOLO model: {self.model_path}")
+            self.model = load_inference_model(self.model_path, torch_setup=self._patch_torch_load)
             
-            print(f"Model loaded successfully")
-            print(f"Available classes: {list(self.class_names.values())}")
+            self._set_class_names()
+            if self.verbose:
+                print(f"Inference backend: {getattr(self.model, 'backend', 'torch')}")
+                print(f"Model loaded successfully")
+                print(f"Available classes: {list(self.class_names.values())}")
             return True
             
         except Exception as e:
-            print(f"Error loading model: {e}")
+            logger.error("Error loading model: %s", e)
             return False
     
+    def _set_class_names(self):
+        """Set class names for the loaded model"""
+        if "yolov8p2" in self.model_path or "runs/detect" in self.model_path:
+            self.class_names = {
+                0: 'Faulty',
+                1: 'faulty_loose_joint', 
+                2: 'faulty_point_overload',
+                3: 'potential_faulty',
+                4: 'normal'
+            }
+            if self.verbose:
+                print("Using custom thermal model")
+        else:
+            self.class_names = self.model.names
+            if self.verbose:
+                print("Using pretrained model")
+    
     def _apply_nms_and_limit(self, detections, iou_threshold=0.2, max_detections=8):
         """
         Apply Non-Maximum Suppression to remove overlapping detections
@@ -135,29 +173,105 @@ class CleanThermalDetector:
         filtered_detections.sort(key=lambda x: x['confidence'], reverse=True)
         return filtered_detections[:max_detections]
     
+    def _ensure_model(self):
+        """Make sure a model is loaded; with a provider, pick up a reloaded model"""
+        if self.model is None or (self.model_provider is not None and
+                                  self.model is not self.model_provider.get()):
+            return self.load_model()
+        return True
+    
     def detect(self, image_path):
-        """Run detection and filter by confidence"""
-        if self.model is None:
-            if not self.load_model():
-                return None, []
+        """Run detection and filter by confidence (image path or in-memory image, see image_source.py)"""
+        if not self._ensure_model():
+            return None, []
         
-        print(f"\nYOLO Thermal Detection")
-        print(f"=" * 40)
-        print(f"Image: {os.path.basename(image_path)}")
-        print(f"Model: {os.path.basename(self.model_path)}")
-        print(f"Confidence threshold: {self.confidence_threshold:.2f}")
+        if self.verbose:
+            print(f"\nYOLO Thermal Detection")
+            print(f"=" * 40)
+            print(f"Image: {image_name(image_path)}")
+            print(f"Model: {os.path.basename(self.model_path)}")
+            print(f"Confidence threshold: {self.confidence_threshold:.2f}")
         
         # Run YOLO inference
-        results = self.model(
-            image_path, 
-            conf=0.1,  # Use low threshold for YOLO, filter later
-            save=False,
-            verbose=False
-        )
+        with stage('yolo_forward'):
+            results = self.model(
+                model_source(image_path), 
+                conf=0.1,  # Use low threshold for YOLO, filter later
+                imgsz=self.imgsz,
+                save=False,
+                verbose=False
+            )
         
         # Parse results
-        result = results[0]
+        with stage('postprocess'):
+            valid_detections = self._parse_result(results[0])
+            final_detections = self._select_detections(valid_detections)
+        
+        return self._finalize_detections(image_path, valid_detections, final_detections)
+    
+    def detect_regions(self, image_path, regions):
+        """
+        Run detection only on padded crops of the given regions (batched)
+        and map the boxes back to full-frame coordinates
+        
+        Args:
+            image_path: Path to the full target image (or the image in memory, see image_source.py)
+            regions: List of [x1, y1, x2, y2] crop boxes in frame coordinates
+        """
+        if not self._ensure_model():
+            return None, []
+        
+        img = load_image(image_path)
+        if img is None:
+            logger.warning("Could not load image: %s", image_path)
+            return None, []
+        
+        if self.verbose:
+            print(f"\nYOLO Thermal Detection (change-guided ROI)")
+            print(f"=" * 40)
+            print(f"Image: {image_name(image_path)}")
+            print(f"Regions: {len(regions)}")
+        
+        # Keep objects at the same scale full-frame inference would see them:
+        # every crop gets one common size so the whole batch shares one letterbox ratio
+        frame_h, frame_w = img.shape[:2]
+        frame_ratio = self.imgsz / float(max(frame_h, frame_w))
+        side = max(max(x2 - x1, y2 - y1) for x1, y1, x2, y2 in regions) if regions else 0
+        roi_imgsz = int(np.ceil(side * frame_ratio / 32.0)) * 32
+        
+        if not regions or roi_imgsz >= self.imgsz:
+            if self.verbose:
+                print("Change regions too large for ROI inference - using full frame")
+            return self.detect(image_path)
+        
+        crops = []
+        offsets = []
+        for x1, y1, x2, y2 in regions:
+            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+            cw, ch = min(side, frame_w), min(side, frame_h)
+            x1 = int(min(max(0, cx - cw // 2), frame_w - cw))
+            y1 = int(min(max(0, cy - ch // 2), frame_h - ch))
+            crops.append(img[y1:y1 + ch, x1:x1 + cw])
+            offsets.append((x1, y1))
+        
+        if self.verbose:
+            print(f"ROI inference size: {roi_imgsz} (full frame: {self.imgsz})")
+        
+        # One batched forward pass over all crops
+        with stage('yolo_forward'):
+            results = self.model(crops, conf=0.1, imgsz=roi_imgsz, save=False, verbose=False)
+        with stage('postprocess'):
+            valid_detections = []
+            for result, offset in zip(results, offsets):
+                valid_detections.extend(self._parse_result(result, offset))
+            final_detections = self._select_detections(valid_detections)
+        
+        return self._finalize_detections(image_path, valid_detections, final_detections)
+    
+    def _parse_result(self, result, offset=(0, 0)):
+        """Convert one YOLO result into detection dicts, shifted by the crop offset"""
         boxes = result.boxes
+        off_x, off_y = offset
         
         valid_detections = []
         
@@ -180,11 +294,15 @@ class CleanThermalDetector:
                         'confidence': clean_conf,
                         'class_id': int(cls_id),
                         'class_name': clean_class_name,
-                        'bbox': [int(x1), int(y1), int(x2), int(y2)]
+                        'bbox': [int(x1) + off_x, int(y1) + off_y, int(x2) + off_x, int(y2) + off_y]
                     }
                     
                     valid_detections.append(detection)
         
+        return valid_detections
+    
+    def _select_detections(self, valid_detections):
+        """Sort by confidence, apply NMS + limit and number the survivors"""
         # Sort by confidence first
         valid_detections.sort(key=lambda x: x['confidence'], reverse=True)
         
@@ -194,35 +312,44 @@ class CleanThermalDetector:
         # Re-assign IDs after filtering
         for i, det in enumerate(final_detections):
             det['id'] = i + 1
+        return final_detections
+    
+    def _finalize_detections(self, image_path, valid_detections, final_detections):
+        """Report the final detections, then draw and save them (when save_results is on)"""
+        # Print results
+        if self.verbose:
+            print(f"\nDetection Results:")
+            print(f"Raw detections (above threshold): {len(valid_detections)}")
+            print(f"Final detections (after NMS + limit): {len(final_detections)}")
+            
+            if final_detections:
+                print(f"\nTop {len(final_detections)} Detections:")
+                for det in final_detections:
+                    print(f"  {det['id']}: {det['class_name']} - {det['confidence']:.3f} - {det['bbox']}")
+            else:
+                print(f"No detections above confidence threshold {self.confidence_threshold:.2f}")
         
-        # Create annotated image
-        annotated_img = self._draw_detections(image_path, final_detections)
+        if not self.save_results:
+            return None, final_detections
         
-        # Print results
-        print(f"\nDetection Results:")
-        print(f"Raw detections (above threshold): {len(valid_detections)}")
-        print(f"Final detections (after NMS + limit): {len(final_detections)}")
-        
-        if final_detections:
-            print(f"\nTop {len(final_detections)} Detections:")
-            for det in final_detections:
-                print(f"  {det['id']}: {det['class_name']} - {det['confidence']:.3f} - {det['bbox']}")
-        else:
-            print(f"No detections above confidence threshold {self.confidence_threshold:.2f}")
+        # Create annotated image
+        with stage('annotate'):
+            annotated_img = self._draw_detections(image_path, final_detections)
         
         # Save results
-        self._save_results(image_path, annotated_img, final_detections)
+        with stage('save_results'):
+            self._save_results(image_path, annotated_img, final_detections)
         
         return annotated_img, final_detections
-        
-        return annotated_img, valid_detections
     
     def _draw_detections(self, image_path, detections):
         """Draw detection boxes on image"""
-        img = cv2.imread(image_path)
+        img = load_image(image_path)
         if img is None:
-            print(f"Could not load image: {image_path}")
+            logger.warning("Could not load image: %s", image_path)
             return None
+        if is_in_memory(image_path):
+            img = img.copy()  # The caller's array may be shared (e.g. a service image cache)
         
         for det in detections:
             x1, y1, x2, y2 = det['bbox']
@@ -262,17 +389,18 @@ class CleanThermalDetector:
         output_dir = Path("clean_detection_results")
         output_dir.mkdir(exist_ok=True)
         
-        base_name = Path(image_path).stem
+        base_name = Path(image_name(image_path)).stem
         
         # Save image
         if annotated_img is not None:
             img_path = output_dir / f"{base_name}_clean_detected.jpg"
             cv2.imwrite(str(img_path), annotated_img)
-            print(f"Image saved: {img_path}")
+            if self.verbose:
+                print(f"Image saved: {img_path}")
         
         # Save data
         results_data = {
-            'image_path': image_path,
+            'image_path': image_name(image_path) if is_in_memory(image_path) else image_path,
             'confidence_threshold': float(self.confidence_threshold),
             'detections': detections
         }
@@ -280,7 +408,8 @@ class CleanThermalDetector:
         json_path = output_dir / f"{base_name}_clean_detections.json"
         with open(json_path, 'w') as f:
             json.dump(results_data, f, indent=2)
-        print(f"Data saved: {json_path}")
+        if self.verbose:
+            print(f"Data saved: {json_path}")
 
 
 def main():
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Image Sources - Paths or In-Memory Images
+The pipeline (SwiftMatcher, CleanThermalDetector, SimilarityBasedYOLOSystem) takes an
+image path, an EncodedImage (encoded bytes received by a service) or a decoded BGR
+array. EncodedImage decodes with cv2.imdecode straight from memory, once per read
+mode, so a request's images are never written to or read from a filesystem.
+
+imdecode with a read mode gives exactly what imread gives for the same file; the
+matcher's grayscale read in particular must not be derived from the colour array
+(cv2.cvtColor rounds differently and moves the histogram score - see score_parity.py).
+"""
+
+import hashlib
+import os
+import threading
+
+import cv2
+import numpy as np
+
+MEMORY_IMAGE_NAME = '<memory>'
+
+
+def content_sha256(data):
+    """Hex SHA-256 of encoded image bytes (the key clients reuse instead of re-sending them)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class EncodedImage:
+    """Encoded image bytes plus their decodings (read-only arrays, one per read mode)"""
+
+    def __init__(self, data, sha256=None, name=None):
+        self.data = bytes(data)
+        self.sha256 = sha256 or content_sha256(self.data)
+        self.name = name or f"sha256:{self.sha256[:12]}"
+        self._decoded = {}
+        self._lock = threading.Lock()
+
+    def decode(self, flags=cv2.IMREAD_COLOR):
+        """Decoded array for an imread mode, or None when the bytes are not an image"""
+        with self._lock:
+            if flags not in self._decoded:
+                img = cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), flags)
+                if img is not None:
+                    img.flags.writeable = False  # Shared between requests (service image cache)
+                self._decoded[flags] = img
+            return self._decoded[flags]
+
+    @property
+    def nbytes(self):
+        """Encoded size plus the decodings made so far"""
+        return len(self.data) + sum(img.nbytes for img in list(self._decoded.values()) if img is not None)
+
+
+def is_in_memory(image):
+    return isinstance(image, (EncodedImage, np.ndarray))
+
+
+def load_image(image, flags=cv2.IMREAD_COLOR):
+    """
+    cv2.imread for paths, imdecode for EncodedImage; a decoded BGR array is returned as
+    is (converted for IMREAD_GRAYSCALE). None when the image cannot be read.
+
+    In-memory results may be shared or read-only: copy before drawing on them.
+    """
+    if isinstance(image, EncodedImage):
+        return image.decode(flags)
+    if isinstance(image, np.ndarray):
+        if flags == cv2.IMREAD_GRAYSCALE and image.ndim == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return image
+    return cv2.imread(str(image), flags)
+
+
+def model_source(image):
+    """What to hand a YOLO/ONNX model: the path itself (the model reads it) or a BGR array"""
+    if isinstance(image, EncodedImage):
+        return image.decode(cv2.IMREAD_COLOR)
+    return image
+
+
+def image_name(image):
+    """File name for reports and result files"""
+    if isinstance(image, EncodedImage):
+        return image.name
+    if isinstance(image, np.ndarray):
+        return MEMORY_IMAGE_NAME
+    return os.path.basename(str(image))
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+INT8 Post-Training Quantization for YOLOv8p2 Weights
+Quantizes the exported FP32 ONNX model to INT8 (QDQ format) with static
+calibration on real thermal images from the upload store, validates the result
+against the FP32 model with YOLOComparison and registers it as the 'onnx-int8'
+serving variant only when the mAP@0.5 drop stays within budget.
+"""
+
+import os
+import re
+import sys
+import json
+import random
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from onnx_backend import (OnnxYOLO, export_onnx, letterbox, int8_path_for,
+                          int8_manifest_path_for, EXPORT_IMGSZ)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UPLOADS_DIR = os.environ.get(
+    'ML_UPLOADS_DIR', str(Path(__file__).resolve().parent.parent / 'backend' / 'uploads'))
+
+# Maximum allowed absolute mAP@0.5 drop of INT8 versus FP32 before the variant is rejected
+MAX_MAP_DROP = float(os.environ.get('ML_QUANT_MAX_MAP_DROP', '0.02'))
+CALIBRATION_IMAGES = int(os.environ.get('ML_QUANT_CALIBRATION_IMAGES', '100'))
+
+# Optional fixed labelled validation set (YOLO layout: images/<split>, labels/<split>)
+VALIDATION_DATASET = os.environ.get('ML_QUANT_VALIDATION_DATASET')
+VALIDATION_SPLIT = os.environ.get('ML_QUANT_VALIDATION_SPLIT', 'test')
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def find_calibration_images(uploads_dir=DEFAULT_UPLOADS_DIR, limit=CALIBRATION_IMAGES, seed=0):
+    """
+    Collect inspection and baseline images from backend/uploads/<transformer>/{inspection,baseline}
+
+    Args:
+        uploads_dir: Root of the upload store
+        limit: Maximum number of images (deterministic random subset when there are more)
+        seed: Sampling seed so repeated runs calibrate on the same images
+
+    Returns:
+        list: Image paths
+    """
+    root = Path(uploads_dir)
+    if not root.exists():
+        return []
+
+    images = []
+    for folder in ('inspection', 'baseline'):
+        for path in root.glob(f'*/{folder}/*'):
+            if path.suffix.lower() in IMAGE_EXTENSIONS:
+                images.append(str(path))
+    images.sort()
+
+    if limit and len(images) > limit:
+        images = sorted(random.Random(seed).sample(images, limit))
+    return images
+
+
+def _make_calibration_reader(image_paths, input_name, imgsz):
+    """Build a CalibrationDataReader that feeds images preprocessed exactly like OnnxYOLO does"""
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class ThermalCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self.image_paths = image_paths
+            self.rewind()
+
+        def get_next(self):
+            while self._position < len(self.image_paths):
+                path = self.image_paths[self._position]
+                self._position += 1
+                img = cv2.imread(path)
+                if img is None:
+                    continue
+                boxed, _, _ = letterbox(img, (imgsz, imgsz))
+                blob = np.ascontiguousarray(boxed[..., ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+                return {input_name: blob}
+            return None
+
+        def rewind(self):
+            self._position = 0
+
+    return ThermalCalibrationReader()
+
+
+def head_nodes_to_exclude(onnx_path):
+    """
+    Keep the detection head post-processing (DFL, box decode, concat, sigmoid) in FP32
+
+    Box regression is the most quantization-sensitive part of YOLOv8; the head
+    convolutions are still quantized, only the decode arithmetic stays float.
+    """
+    import onnx
+
+    graph = onnx.load(onnx_path, load_external_data=False).graph
+    module_re = re.compile(r'^/model\.(\d+)/')
+    indices = [int(m.group(1)) for m in (module_re.match(n.name) for n in graph.node) if m]
+    if not indices:
+        return []
+
+    head_prefix = f'/model.{max(indices)}/'
+    return [node.name for node in graph.node
+            if node.name.startswith(head_prefix) and node.op_type != 'Conv']
+
+
+def quantize_int8(weights_path, calibration_images, imgsz=EXPORT_IMGSZ, torch_setup=None):
+    """
+    Produce the INT8 QDQ variant of the weights next to the .pt file
+
+    Args:
+        weights_path: Path to yolov8p2*.pt weights
+        calibration_images: Image paths used for static activation calibration
+        imgsz: Calibration input size (matches the export size)
+        torch_setup: Optional callable run before torch/ultralytics is used
+
+    Returns:
+        str: Path to the INT8 ONNX model
+    """
+    from onnxruntime.quantization import (quantize_static, QuantFormat, QuantType,
+                                          CalibrationMethod)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    import onnxruntime as ort
+
+    fp32_path = export_onnx(weights_path, imgsz=imgsz, torch_setup=torch_setup)
+    int8_path = int8_path_for(weights_path)
+    input_name = ort.InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(int8_path)) as tmp_dir:
+        prepared_path = os.path.join(tmp_dir, 'prepared.onnx')
+        output_path = os.path.join(tmp_dir, 'int8.onnx')
+
+        # Shape inference + graph cleanup so the quantizer sees every tensor
+        quant_pre_process(fp32_path, prepared_path, skip_symbolic_shape=False)
+
+        quantize_static(
+            prepared_path,
+            output_path,
+            _make_calibration_reader(calibration_images, input_name, imgsz),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            calibrate_method=CalibrationMethod.MinMax,
+            nodes_to_exclude=head_nodes_to_exclude(prepared_path)
+        )
+        os.replace(output_path, int8_path)
+
+    return int8_path
+
+
+def validate_int8(fp32_onnx_path, int8_path, dataset_path, split='test', confidence_threshold=0.001):
+    """
+    Compare INT8 against FP32 on a labelled dataset with YOLOComparison
+
+    Both models run through the same ONNX Runtime pre/postprocessing, so the
+    difference isolates the quantization error.
+
+    Returns:
+        dict: fp32 / int8 overall metrics and the mAP@0.5 drop
+    """
+    from yolov8p2_batch_comparison import YOLOComparison
+
+    metrics = {}
+    for name, path in (('fp32', fp32_onnx_path), ('int8', int8_path)):
+        comparison = YOLOComparison(path, dataset_path, model=OnnxYOLO(path), split=split)
+        results = comparison.run_batch_comparison(confidence_threshold)
+        metrics[name] = results['overall_metrics']
+        metrics[name]['total_images'] = results['total_images']
+
+    metrics['map50_drop'] = metrics['fp32']['map50'] - metrics['int8']['map50']
+    return metrics
+
+
+def quantize_and_register(weights_path, validation_dataset=None, split=VALIDATION_SPLIT,
+                          max_map_drop=MAX_MAP_DROP, uploads_dir=DEFAULT_UPLOADS_DIR,
+                          calibration_limit=CALIBRATION_IMAGES, torch_setup=None):
+    """
+    Quantize, validate and register the INT8 serving variant for the weights
+
+    The sidecar manifest (<stem>.int8.json) marks the variant accepted only when it
+    was validated within the mAP budget; onnx_backend serves nothing else.
+
+    Returns:
+        dict: The written manifest
+    """
+    validation_dataset = validation_dataset or VALIDATION_DATASET
+    manifest = {
+        'weights': os.path.abspath(weights_path),
+        'int8_model': int8_path_for(weights_path),
+        'created': datetime.now().isoformat(),
+        'max_map_drop': max_map_drop,
+        'validation_dataset': validation_dataset,
+        'validation_split': split,
+        'accepted': False
+    }
+
+    calibration_images = find_calibration_images(uploads_dir, calibration_limit)
+    manifest['calibration_images'] = len(calibration_images)
+    if not calibration_images:
+        manifest['reason'] = f'No calibration images found under {uploads_dir}'
+        logger.warning(manifest['reason'])
+        return _write_manifest(weights_path, manifest)
+
+    logger.info(f"Quantizing {weights_path} to INT8 with {len(calibration_images)} calibration images")
+    int8_path = quantize_int8(weights_path, calibration_images, torch_setup=torch_setup)
+
+    if not validation_dataset or not os.path.isdir(os.path.join(validation_dataset, 'images', split)):
+        manifest['reason'] = 'No labelled validation dataset; INT8 variant not validated'
+        logger.warning(manifest['reason'])
+        return _write_manifest(weights_path, manifest)
+
+    validation = validate_int8(export_onnx(weights_path, torch_setup=torch_setup), int8_path,
+                               validation_dataset, split)
+    manifest['validation'] = validation
+
+    if validation['fp32']['total_images'] == 0:
+        manifest['reason'] = f'Validation split {split} is empty'
+    elif validation['map50_drop'] > max_map_drop:
+        manifest['reason'] = (f"mAP@0.5 drop {validation['map50_drop']:.4f} exceeds budget {max_map_drop:.4f}")
+    else:
+        manifest['accepted'] = True
+
+    if manifest['accepted']:
+        logger.info(f"INT8 variant accepted (mAP@0.5 {validation['fp32']['map50']:.4f} -> "
+                    f"{validation['int8']['map50']:.4f}): {int8_path}")
+    else:
+        logger.warning(f"INT8 variant rejected: {manifest['reason']}")
+    return _write_manifest(weights_path, manifest)
+
+
+def _write_manifest(weights_path, manifest):
+    manifest_path = int8_manifest_path_for(weights_path)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='INT8 post-training quantization for YOLOv8p2 weights')
+    parser.add_argument('weights', help='Path to yolov8p2*.pt weights')
+    parser.add_argument('--dataset', default=VALIDATION_DATASET,
+                        help='Labelled validation dataset (images/<split>, labels/<split>)')
+    parser.add_argument('--split', default=VALIDATION_SPLIT, help='Validation split (default: test)')
+    parser.add_argument('--max-map-drop', type=float, default=MAX_MAP_DROP, help='Allowed mAP@0.5 drop')
+    parser.add_argument('--uploads', default=DEFAULT_UPLOADS_DIR, help='Upload store used for calibration')
+    parser.add_argument('--calibration-images', type=int, default=CALIBRATION_IMAGES,
+                        help='Maximum number of calibration images')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not os.path.exists(args.weights):
+        print(f"Weights not found: {args.weights}")
+        sys.exit(2)
+
+    manifest = quantize_and_register(args.weights, args.dataset, args.split, args.max_map_drop,
+                                     args.uploads, args.calibration_images)
+    print(json.dumps({k: v for k, v in manifest.items() if k != 'validation'}, indent=2, default=str))
+    if 'validation' in manifest:
+        validation = manifest['validation']
+        print(f"mAP@0.5 FP32: {validation['fp32']['map50']:.4f}  INT8: {validation['int8']['map50']:.4f}  "
+              f"drop: {validation['map50_drop']:.4f}")
+    sys.exit(0 if manifest['accepted'] else 1)
+
+
+if __name__ == "__main__":
+    main()
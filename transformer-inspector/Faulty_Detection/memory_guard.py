@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Memory Guard - Accounting and RSS Watchdog for Long-Running Workers
+Current RSS from /proc, size estimates for served models, a ledger of bytes held
+by in-flight work, an explicit release step (gc, CUDA cache, glibc malloc_trim)
+used after model swaps and fine-tunes, and a watchdog thread that calls back when
+RSS stays above a budget after a release so the worker can be recycled gracefully.
+"""
+
+import ctypes
+import ctypes.util
+import gc
+import logging
+import os
+import resource
+import sys
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss_bytes():
+    """Resident set size now (Linux /proc); elsewhere the peak from getrusage"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    """Peak resident set size so far (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def model_weights_bytes(model):
+    """
+    Estimated memory held by a served model
+
+    PyTorch models: parameters plus buffers; ONNX Runtime sessions: the model file
+    (initializers are loaded once); other models (stubs): None
+    """
+    torch_module = getattr(model, 'model', None)
+    if hasattr(torch_module, 'parameters'):
+        tensors = list(torch_module.parameters()) + list(torch_module.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    path = getattr(model, 'model_path', None)
+    if getattr(model, 'backend', '').startswith('onnx') and path and os.path.exists(path):
+        return os.path.getsize(path)
+    return None
+
+
+def _malloc_trim():
+    """Return freed heap pages to the OS (glibc only; a no-op elsewhere)"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+        return bool(libc.malloc_trim(0))
+    except (OSError, AttributeError):
+        return False
+
+
+def release_memory():
+    """
+    Collect garbage, drop the CUDA caching allocator's free blocks and trim the heap;
+    call after dropping the last reference to a model or a finished training run
+
+    Returns:
+        int: RSS bytes freed (may be negative when other threads allocated meanwhile)
+    """
+    before = current_rss_bytes()
+    gc.collect()
+    torch = sys.modules.get('torch')
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    _malloc_trim()
+    return before - current_rss_bytes()
+
+
+class MemoryLedger:
+    """Bytes held per component by work in progress (e.g. decoded request images)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bytes = {}
+
+    def add(self, component, nbytes):
+        with self._lock:
+            self._bytes[component] = self._bytes.get(component, 0) + nbytes
+
+    def sub(self, component, nbytes):
+        self.add(component, -nbytes)
+
+    @contextmanager
+    def hold(self, component, nbytes):
+        """Account nbytes to component for the duration of the block"""
+        self.add(component, nbytes)
+        try:
+            yield
+        finally:
+            self.sub(component, nbytes)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._bytes)
+
+
+class MemoryWatchdog:
+    def __init__(self, budget_bytes, on_over_budget, interval=10.0):
+        """
+        RSS watchdog
+
+        Every interval the RSS is compared with the budget. Above it, release_memory()
+        runs first; if RSS is still above budget, on_over_budget(rss_bytes) is called
+        once (the worker is expected to drain and exit; the watchdog then stops).
+
+        Args:
+            budget_bytes: RSS budget in bytes
+            on_over_budget: Callback run on its own (watchdog) thread
+            interval: Seconds between checks
+        """
+        self.budget_bytes = budget_bytes
+        self.on_over_budget = on_over_budget
+        self.interval = interval
+        self.state = 'ok'  # ok -> released (back under budget) | over_budget
+        self.checks = 0
+        self.releases = 0
+        self.last_release_freed = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """One check; returns True once the over-budget callback has fired"""
+        self.checks += 1
+        if current_rss_bytes() <= self.budget_bytes:
+            return False
+        self.releases += 1
+        self.last_release_freed = release_memory()
+        rss = current_rss_bytes()
+        if rss <= self.budget_bytes:
+            self.state = 'released'
+            logger.info(f"RSS back under budget after release ({self.last_release_freed / MB:.0f}MB freed)")
+            return False
+        self.state = 'over_budget'
+        logger.warning(f"RSS {rss / MB:.0f}MB over budget {self.budget_bytes / MB:.0f}MB after release")
+        self.on_over_budget(rss)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self.check():
+                    return
+            except Exception as e:
+                logger.error(f"Memory watchdog check failed: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='memory-watchdog', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def info(self):
+        return {
+            'state': self.state,
+            'budget_mb': round(self.budget_bytes / MB, 1),
+            'checks': self.checks,
+            'releases': self.releases,
+            'last_release_freed_mb': round(self.last_release_freed / MB, 1)
+        }
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Model Provider - Single Source of the Served YOLOv8p2 Model
+Resolves which weights to serve (newest fine-tuned yolov8p2_*.pt, else yolov8p2.pt),
+loads them once through the inference backend and hands the same instance to every
+consumer (Flask app, CleanThermalDetector, similarity system). Every load gets an
+explicit version so responses and health checks say exactly which weights served them.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from memory_guard import MB, current_rss_bytes, model_weights_bytes, release_memory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_DIR = str(Path(__file__).resolve().parent)
+
+
+def resolve_model_path(model_dir=DEFAULT_MODEL_DIR):
+    """
+    Pick the weights to serve: newest timestamped yolov8p2_*.pt, else yolov8p2.pt
+
+    Returns:
+        str: Absolute path to the weights
+
+    Raises:
+        FileNotFoundError: If neither exists
+    """
+    model_dir = os.path.abspath(model_dir)
+    pt_files = sorted(f for f in os.listdir(model_dir) if f.startswith('yolov8p2_') and f.endswith('.pt'))
+    if pt_files:
+        # Timestamped names (yolov8p2_YYYYmmdd_HHMMSS.pt) sort chronologically
+        return os.path.join(model_dir, pt_files[-1])
+
+    default_path = os.path.join(model_dir, 'yolov8p2.pt')
+    if os.path.exists(default_path):
+        return default_path
+    raise FileNotFoundError(f"No YOLOv8p2 model found in {model_dir}")
+
+
+def weights_digest(path, chunk_size=1 << 20):
+    """Short content hash of a weights file (identifies the exact weights served)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class ModelProvider:
+    def __init__(self, model_dir=DEFAULT_MODEL_DIR, model_path=None, backend=None, torch_setup=None):
+        """
+        Shared model provider
+
+        Args:
+            model_dir: Directory searched for yolov8p2 weights
+            model_path: Pin specific weights instead of resolving the newest ones
+            backend: Inference backend passed to onnx_backend (default: ML_INFERENCE_BACKEND)
+            torch_setup: Optional callable run before torch/ultralytics is used
+        """
+        self.model_dir = model_dir
+        self.pinned_path = model_path
+        self.backend = backend
+        self.torch_setup = torch_setup
+
+        self._lock = threading.Lock()
+        self._model = None
+        self._version = 0
+        self._info = None
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    @property
+    def model_path(self):
+        return self._info['path'] if self._info else None
+
+    @property
+    def version(self):
+        """Version id of the served weights, e.g. 'v2:yolov8p2_20250101_120000@3fa2c1d09b7e'"""
+        return self._info['version_id'] if self._info else None
+
+    def info(self):
+        """Version record of the served model (None until loaded)"""
+        return dict(self._info) if self._info else None
+
+    def get(self):
+        """Return the shared model, loading it on first use"""
+        model = self._model
+        if model is not None:
+            return model
+        with self._lock:
+            if self._model is None:
+                self._load(self.pinned_path or resolve_model_path(self.model_dir))
+            return self._model
+
+    def reload(self, model_path=None):
+        """
+        Load new weights and swap them in atomically; callers keep using the old
+        instance until the new one is ready
+
+        Args:
+            model_path: Weights to serve (default: resolve the newest again)
+
+        Returns:
+            dict: Version record of the new model
+        """
+        with self._lock:
+            if model_path:
+                self.pinned_path = model_path
+            self._load(self.pinned_path or resolve_model_path(self.model_dir))
+            return self.info()
+
+    def install(self, model, label):
+        """
+        Serve an in-process model instead of loading weights (benchmarks, stub models)
+
+        Args:
+            model: Callable with the ultralytics YOLO interface
+            label: Stands in for the weights path in the version record
+        """
+        with self._lock:
+            version = self._version + 1
+            self._info = {
+                'version': version,
+                'version_id': f"v{version}:{label}",
+                'path': label,
+                'sha256_prefix': None,
+                'backend': getattr(model, 'backend', 'torch'),
+                'loaded_at': datetime.now().isoformat(),
+                'load_ms': 0.0,
+                'weights_bytes': model_weights_bytes(model)
+            }
+            self._swap(model, version)
+            logger.info(f"Serving in-process model {self._info['version_id']}")
+            return self.info()
+
+    def _load(self, model_path):
+        from onnx_backend import load_inference_model
+
+        start = time.perf_counter()
+        model = load_inference_model(model_path, backend=self.backend, torch_setup=self.torch_setup)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        digest = weights_digest(model_path)
+        version = self._version + 1
+        self._info = {
+            'version': version,
+            'version_id': f"v{version}:{Path(model_path).stem}@{digest}",
+            'path': model_path,
+            'sha256_prefix': digest,
+            'backend': getattr(model, 'backend', 'torch'),
+            'loaded_at': datetime.now().isoformat(),
+            'load_ms': round(load_ms, 1),
+            'weights_bytes': model_weights_bytes(model)
+        }
+        self._swap(model, version)
+        logger.info(f"Serving model {self._info['version_id']} "
+                    f"(backend: {self._info['backend']}, {load_ms:.0f}ms)")
+
+    def _swap(self, model, version):
+        """Serve model and release the previous one (consumers drop their reference on next use)"""
+        previous = self._model
+        self._model = model
+        self._version = version
+        if previous is not None:
+            before = current_rss_bytes()
+            del previous
+            release_memory()
+            logger.info(f"Released previous model ({(before - current_rss_bytes()) / MB:.0f}MB RSS returned)")
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime Inference Backend for YOLOv8p2 Weights
+Exports yolov8p2*.pt to ONNX (cached next to the weights) and serves it with
+ONNX Runtime on CPU using our own letterbox and postprocess, so inference does
+not need torch at all once the artifact exists. Results mimic the subset of the
+ultralytics Results/Boxes API our callers use, so it is a drop-in replacement.
+"""
+
+import os
+import ast
+import sys
+import json
+import time
+import logging
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 'auto' -> ONNX Runtime when available, PyTorch otherwise; 'onnx' / 'torch' to force;
+# 'onnx-int8' -> validated INT8 variant when one exists for the weights, FP32 ONNX otherwise
+INFERENCE_BACKEND = os.environ.get('ML_INFERENCE_BACKEND', 'auto').lower()
+
+EXPORT_IMGSZ = 640
+
+
+def default_intra_op_threads():
+    """Split the cores between service workers instead of oversubscribing them"""
+    env_threads = os.environ.get('ONNX_INTRA_OP_THREADS')
+    if env_threads:
+        return max(1, int(env_threads))
+    workers = max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def onnx_path_for(weights_path):
+    """Cached ONNX artifact lives next to the .pt weights"""
+    return str(Path(weights_path).with_suffix('.onnx'))
+
+
+def int8_path_for(weights_path):
+    """Quantized INT8 (QDQ) variant lives next to the weights as <stem>.int8.onnx"""
+    return str(Path(weights_path).with_suffix('.int8.onnx'))
+
+
+def int8_manifest_path_for(weights_path):
+    """Sidecar recording how the INT8 variant was calibrated and validated"""
+    return str(Path(weights_path).with_suffix('.int8.json'))
+
+
+def accepted_int8_path(weights_path):
+    """
+    Return the INT8 variant path if it was validated within budget against these exact weights
+
+    Returns:
+        str or None
+    """
+    int8_path = int8_path_for(weights_path)
+    manifest_path = int8_manifest_path_for(weights_path)
+    if not (os.path.exists(int8_path) and os.path.exists(manifest_path)):
+        return None
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    # A variant built from older weights is stale even if it passed validation back then
+    if not manifest.get('accepted') or not _is_fresh(int8_path, weights_path):
+        return None
+    return int8_path
+
+
+_torch_load_patched = False
+
+
+def patch_torch_load():
+    """
+    PyTorch compatibility patch: load .pt checkpoints with weights_only=False (once per process)
+
+    Pass it as torch_setup, or call it before importing ultralytics.
+    """
+    global _torch_load_patched
+    if _torch_load_patched:
+        return
+    _torch_load_patched = True
+    import torch
+    original_load = torch.load
+
+    def patched_load(f, map_location=None, pickle_module=None, weights_only=None, **kwargs):
+        if isinstance(f, (str, Path)) and str(f).endswith('.pt'):
+            weights_only = False
+        elif hasattr(f, 'name') and str(f.name).endswith('.pt'):
+            weights_only = False
+        return original_load(f, map_location=map_location, pickle_module=pickle_module,
+                             weights_only=weights_only, **kwargs)
+
+    torch.load = patched_load
+    logger.info("PyTorch compatibility patch applied")
+
+
+def export_onnx(weights_path, imgsz=EXPORT_IMGSZ, force=False, torch_setup=None):
+    """
+    Export .pt weights to ONNX unless a fresh cached artifact already exists
+
+    Args:
+        weights_path: Path to yolov8p2*.pt weights
+        imgsz: Export image size
+        force: Re-export even if the cached artifact is newer than the weights
+        torch_setup: Optional callable run before torch/ultralytics is used (e.g. torch.load patch)
+
+    Returns:
+        str: Path to the ONNX artifact
+    """
+    onnx_path = onnx_path_for(weights_path)
+    if not force and _is_fresh(onnx_path, weights_path):
+        return onnx_path
+
+    lock_path = onnx_path + '.lock'
+    with open(lock_path, 'w') as lock_file:
+        _lock(lock_file)
+        try:
+            # Another worker may have finished the export while we waited
+            if not force and _is_fresh(onnx_path, weights_path):
+                return onnx_path
+
+            if torch_setup is not None:
+                torch_setup()
+            from ultralytics import YOLO
+
+            start = time.time()
+            logger.info(f"Exporting {weights_path} to ONNX (imgsz={imgsz})")
+            exported = YOLO(weights_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=False)
+            if exported and os.path.abspath(str(exported)) != os.path.abspath(onnx_path):
+                os.replace(str(exported), onnx_path)
+            logger.info(f"ONNX export finished in {time.time() - start:.1f}s: {onnx_path}")
+            return onnx_path
+        finally:
+            _unlock(lock_file)
+
+
+def _is_fresh(artifact_path, source_path):
+    return (os.path.exists(artifact_path) and
+            os.path.getmtime(artifact_path) >= os.path.getmtime(source_path))
+
+
+def _lock(lock_file):
+    try:
+        import fcntl
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    except ImportError:
+        pass
+
+
+def _unlock(lock_file):
+    try:
+        import fcntl
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    except ImportError:
+        pass
+
+
+def load_inference_model(weights_path, backend=None, torch_setup=None):
+    """
+    Load the serving model for the given weights with automatic fallback to PyTorch
+
+    Args:
+        weights_path: Path to .pt (or already exported .onnx) weights
+        backend: 'auto', 'onnx', 'onnx-int8' or 'torch' (defaults to ML_INFERENCE_BACKEND)
+        torch_setup: Optional callable run before torch/ultralytics is used
+
+    Returns:
+        OnnxYOLO or ultralytics.YOLO instance
+    """
+    backend = (backend or INFERENCE_BACKEND).lower()
+
+    if backend == 'onnx-int8':
+        int8_path = accepted_int8_path(weights_path)
+        if int8_path:
+            try:
+                model = OnnxYOLO(int8_path)
+                model.backend = 'onnx-int8'
+                logger.info(f"Serving INT8 variant {int8_path} with ONNX Runtime")
+                return model
+            except Exception as e:
+                logger.warning(f"INT8 variant unavailable for {weights_path}, using FP32 ONNX: {e}")
+        else:
+            logger.info(f"No validated INT8 variant for {weights_path}, using FP32 ONNX")
+        backend = 'onnx'
+
+    if backend in ('auto', 'onnx'):
+        try:
+            onnx_path = weights_path if str(weights_path).endswith('.onnx') else \
+                export_onnx(weights_path, torch_setup=torch_setup)
+            model = OnnxYOLO(onnx_path)
+            logger.info(f"Serving {onnx_path} with ONNX Runtime ({model.intra_op_threads} intra-op threads)")
+            return model
+        except Exception as e:
+            logger.warning(f"ONNX Runtime backend unavailable for {weights_path}, falling back to PyTorch: {e}")
+
+    if torch_setup is not None:
+        torch_setup()
+    from ultralytics import YOLO
+    logger.info(f"Serving {weights_path} with PyTorch")
+    return YOLO(weights_path)
+
+
+def letterbox(img, new_shape, stride=32, auto=False, color=(114, 114, 114)):
+    """
+    Resize and pad image while meeting stride-multiple constraints (ultralytics LetterBox semantics)
+
+    Returns:
+        tuple: (padded image, ratio, (pad_left, pad_top))
+    """
+    h, w = img.shape[:2]
+    new_h, new_w = new_shape
+    r = min(new_h / h, new_w / w)
+
+    unpad_w, unpad_h = int(round(w * r)), int(round(h * r))
+    dw, dh = new_w - unpad_w, new_h - unpad_h
+    if auto:
+        dw, dh = np.mod(dw, stride), np.mod(dh, stride)
+    dw /= 2
+    dh /= 2
+
+    if (w, h) != (unpad_w, unpad_h):
+        img = cv2.resize(img, (unpad_w, unpad_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return img, r, (left, top)
+
+
+class _HostArray:
+    """Tiny tensor look-alike: supports .cpu(), .numpy(), indexing and len()"""
+
+    def __init__(self, data):
+        self._data = np.asarray(data)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self._data
+
+    def __getitem__(self, index):
+        return _HostArray(self._data[index])
+
+    def __len__(self):
+        return len(self._data)
+
+    def __float__(self):
+        return float(self._data)
+
+    def __int__(self):
+        return int(self._data)
+
+
+class OnnxBoxes:
+    """Subset of ultralytics Boxes: xyxy, conf, cls, len() and per-box iteration"""
+
+    def __init__(self, xyxy, conf, cls):
+        self.data = np.concatenate([xyxy, conf[:, None], cls[:, None]], axis=1) if len(xyxy) else \
+            np.zeros((0, 6), dtype=np.float32)
+        self.xyxy = _HostArray(xyxy)
+        self.conf = _HostArray(conf)
+        self.cls = _HostArray(cls)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        for i in range(len(self.data)):
+            row = self.data[i:i + 1]
+            yield OnnxBoxes(row[:, :4], row[:, 4], row[:, 5])
+
+
+class OnnxResult:
+    """Subset of ultralytics Results: boxes, names, orig_shape"""
+
+    def __init__(self, boxes, names, orig_shape):
+        self.boxes = boxes
+        self.names = names
+        self.orig_shape = orig_shape
+
+
+class OnnxYOLO:
+    def __init__(self, onnx_path, intra_op_threads=None):
+        """
+        YOLOv8 detector running on ONNX Runtime (CPU)
+
+        Args:
+            onnx_path: Path to the exported ONNX model
+            intra_op_threads: ONNX Runtime intra-op threads (default: cores / workers)
+        """
+        import onnxruntime as ort
+
+        self.model_path = onnx_path
+        self.backend = 'onnx'
+        self.intra_op_threads = intra_op_threads or default_intra_op_threads()
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_name = self.session.get_outputs()[0].name
+
+        # Dynamic axes are symbolic strings; static exports pin the input size
+        height, width = model_input.shape[2], model_input.shape[3]
+        self.dynamic = not (isinstance(height, int) and isinstance(width, int))
+        self.imgsz = EXPORT_IMGSZ if self.dynamic else max(height, width)
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = self._parse_names(metadata.get('names'))
+        self.stride = int(metadata.get('stride', 32))
+        if 'imgsz' in metadata:
+            self.imgsz = max(ast.literal_eval(metadata['imgsz']))
+
+    @staticmethod
+    def _parse_names(raw_names):
+        if not raw_names:
+            return {}
+        try:
+            return {int(k): v for k, v in ast.literal_eval(raw_names).items()}
+        except (ValueError, SyntaxError):
+            return {}
+
+    def __call__(self, source, conf=0.25, iou=0.7, imgsz=None, max_det=300, **kwargs):
+        """
+        Run inference on a path, BGR image array or a list of either (one batch)
+
+        Returns:
+            list[OnnxResult]
+        """
+        sources = source if isinstance(source, (list, tuple)) else [source]
+        images = [cv2.imread(str(s)) if isinstance(s, (str, Path)) else s for s in sources]
+        for src, img in zip(sources, images):
+            if img is None:
+                raise FileNotFoundError(f"Cannot read {src}")
+
+        size = imgsz or self.imgsz
+        if not self.dynamic:
+            size = self.imgsz
+
+        batch, metas = self.preprocess(images, size)
+        outputs = self.session.run([self.output_name], {self.input_name: batch})[0]
+
+        return [self.postprocess(pred, meta, img.shape[:2], conf, iou, max_det)
+                for pred, meta, img in zip(outputs, metas, images)]
+
+    def preprocess(self, images, size):
+        """Letterbox -> RGB -> CHW float32 [0, 1]; same-shape batches use minimal (rect) padding"""
+        same_shapes = len({img.shape[:2] for img in images}) == 1
+        auto = same_shapes and self.dynamic
+
+        padded = []
+        metas = []
+        for img in images:
+            boxed, ratio, pad = letterbox(img, (size, size), stride=self.stride, auto=auto)
+            padded.append(boxed)
+            metas.append((ratio, pad))
+
+        batch = np.stack(padded)[..., ::-1].transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+        return batch, metas
+
+    def postprocess(self, prediction, meta, orig_shape, conf_threshold, iou_threshold, max_det):
+        """Decode one (4 + nc, anchors) output: confidence filter, class-aware NMS, rescale"""
+        ratio, (pad_left, pad_top) = meta
+        prediction = prediction.T
+        class_scores = prediction[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_scores)), class_ids]
+
+        keep = scores > conf_threshold
+        if not np.any(keep):
+            empty = np.zeros((0,), dtype=np.float32)
+            return OnnxResult(OnnxBoxes(np.zeros((0, 4), dtype=np.float32), empty, empty),
+                              self.names, orig_shape)
+
+        boxes_xywh = prediction[keep, :4]
+        scores = scores[keep]
+        class_ids = class_ids[keep]
+
+        xyxy = np.empty_like(boxes_xywh)
+        xyxy[:, 0] = boxes_xywh[:, 0] - boxes_xywh[:, 2] / 2
+        xyxy[:, 1] = boxes_xywh[:, 1] - boxes_xywh[:, 3] / 2
+        xyxy[:, 2] = boxes_xywh[:, 0] + boxes_xywh[:, 2] / 2
+        xyxy[:, 3] = boxes_xywh[:, 1] + boxes_xywh[:, 3] / 2
+
+        # Class-aware NMS via per-class coordinate offsets (as ultralytics does)
+        offsets = class_ids[:, None].astype(np.float32) * 7680.0
+        nms_boxes = np.concatenate([xyxy[:, :2] + offsets, boxes_xywh[:, 2:]], axis=1)
+        indices = cv2.dnn.NMSBoxes(nms_boxes.tolist(), scores.tolist(), conf_threshold, iou_threshold)
+        indices = np.array(indices, dtype=int).reshape(-1)[:max_det]
+
+        xyxy = xyxy[indices]
+        xyxy[:, [0, 2]] -= pad_left
+        xyxy[:, [1, 3]] -= pad_top
+        xyxy /= ratio
+        h, w = orig_shape
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+
+        boxes = OnnxBoxes(xyxy.astype(np.float32),
+                          scores[indices].astype(np.float32),
+                          class_ids[indices].astype(np.float32))
+        return OnnxResult(boxes, self.names, orig_shape)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python onnx_backend.py <weights.pt> [--force]")
+        print("Exports the weights to ONNX next to the .pt file (cached)")
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    weights_path = sys.argv[1]
+    if not os.path.exists(weights_path):
+        print(f"Weights not found: {weights_path}")
+        return
+    onnx_path = export_onnx(weights_path, force='--force' in sys.argv)
+    print(f"ONNX model: {onnx_path}")
+
+
+if __name__ == "__main__":
+    main()
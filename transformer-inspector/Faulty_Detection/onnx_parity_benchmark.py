@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+ONNX vs PyTorch Parity Check and Latency Benchmark
+Runs the same weights through ultralytics (PyTorch) and the ONNX Runtime
+backend on a folder of images, matches the boxes and reports IoU / confidence
+agreement plus warmed-up latency. Exits non-zero when parity fails so it can
+gate a model rollout.
+"""
+
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from onnx_backend import OnnxYOLO, export_onnx, patch_torch_load
+
+
+def box_iou(a, b):
+    """IoU between two [x1, y1, x2, y2] boxes"""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def result_to_rows(result):
+    """Convert a Results-like object to an (N, 6) array [x1, y1, x2, y2, conf, cls]"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 6), dtype=np.float32)
+    xyxy = boxes.xyxy.cpu().numpy()
+    conf = boxes.conf.cpu().numpy()
+    cls = boxes.cls.cpu().numpy()
+    return np.concatenate([xyxy, conf[:, None], cls[:, None]], axis=1)
+
+
+def compare_detections(reference, candidate, iou_threshold=0.9, conf_tolerance=0.05):
+    """
+    Greedily match candidate boxes to reference boxes of the same class
+
+    Returns:
+        dict: matched, missing, extra, min_iou, max_conf_diff, passed
+    """
+    used = set()
+    ious = []
+    conf_diffs = []
+    missing = 0
+
+    for ref in reference[np.argsort(-reference[:, 4])] if len(reference) else []:
+        best_iou, best_j = 0.0, None
+        for j, cand in enumerate(candidate):
+            if j in used or int(cand[5]) != int(ref[5]):
+                continue
+            iou = box_iou(ref, cand)
+            if iou > best_iou:
+                best_iou, best_j = iou, j
+        if best_j is None or best_iou < iou_threshold:
+            missing += 1
+            continue
+        used.add(best_j)
+        ious.append(best_iou)
+        conf_diffs.append(abs(float(ref[4]) - float(candidate[best_j][4])))
+
+    extra = len(candidate) - len(used)
+    max_conf_diff = max(conf_diffs) if conf_diffs else 0.0
+    return {
+        'matched': len(ious),
+        'missing': missing,
+        'extra': extra,
+        'min_iou': min(ious) if ious else None,
+        'max_conf_diff': max_conf_diff,
+        'passed': missing == 0 and extra == 0 and max_conf_diff <= conf_tolerance
+    }
+
+
+def time_model(model, image_path, conf, imgsz, warmup, runs):
+    """Warm up, then time repeated single-image inference (milliseconds)"""
+    for _ in range(warmup):
+        model(image_path, conf=conf, imgsz=imgsz, verbose=False)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model(image_path, conf=conf, imgsz=imgsz, verbose=False)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return timings
+
+
+def summarize(timings):
+    arr = np.array(timings)
+    return {
+        'mean': float(arr.mean()),
+        'p50': float(np.percentile(arr, 50)),
+        'p95': float(np.percentile(arr, 95))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ONNX Runtime vs PyTorch parity check and latency benchmark')
+    parser.add_argument('weights', help='Path to yolov8p2*.pt weights')
+    parser.add_argument('--images', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples'),
+                        help='Folder of test images (default: samples/)')
+    parser.add_argument('--conf', type=float, default=0.25, help='Confidence threshold')
+    parser.add_argument('--imgsz', type=int, default=640, help='Inference image size')
+    parser.add_argument('--iou-threshold', type=float, default=0.9, help='Minimum IoU for a matched box')
+    parser.add_argument('--conf-tolerance', type=float, default=0.05, help='Maximum confidence difference')
+    parser.add_argument('--warmup', type=int, default=3, help='Warm-up runs per image')
+    parser.add_argument('--runs', type=int, default=10, help='Timed runs per image')
+    parser.add_argument('--threads', type=int, default=None, help='ONNX Runtime intra-op threads')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.weights):
+        print(f"❌ Weights not found: {args.weights}")
+        sys.exit(2)
+
+    image_files = sorted(p for p in Path(args.images).iterdir()
+                         if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.bmp'))
+    if not image_files:
+        print(f"❌ No images found in {args.images}")
+        sys.exit(2)
+
+    patch_torch_load()
+    from ultralytics import YOLO
+
+    print("🔬 ONNX Runtime vs PyTorch parity")
+    print("=" * 50)
+    onnx_path = export_onnx(args.weights, imgsz=args.imgsz, torch_setup=patch_torch_load)
+    torch_model = YOLO(args.weights)
+    onnx_model = OnnxYOLO(onnx_path, intra_op_threads=args.threads)
+    print(f"📦 PyTorch: {args.weights}")
+    print(f"📦 ONNX:    {onnx_path} ({onnx_model.intra_op_threads} intra-op threads)")
+
+    all_passed = True
+    torch_times = []
+    onnx_times = []
+
+    for image_path in image_files:
+        ref = result_to_rows(torch_model(str(image_path), conf=args.conf, imgsz=args.imgsz, verbose=False)[0])
+        cand = result_to_rows(onnx_model(str(image_path), conf=args.conf, imgsz=args.imgsz)[0])
+        parity = compare_detections(ref, cand, args.iou_threshold, args.conf_tolerance)
+        all_passed = all_passed and parity['passed']
+
+        status = "✅" if parity['passed'] else "❌"
+        min_iou = f"{parity['min_iou']:.3f}" if parity['min_iou'] is not None else "-"
+        print(f"{status} {image_path.name}: torch={len(ref)} onnx={len(cand)} "
+              f"matched={parity['matched']} missing={parity['missing']} extra={parity['extra']} "
+              f"min_iou={min_iou} max_conf_diff={parity['max_conf_diff']:.4f}")
+
+        torch_times.extend(time_model(torch_model, str(image_path), args.conf, args.imgsz, args.warmup, args.runs))
+        onnx_times.extend(time_model(onnx_model, str(image_path), args.conf, args.imgsz, args.warmup, args.runs))
+
+    torch_stats = summarize(torch_times)
+    onnx_stats = summarize(onnx_times)
+
+    print("\n⏱️  Latency (ms, warmed up)")
+    print(f"{'Backend':<10} {'mean':>9} {'p50':>9} {'p95':>9}")
+    for name, stats in (('pytorch', torch_stats), ('onnx', onnx_stats)):
+        print(f"{name:<10} {stats['mean']:>9.1f} {stats['p50']:>9.1f} {stats['p95']:>9.1f}")
+    if onnx_stats['p50'] > 0:
+        print(f"Speed-up (p50): {torch_stats['p50'] / onnx_stats['p50']:.2f}x")
+
+    if not all_passed:
+        print("\n❌ Parity check FAILED")
+        sys.exit(1)
+    print("\n✅ Parity check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Similarity + Detection Pipeline Benchmark
+Times every SwiftMatcher scorer, the detector, change-region extraction, region
+comparison, the full analyze_image_pair pipeline and (optionally) /api/detect on
+synthetic thermal pairs at several resolutions. Each case is warmed up, repeated and
+reported as p50/p95/p99 with the process peak RSS; stages timed inside a case
+(pipeline_metrics) are reported as sub-cases such as `system.analyze/yolo_forward`.
+Results are written as JSON so two commits can be compared with --compare.
+
+Runs offline on CPU: without weights a randomly initialised yolov8n is built from
+its config (yolov8n.yaml), which exercises the same code paths at realistic cost.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from onnx_backend import patch_torch_load
+from pipeline_metrics import start_stage_timings, stop_stage_timings
+from synthetic_thermal import PAIR_VARIANTS, make_variant_pairs, parse_resolution, write_pair
+
+RANDOM_MODEL_CONFIG = 'yolov8n.yaml'
+# Cases that run the detector (the model is only loaded when one of them is selected)
+MODEL_CASES = ('detector.', 'system.analyze', 'api.')
+ML_SERVICE_DIR = Path(__file__).resolve().parent.parent / 'ml-service'
+
+
+def summarize(samples_ms):
+    arr = np.array(samples_ms)
+    return {
+        'n': int(arr.size),
+        'mean_ms': float(arr.mean()),
+        'min_ms': float(arr.min()),
+        'p50_ms': float(np.percentile(arr, 50)),
+        'p95_ms': float(np.percentile(arr, 95)),
+        'p99_ms': float(np.percentile(arr, 99)),
+        'max_ms': float(arr.max())
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Benchmark:
+    """Warm-up + timed repetitions per (case, resolution); stage timings become sub-cases"""
+
+    def __init__(self, warmup, runs):
+        self.warmup = warmup
+        self.runs = runs
+        self.samples = {}
+        self.rss = {}
+
+    def _add(self, case, resolution, seconds):
+        self.samples.setdefault((case, resolution), []).append(seconds * 1000.0)
+
+    def run(self, case, resolution, fn):
+        for _ in range(self.warmup):
+            fn()
+        for _ in range(self.runs):
+            timings = start_stage_timings()
+            start = time.perf_counter()
+            try:
+                fn()
+            finally:
+                elapsed = time.perf_counter() - start
+                stop_stage_timings()
+            self._add(case, resolution, elapsed)
+            for name, seconds in timings.items():
+                self._add(f"{case}/{name}", resolution, seconds)
+        self.rss[case, resolution] = peak_rss_mb()
+
+    def results(self):
+        rows = []
+        for (case, resolution), samples in self.samples.items():
+            parent = case.split('/')[0]
+            rows.append(dict(case=case, resolution=resolution, **summarize(samples),
+                             peak_rss_mb=round(self.rss.get((parent, resolution), peak_rss_mb()), 1)))
+        return rows
+
+
+def load_provider(weights, backend, random_model):
+    """
+    Model provider for the run: the given (or newest yolov8p2) weights, else a
+    randomly initialised model built from RANDOM_MODEL_CONFIG without any download
+
+    Returns:
+        tuple: (ModelProvider, description for the results metadata)
+    """
+    from model_provider import ModelProvider, resolve_model_path
+
+    if not random_model:
+        try:
+            weights = weights or resolve_model_path()
+        except FileNotFoundError:
+            weights = None
+    if weights and not random_model:
+        if not os.path.exists(weights):
+            print(f"❌ Weights not found: {weights}")
+            sys.exit(2)
+        provider = ModelProvider(model_path=weights, backend=backend, torch_setup=patch_torch_load)
+        provider.get()
+        return provider, provider.info()
+
+    patch_torch_load()
+    from ultralytics import YOLO
+    provider = ModelProvider()
+    provider.install(YOLO(RANDOM_MODEL_CONFIG), f"random:{RANDOM_MODEL_CONFIG}")
+    return provider, provider.info()
+
+
+def load_service_client(provider):
+    """Flask test client of ml-service/app.py serving the benchmark's model"""
+    os.environ.setdefault('ML_STARTUP_MODE', 'lazy')
+    sys.path.insert(0, str(ML_SERVICE_DIR))
+    import app as service
+    service.model_provider.install(provider.get(), provider.model_path)
+    return service.app.test_client()
+
+
+def selected(case, prefixes):
+    return not prefixes or any(case.startswith(prefix) for prefix in prefixes)
+
+
+def needs_model(prefixes, api):
+    cases = [case for case in MODEL_CASES if api or not case.startswith('api.')]
+    return not prefixes or any(case.startswith(prefix) or prefix.startswith(case)
+                               for case in cases for prefix in prefixes)
+
+
+def regions_for(pair, width, height):
+    """Detection-sized boxes: the injected hotspots, else the four image quadrants"""
+    if pair.hotspots:
+        return [list(box) for box in pair.hotspots]
+    w, h = width // 2, height // 2
+    return [[0, 0, w, h], [w, 0, width, h], [0, h, w, height], [w, h, width, height]]
+
+
+def benchmark_resolution(bench, resolution, pairs, work_dir, provider, client, args):
+    from swift_matcher import SwiftMatcher
+    from similarity_yolo_system import SimilarityBasedYOLOSystem
+
+    width, height = resolution
+    label = f"{width}x{height}"
+    matcher = SwiftMatcher(threshold=0.5, verbose=False)
+    system = SimilarityBasedYOLOSystem(similarity_threshold=0.5, change_threshold=0.2,
+                                       model_path=provider.model_path if provider else None,
+                                       model_provider=provider, verbose=False)
+    # Same service configuration as ml-service/app.py: no GUI, no per-request result files
+    system.create_comparison_visualization = lambda *a, **k: None
+    detector = system.yolo_detector
+    detector.save_results = False
+
+    for name, pair in pairs.items():
+        ref_path, target_path = write_pair(pair, work_dir, f"{label}_{name}")
+        img1 = matcher.read_and_preprocess(ref_path)
+        img2 = matcher.read_and_preprocess(target_path)
+        kp1, desc1 = matcher.extract_features(img1)
+        kp2, desc2 = matcher.extract_features(img2)
+        regions = regions_for(pair, width, height)
+        detections = [{'bbox': box, 'class_name': 'Faulty', 'confidence': 0.9} for box in regions]
+
+        cases = {
+            'matcher.decode': lambda: (matcher.read_and_preprocess(ref_path),
+                                       matcher.read_and_preprocess(target_path)),
+            'matcher.histogram': lambda: matcher.histogram_comparison(img1, img2),
+            'matcher.template': lambda: matcher.template_matching(img1, img2),
+            'matcher.phase': lambda: matcher.phase_correlation(img1, img2),
+            'matcher.features': lambda: (matcher.extract_features(img1), matcher.extract_features(img2),
+                                         matcher.feature_matching(desc1, desc2, kp1, kp2)),
+            'matcher.structural': lambda: matcher.structural_similarity(img1, img2),
+            'matcher.augmentation': lambda: matcher.augmentation_robust_compare(img1, img2),
+            'matcher.swift_compare': lambda: matcher.swift_compare(ref_path, target_path, verbose=False),
+            'detector.detect': lambda: detector.detect(target_path),
+            'detector.detect_regions': lambda: detector.detect_regions(target_path, regions),
+            'system.change_regions': lambda: system.extract_change_regions(ref_path, target_path),
+            'system.region_compare': lambda: system.compare_detected_regions_with_reference(
+                ref_path, target_path, detections, verbose=False),
+            'system.analyze': lambda: system.analyze_image_pair(ref_path, target_path, verbose=False,
+                                                                change_guided=False),
+            'system.analyze_change_guided': lambda: system.analyze_image_pair(
+                ref_path, target_path, verbose=False, change_guided=True)
+        }
+        if client is not None:
+            cases['api.detect'] = lambda: _post_detect(client, target_path, ref_path)
+            cases['api.detect_single'] = lambda: _post_detect(client, target_path, None)
+
+        for case, fn in cases.items():
+            if not selected(case, args.cases):
+                continue
+            bench.run(case, label, fn)
+        print(f"   {label} {name}: done (peak RSS {peak_rss_mb():.0f} MB)")
+
+
+def _post_detect(client, target_path, ref_path):
+    payload = {'inspection_image_path': target_path, 'confidence_threshold': 0.25}
+    if ref_path:
+        payload['baseline_image_path'] = ref_path
+    response = client.post('/api/detect', json=payload)
+    if response.status_code != 200:
+        raise RuntimeError(f"/api/detect returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare_results(current, baseline, max_regression):
+    """
+    Print p50/p95 changes for cases present in both runs
+
+    Returns:
+        list: Cases whose p50 regressed by more than max_regression (fraction)
+    """
+    previous = {(row['case'], row['resolution']): row for row in baseline['results']}
+    regressions = []
+    print(f"\n📊 Compared with {baseline['meta'].get('git_revision') or 'baseline'} "
+          f"(fail above +{max_regression:.0%} p50)")
+    print(f"{'case':<46} {'res':>9} {'p50 old':>9} {'p50 new':>9} {'Δp50':>8} {'Δp95':>8}")
+    for row in current:
+        old = previous.get((row['case'], row['resolution']))
+        if old is None or old['p50_ms'] <= 0:
+            continue
+        d50 = row['p50_ms'] / old['p50_ms'] - 1
+        d95 = row['p95_ms'] / old['p95_ms'] - 1 if old['p95_ms'] > 0 else 0.0
+        flag = ''
+        if d50 > max_regression and '/' not in row['case']:
+            regressions.append(f"{row['case']}@{row['resolution']}")
+            flag = ' ❌'
+        print(f"{row['case']:<46} {row['resolution']:>9} {old['p50_ms']:>9.2f} {row['p50_ms']:>9.2f} "
+              f"{d50:>+8.1%} {d95:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the similarity + detection pipeline on synthetic thermal pairs')
+    parser.add_argument('--resolutions', default='320x240,640x480,1280x960',
+                        help='Comma-separated WIDTHxHEIGHT list')
+    parser.add_argument('--variants', default=','.join(PAIR_VARIANTS),
+                        help=f"Pair variants ({', '.join(PAIR_VARIANTS)})")
+    parser.add_argument('--cases', default=None,
+                        help='Only run cases starting with these comma-separated prefixes (e.g. matcher,system.analyze)')
+    parser.add_argument('--warmup', type=int, default=2, help='Warm-up calls per case')
+    parser.add_argument('--runs', type=int, default=10, help='Timed calls per case and pair')
+    parser.add_argument('--seed', type=int, default=0, help='Scene seed')
+    parser.add_argument('--weights', default=None, help='Model weights (default: newest yolov8p2, else random init)')
+    parser.add_argument('--random-model', action='store_true',
+                        help=f'Always use a randomly initialised {RANDOM_MODEL_CONFIG} (comparable across machines)')
+    parser.add_argument('--backend', default=None, help='Inference backend for real weights (auto, onnx, onnx-int8, torch)')
+    parser.add_argument('--threads', type=int, default=None, help='Pin OpenCV / PyTorch thread counts')
+    parser.add_argument('--api', action='store_true',
+                        help='Also time /api/detect through the Flask test client (starts the service in-process)')
+    parser.add_argument('--output', default=None, help='Write results as JSON to this file')
+    parser.add_argument('--compare', default=None, help='Baseline results JSON to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='Fail when a case p50 is this fraction slower than the baseline')
+    args = parser.parse_args()
+    args.cases = args.cases.split(',') if args.cases else None
+
+    if args.threads:
+        os.environ['OMP_NUM_THREADS'] = str(args.threads)
+        cv2.setNumThreads(args.threads)
+
+    resolutions = [parse_resolution(r) for r in args.resolutions.split(',')]
+    variants = args.variants.split(',')
+    unknown = [v for v in variants if v not in PAIR_VARIANTS]
+    if unknown:
+        print(f"❌ Unknown variants: {', '.join(unknown)}")
+        sys.exit(2)
+
+    print("⏱️  Pipeline benchmark")
+    print("=" * 50)
+    provider, model_info, client = None, None, None
+    if needs_model(args.cases, args.api):
+        provider, model_info = load_provider(args.weights, args.backend, args.random_model)
+        if args.threads:
+            import torch
+            torch.set_num_threads(args.threads)
+        print(f"📦 Model: {model_info['version_id']} (backend: {model_info['backend']})")
+        if args.api:
+            client = load_service_client(provider)
+
+    bench = Benchmark(args.warmup, args.runs)
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix='pipeline_bench_') as work_dir:
+        for resolution in resolutions:
+            pairs = make_variant_pairs(resolution, seed=args.seed, variants=variants)
+            benchmark_resolution(bench, resolution, pairs, work_dir, provider, client, args)
+
+    results = bench.results()
+    print(f"\n{'case':<46} {'res':>9} {'n':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'RSS MB':>8}")
+    for row in results:
+        print(f"{row['case']:<46} {row['resolution']:>9} {row['n']:>5} {row['p50_ms']:>9.2f} "
+              f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['peak_rss_mb']:>8.0f}")
+    print(f"\nTotal benchmark time: {time.perf_counter() - started:.1f}s, peak RSS {peak_rss_mb():.0f} MB")
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'model': model_info,
+            'resolutions': args.resolutions,
+            'variants': variants,
+            'warmup': args.warmup,
+            'runs': args.runs,
+            'seed': args.seed,
+            'threads': args.threads,
+            'peak_rss_mb': round(peak_rss_mb(), 1)
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results saved: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.max_regression)
+        if regressions:
+            print(f"\n❌ Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Pipeline Metrics - Stage Latency Histograms, Path Counters and Gauges
+In-process instrumentation shared by the matcher, the detector, the similarity
+system and the Flask service. Metrics live in one registry and render in the
+Prometheus text exposition format (version 0.0.4), so /metrics needs no client
+library. Every metric is thread-safe; observing costs one lock and a bisect.
+Stage timings can also be collected per request for structured request logs, and
+each stage is a span of the request's trace (tracing.py) when one is active.
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from tracing import span
+
+# Seconds; pipeline stages range from sub-millisecond scorers to multi-second CPU forwards
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, self._snapshot(value)) for key, value in self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _snapshot(self, value):
+        return value
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonic count per label set"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Point-in-time value per label set"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        key = self._key(labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+
+class Histogram(_Metric):
+    """Bucketed distribution per label set (cumulative buckets on render)"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the with-block (also when it raises)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _snapshot(self, value):
+        return value[0][:], value[1], value[2]
+
+    def _samples(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            labels = _label_text(self.labelnames, key, [('le', _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _label_text(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Named metrics; asking twice for the same name returns the same metric"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} already registered as a different {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """All metrics in Prometheus text format"""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'ml_stage_duration_seconds', 'Wall-clock duration of one pipeline stage', ('stage',))
+
+
+_local = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a pipeline stage: `with stage('yolo_forward'): ...`
+
+    The duration goes to the stage histogram and, between start_stage_timings() and
+    stop_stage_timings() on the same thread, into that request's timings dict; inside
+    a sampled trace the stage is also recorded as a span.
+    """
+    start = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def start_stage_timings():
+    """Collect this thread's stage durations (seconds, summed per stage) into the returned dict"""
+    _local.timings = {}
+    return _local.timings
+
+
+def stop_stage_timings():
+    _local.timings = None
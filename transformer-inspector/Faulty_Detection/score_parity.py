@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Score Parity - Golden Outputs for the Similarity Scorers
+Recomputes every SwiftMatcher score, the weighted confidence, change-region extraction
+and the per-region differences on a fixed corpus (the sample images plus seeded
+synthetic pairs) and compares them with a committed golden file. Each metric is
+reported with its absolute and relative drift; floats pass within a per-metric
+tolerance, booleans and counts must match exactly.
+
+Run it after any optimization of the scoring code (vectorisation, downscaling,
+caching, a different OpenCV build): exit status 1 means a score moved.
+    python score_parity.py                # check against golden/score_parity.json
+    python score_parity.py --update       # re-record after an intended change
+"""
+
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from synthetic_thermal import make_variant_pairs, write_pair
+
+BASE_DIR = Path(__file__).resolve().parent
+SAMPLES_DIR = BASE_DIR / 'samples'
+GOLDEN_PATH = BASE_DIR / 'golden' / 'score_parity.json'
+
+# Same thresholds as the service (ml-service/app.py)
+SIMILARITY_THRESHOLD = 0.5
+CHANGE_THRESHOLD = 0.2
+
+# (reference, target) under samples/
+SAMPLE_PAIRS = {
+    'T1_faulty_vs_normal': ('T1_normal_001.jpg', 'T1_faulty_001 (1).jpg'),
+    'T7_faulty_001_vs_002': ('T7_faulty_001.jpg', 'T7_faulty_002.jpg'),
+    'T1_vs_T7': ('T1_normal_001.jpg', 'T7_faulty_001.jpg'),
+    'T7_self': ('T7_faulty_001.jpg', 'T7_faulty_001.jpg')
+}
+SYNTHETIC_RESOLUTIONS = ((320, 240), (640, 480))
+SYNTHETIC_SEED = 0
+
+# metric suffix -> (absolute, relative); a float passes if either bound holds
+DEFAULT_TOLERANCE = (1e-4, 1e-3)
+TOLERANCES = {
+    'features': (1e-3, 1e-2),  # Ratio-test match counts can shift by one with a different matcher build
+    'changed_fraction': (1e-3, 1e-2)
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=BASE_DIR, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def quadrants(width, height):
+    w, h = width // 2, height // 2
+    return [[0, 0, w, h], [w, 0, width, h], [0, h, w, height], [w, h, width, height]]
+
+
+def corpus(work_dir):
+    """
+    Parity cases in a fixed order
+
+    Returns:
+        list: (case name, reference path, target path, region boxes)
+    """
+    cases = []
+    for name, (ref, target) in SAMPLE_PAIRS.items():
+        ref_path, target_path = SAMPLES_DIR / ref, SAMPLES_DIR / target
+        if not (ref_path.exists() and target_path.exists()):
+            continue
+        height, width = cv2.imread(str(target_path)).shape[:2]
+        cases.append((f"samples/{name}", str(ref_path), str(target_path), quadrants(width, height)))
+    for width, height in SYNTHETIC_RESOLUTIONS:
+        label = f"{width}x{height}"
+        for variant, pair in make_variant_pairs((width, height), seed=SYNTHETIC_SEED).items():
+            ref_path, target_path = write_pair(pair, work_dir, f"{label}_{variant}")
+            regions = [list(box) for box in pair.hotspots] or quadrants(width, height)
+            cases.append((f"synthetic/{label}/{variant}", ref_path, target_path, regions))
+    return cases
+
+
+def score_case(system, ref_path, target_path, regions):
+    """Flat {metric: value} for one pair; floats as Python floats, flags as bools"""
+    matcher = system.matcher
+    is_similar, confidence, _, _, scores, _ = matcher.swift_compare(ref_path, target_path, verbose=False)
+    metrics = {f"matcher.{method}": float(score) for method, score in scores.items()}
+    metrics['matcher.confidence'] = float(confidence)
+    metrics['matcher.is_similar'] = bool(is_similar)
+
+    change = system.extract_change_regions(ref_path, target_path)
+    if change is not None:
+        metrics['change.changed_fraction'] = float(change['changed_fraction'])
+        metrics['change.region_count'] = len(change['regions'])
+        metrics['change.use_roi'] = bool(change['use_roi'])
+
+    detections = [{'bbox': box, 'class_name': 'Faulty', 'confidence': 0.9} for box in regions]
+    comparison = system.compare_detected_regions_with_reference(ref_path, target_path, detections, verbose=False)
+    metrics['regions.change_magnitude'] = float(comparison.get('change_magnitude', 0.0))
+    metrics['regions.significant_change'] = bool(comparison.get('significant_change', False))
+    for i, region in enumerate(comparison.get('region_comparisons', [])):
+        metrics[f"regions.{i}.combined_difference"] = float(region['combined_difference'])
+    return metrics
+
+
+def compute_scores():
+    from similarity_yolo_system import SimilarityBasedYOLOSystem
+
+    # The detector is never called, so no model is loaded
+    system = SimilarityBasedYOLOSystem(similarity_threshold=SIMILARITY_THRESHOLD,
+                                       change_threshold=CHANGE_THRESHOLD, verbose=False)
+    with tempfile.TemporaryDirectory(prefix='score_parity_') as work_dir:
+        return {name: score_case(system, ref_path, target_path, regions)
+                for name, ref_path, target_path, regions in corpus(work_dir)}
+
+
+def tolerance_for(metric, overrides=None):
+    """(absolute, relative) for a metric; overrides and TOLERANCES match on the last name part"""
+    suffix = metric.rsplit('.', 1)[-1]
+    for table in (overrides or {}, TOLERANCES):
+        for key in (metric, suffix, '*'):
+            if key in table:
+                return table[key]
+    return DEFAULT_TOLERANCE
+
+
+def check_parity(golden, current, overrides=None):
+    """
+    Compare current scores with the golden ones
+
+    Args:
+        golden: {case: {metric: value}} from the golden file
+        current: {case: {metric: value}} from compute_scores()
+        overrides: {metric or suffix or '*': (absolute, relative)}
+
+    Returns:
+        list: One row per (case, metric) - golden, current, abs/rel drift, ok
+    """
+    rows = []
+    for case in sorted(set(golden) | set(current)):
+        old, new = golden.get(case), current.get(case)
+        if old is None or new is None:
+            rows.append({'case': case, 'metric': '*', 'golden': old is not None, 'current': new is not None,
+                         'abs': None, 'rel': None, 'ok': False,
+                         'reason': 'case missing from golden' if old is None else 'case missing from run'})
+            continue
+        for metric in sorted(set(old) | set(new)):
+            a, b = old.get(metric), new.get(metric)
+            row = {'case': case, 'metric': metric, 'golden': a, 'current': b, 'abs': None, 'rel': None}
+            if a is None or b is None:
+                row.update(ok=False, reason='metric missing from golden' if a is None else 'metric missing from run')
+            elif isinstance(a, bool) or isinstance(b, bool) or isinstance(a, int) and isinstance(b, int):
+                row.update(ok=a == b, abs=abs(float(a) - float(b)))
+            else:
+                abs_tol, rel_tol = tolerance_for(metric, overrides)
+                drift = abs(b - a)
+                rel = drift / abs(a) if a else (0.0 if drift == 0 else float('inf'))
+                row.update(abs=drift, rel=rel, ok=drift <= abs_tol or rel <= rel_tol)
+            rows.append(row)
+    return rows
+
+
+def max_drift(rows):
+    """Largest absolute and relative drift per metric (case-independent name, e.g. regions.combined_difference)"""
+    summary = {}
+    for row in rows:
+        if row['abs'] is None:
+            continue
+        parts = row['metric'].split('.')
+        metric = '.'.join(p for p in parts if not p.isdigit())
+        entry = summary.setdefault(metric, {'abs': 0.0, 'rel': 0.0, 'failed': 0, 'exact': row['rel'] is None})
+        entry['abs'] = max(entry['abs'], row['abs'])
+        if row['rel'] is not None:
+            entry['rel'] = max(entry['rel'], row['rel'])
+        entry['failed'] += not row['ok']
+    return summary
+
+
+def parse_tolerance(text):
+    """'features=1e-3' or 'features=1e-3:1e-2' -> ('features', (abs, rel))"""
+    metric, _, bounds = text.partition('=')
+    if not metric or not bounds:
+        raise argparse.ArgumentTypeError(f"expected METRIC=ABS[:REL], got {text!r}")
+    abs_tol, _, rel_tol = bounds.partition(':')
+    try:
+        return metric, (float(abs_tol), float(rel_tol) if rel_tol else 0.0)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected METRIC=ABS[:REL], got {text!r}")
+
+
+def environment():
+    return {
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__
+    }
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return f"{value:.6f}"
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check similarity scores against the golden outputs')
+    parser.add_argument('--golden', default=str(GOLDEN_PATH), help='Golden file')
+    parser.add_argument('--update', action='store_true', help='Record the current scores as the golden file')
+    parser.add_argument('--tol', action='append', type=parse_tolerance, default=[],
+                        help="Tolerance override METRIC=ABS[:REL] (METRIC: full name, last part or '*'); repeatable")
+    parser.add_argument('--json', default=None, help='Also write the full drift report here')
+    parser.add_argument('--all', action='store_true', help='List every metric, not only failures')
+    args = parser.parse_args()
+
+    current = compute_scores()
+
+    if args.update:
+        os.makedirs(os.path.dirname(os.path.abspath(args.golden)), exist_ok=True)
+        with open(args.golden, 'w') as f:
+            json.dump({'meta': dict(environment(), created_at=datetime.now().isoformat()),
+                       'cases': current}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"💾 Golden scores for {len(current)} cases saved: {args.golden}")
+        return
+
+    with open(args.golden, 'r') as f:
+        golden = json.load(f)
+    rows = check_parity(golden['cases'], current, dict(args.tol))
+    failures = [row for row in rows if not row['ok']]
+
+    meta, env = golden.get('meta', {}), environment()
+    print(f"🔎 Score parity: {len(current)} cases, {len(rows)} metrics vs {meta.get('git_revision') or args.golden}")
+    for key in ('opencv', 'numpy'):
+        if meta.get(key) and meta[key] != env[key]:
+            print(f"⚠️  {key} {env[key]} differs from the golden run ({meta[key]})")
+
+    listed = rows if args.all else failures
+    if listed:
+        print(f"\n{'case':<40} {'metric':<34} {'golden':>10} {'current':>10} {'abs':>9} {'rel':>9}")
+        for row in listed:
+            if row['metric'] == '*':
+                print(f"{row['case']:<40} {'*':<34} {row['reason']}")
+                continue
+            abs_text = '-' if row['abs'] is None else f"{row['abs']:.2e}"
+            rel_text = '-' if row['rel'] is None else f"{row['rel']:.2e}"
+            print(f"{row['case']:<40} {row['metric']:<34} {str(_fmt(row['golden'])):>10} "
+                  f"{str(_fmt(row['current'])):>10} {abs_text:>9} {rel_text:>9}{'' if row['ok'] else ' ❌'}")
+
+    summary = max_drift(rows)
+    print(f"\n{'metric':<34} {'max abs':>9} {'max rel':>9} {'tol abs':>9} {'tol rel':>9} {'failed':>6}")
+    for metric, entry in sorted(summary.items()):
+        if entry['exact']:
+            tol_text = f"{'exact':>9} {'':>9}"
+        else:
+            abs_tol, rel_tol = tolerance_for(metric, dict(args.tol))
+            tol_text = f"{abs_tol:>9.0e} {rel_tol:>9.0e}"
+        print(f"{metric:<34} {entry['abs']:>9.2e} {entry['rel']:>9.2e} {tol_text} {entry['failed']:>6}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'meta': env, 'golden_meta': meta, 'summary': summary, 'rows': rows}, f, indent=2)
+        print(f"💾 Report saved: {args.json}")
+
+    if failures:
+        print(f"\n❌ {len(failures)} metric(s) drifted beyond tolerance")
+        sys.exit(1)
+    print("\n✅ Scores match the golden outputs")
+
+
+if __name__ == "__main__":
+    main()
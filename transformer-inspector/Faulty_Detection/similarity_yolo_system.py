@@ -12,6 +12,7 @@ import sys
 import cv2
 import numpy as np
 import json
+import logging
 from pathlib import Path
 import time
 
@@ -21,12 +22,20 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from swift_matcher import SwiftMatcher
 from clean_thermal_detector import CleanThermalDetector
+from change_regions import ChangeRegionExtractor
+from image_source import image_name, load_image
+from pipeline_metrics import stage
+
+logger = logging.getLogger(__name__)
 
 class SimilarityBasedYOLOSystem:
     def __init__(self, 
                  similarity_threshold=0.5,
                  change_threshold=0.2,
-                 model_path=None):
+                 model_path=None,
+                 change_guided=False,
+                 model_provider=None,
+                 verbose=True):
         """
         Integrated system: Similarity checking + YOLO inference + Change Analysis
         
@@ -34,41 +43,64 @@ class SimilarityBasedYOLOSystem:
             similarity_threshold: Minimum similarity to consider images as same scene
             change_threshold: Minimum change ratio to trigger visualization (0.0-1.0)
             model_path: Path to YOLO model
+            change_guided: Run YOLO only on regions that differ from the baseline
+                           when both images show the same scene
+            model_provider: Shared ModelProvider so the detector serves the same model instance
+            verbose: Print banners and reports (also for the matcher and detector); False is
+                     the quiet mode for services - nothing goes to stdout, errors go to the logger
         """
+        self.verbose = verbose
         self.similarity_threshold = similarity_threshold
         self.confidence_threshold = 0.3  # Fixed threshold for HIGH/LOW classification
         self.change_threshold = change_threshold
+        self.change_guided = change_guided
+        self.change_extractor = ChangeRegionExtractor()
         
         # Set default model path if none provided
         if model_path is None:
             model_path = "/Users/jaliya/Desktop/Jaliya/Semester 7/Software/model/yolov8p2.pt"
         
         # Initialize components
-        self.matcher = SwiftMatcher(threshold=similarity_threshold)
+        self.matcher = SwiftMatcher(threshold=similarity_threshold, verbose=verbose)
         # Initialize YOLO detector with very low threshold to capture ALL detections
         self.yolo_detector = CleanThermalDetector(
             model_path=model_path,
-            confidence_threshold=0.01  # Fixed low threshold to show all detections
+            confidence_threshold=0.01,  # Fixed low threshold to show all detections
+            model_provider=model_provider,
+            verbose=verbose
         )
         
-        print(f"Similarity-Based YOLO System Initialized")
-        print(f"   Similarity threshold: {similarity_threshold:.2f}")
-        print(f"   YOLO detection: Showing ALL detections (threshold: 0.01)")
-        print(f"   Classification: HIGH/LOW split at 0.30 confidence")
-        print(f"   Change threshold: {change_threshold:.2f} (for visualization)")
+        if verbose:
+            print(f"Similarity-Based YOLO System Initialized")
+            print(f"   Similarity threshold: {similarity_threshold:.2f}")
+            print(f"   YOLO detection: Showing ALL detections (threshold: 0.01)")
+            print(f"   Classification: HIGH/LOW split at 0.30 confidence")
+            print(f"   Change threshold: {change_threshold:.2f} (for visualization)")
+            print(f"   Change-guided ROI inference: {'ON' if change_guided else 'OFF'}")
     
-    def analyze_image_pair(self, reference_img_path, target_img_path, verbose=True):
+    def analyze_image_pair(self, reference_img_path, target_img_path, verbose=None, change_guided=None):
         """
         Main analysis pipeline:
         1. Check similarity
-        2. If similar, run YOLO on target image
+        2. If similar, run YOLO on target image (only on changed regions in change-guided mode)
         3. Compare and classify regions
+        
+        Args:
+            reference_img_path, target_img_path: Image paths or in-memory images
+                (image_source.EncodedImage for bytes a service received)
+            verbose: Print the step-by-step report (None = the system's default)
+            change_guided: Override the instance change-guided setting for this call
         """
+        if verbose is None:
+            verbose = self.verbose
+        if change_guided is None:
+            change_guided = self.change_guided
+
         if verbose:
             print(f"\nSIMILARITY-BASED YOLO ANALYSIS")
             print(f"=" * 60)
-            print(f"Reference Image: {Path(reference_img_path).name}")
-            print(f"Target Image: {Path(target_img_path).name}")
+            print(f"Reference Image: {image_name(reference_img_path)}")
+            print(f"Target Image: {image_name(target_img_path)}")
         
         results = {
             'reference_image': reference_img_path,
@@ -106,7 +138,7 @@ class SimilarityBasedYOLOSystem:
                 print(f"Result: {status} (confidence: {confidence:.1%})")
             
         except Exception as e:
-            print(f" Similarity analysis failed: {e}")
+            logger.warning("Similarity analysis failed: %s", e)
             results['similarity_analysis']['error'] = str(e)
             return results
         
@@ -119,10 +151,36 @@ class SimilarityBasedYOLOSystem:
         
         yolo_start = time.time()
         
-        # Run YOLO only on target image
-        if verbose:
-            print(f"Running YOLO on target image (showing ALL detections)...")
-        target_img, target_detections = self.yolo_detector.detect(target_img_path)
+        # Change-first mode: same scene -> only look where the frame differs from baseline
+        detection_mode = 'full_frame'
+        change_info = None
+        if change_guided and results['similarity_analysis']['is_similar']:
+            change_start = time.time()
+            with stage('change_regions'):
+                change_info = self.extract_change_regions(reference_img_path, target_img_path)
+            results['processing_time']['change_regions'] = time.time() - change_start
+            if change_info is not None and change_info['use_roi']:
+                detection_mode = 'change_guided'
+            if verbose and change_info is not None:
+                print(f"Change regions: {len(change_info['regions'])} "
+                      f"(changed fraction: {change_info['changed_fraction']:.3f}, "
+                      f"alignment: {change_info['alignment']}, ROI: {change_info['use_roi']})")
+        
+        if detection_mode == 'change_guided':
+            if change_info['regions']:
+                if verbose:
+                    print(f"Running YOLO on {len(change_info['regions'])} change regions only...")
+                target_img, target_detections = self.yolo_detector.detect_regions(
+                    target_img_path, change_info['regions']
+                )
+            else:
+                # Nothing differs from the baseline - no detector pass needed
+                target_img, target_detections = None, []
+        else:
+            # Run YOLO only on target image
+            if verbose:
+                print(f"Running YOLO on target image (showing ALL detections)...")
+            target_img, target_detections = self.yolo_detector.detect(target_img_path)
         
         # Show all detections with their confidence levels
         if verbose and target_detections:
@@ -139,8 +197,13 @@ class SimilarityBasedYOLOSystem:
             'high_confidence_count': len([d for d in target_detections if d['confidence'] >= self.confidence_threshold]) if target_detections else 0,
             'low_confidence_count': len([d for d in target_detections if d['confidence'] < self.confidence_threshold]) if target_detections else 0,
             'reference_analysis': 'No YOLO analysis - using region comparison instead',
-            'showing_all_detections': True
+            'showing_all_detections': True,
+            'mode': detection_mode
         }
+        if change_info is not None:
+            results['yolo_analysis']['change_regions'] = change_info['regions']
+            results['yolo_analysis']['changed_fraction'] = change_info['changed_fraction']
+            results['yolo_analysis']['roi_fraction'] = change_info['roi_fraction']
         
         results['processing_time']['yolo'] = time.time() - yolo_start
         
@@ -150,9 +213,10 @@ class SimilarityBasedYOLOSystem:
             print("-" * 40)
         
         combined_start = time.time()
-        combined_analysis = self.compare_detected_regions_with_reference(
-            reference_img_path, target_img_path, target_detections, verbose=verbose
-        )
+        with stage('region_compare'):
+            combined_analysis = self.compare_detected_regions_with_reference(
+                reference_img_path, target_img_path, target_detections, verbose=verbose
+            )
         results['combined_analysis'] = combined_analysis
         results['processing_time']['combined'] = time.time() - combined_start
         
@@ -162,9 +226,10 @@ class SimilarityBasedYOLOSystem:
             print("-" * 40)
         
         viz_start = time.time()
-        visualization_path = self.create_comparison_visualization(
-            reference_img_path, target_img_path, results, verbose=verbose
-        )
+        with stage('visualization'):
+            visualization_path = self.create_comparison_visualization(
+                reference_img_path, target_img_path, results, verbose=verbose
+            )
         viz_time = time.time() - viz_start
         
         # Determine if bounding boxes should be shown based on change threshold
@@ -193,6 +258,18 @@ class SimilarityBasedYOLOSystem:
         
         return results
     
+    def extract_change_regions(self, ref_img_path, target_img_path):
+        """Aligned difference map against the baseline -> padded change regions (or None on failure)"""
+        try:
+            ref_img = load_image(ref_img_path)
+            target_img = load_image(target_img_path)
+            if ref_img is None or target_img is None:
+                return None
+            return self.change_extractor.extract_regions(ref_img, target_img)
+        except Exception as e:
+            logger.warning("Change region extraction failed: %s", e)
+            return None
+    
     def create_comparison_visualization(self, ref_img_path, target_img_path, results, verbose=True):
         """Create side-by-side visualization of detection results"""
         try:
@@ -201,11 +278,11 @@ class SimilarityBasedYOLOSystem:
             from matplotlib.gridspec import GridSpec
             
             # Load images
-            ref_img = cv2.imread(ref_img_path)
-            target_img = cv2.imread(target_img_path)
+            ref_img = load_image(ref_img_path)
+            target_img = load_image(target_img_path)
             
             if ref_img is None or target_img is None:
-                print("Could not load images for visualization")
+                logger.warning("Could not load images for visualization")
                 return None
             
             # Convert BGR to RGB
@@ -394,7 +471,7 @@ ANALYSIS DETAILS:
 • Processing Time: Total {total_time:.2f}s (Similarity: {timing.get('similarity', 0):.2f}s | YOLO: {timing.get('yolo', 0):.2f}s | Region Analysis: {timing.get('combined', 0):.2f}s | Visualization: {timing.get('visualization', 0):.2f}s)
 • Analysis Type: Region comparison between target detections and reference image regions
 • Change Threshold: {self.change_threshold:.2f} (Changes above this indicate significant change)
-• Image Paths: {Path(ref_img_path).name} → {Path(target_img_path).name}
+• Image Paths: {image_name(ref_img_path)} → {image_name(target_img_path)}
                 """
             else:
                 # For other analysis types
@@ -403,7 +480,7 @@ ANALYSIS DETAILS:
 • Similarity: {sim_data['confidence']:.1%} ({sim_data['best_method']})
 • Processing Time: Total {total_time:.2f}s (Similarity: {timing.get('similarity', 0):.2f}s | YOLO: {timing.get('yolo', 0):.2f}s | Visualization: {timing.get('visualization', 0):.2f}s)
 • Analysis Type: YOLO detection on target image only
-• Image Paths: {Path(ref_img_path).name} → {Path(target_img_path).name}
+• Image Paths: {image_name(ref_img_path)} → {image_name(target_img_path)}
                 """
             
             ax4.text(0.02, 0.5, bottom_text, fontsize=11, va='center',
@@ -426,10 +503,10 @@ ANALYSIS DETAILS:
             return viz_path
             
         except ImportError:
-            print("Matplotlib not available for visualization")
+            logger.warning("Matplotlib not available for visualization")
             return None
         except Exception as e:
-            print(f"Visualization error: {e}")
+            logger.warning("Visualization error: %s", e)
             return None
     
     def compare_detections(self, ref_detections, target_detections, verbose=True):
@@ -572,8 +649,8 @@ ANALYSIS DETAILS:
             import numpy as np
             
             # Load images
-            ref_img = cv2.imread(ref_img_path)
-            target_img = cv2.imread(target_img_path)
+            ref_img = load_image(ref_img_path)
+            target_img = load_image(target_img_path)
             
             if ref_img is None or target_img is None:
                 return {
@@ -682,8 +759,7 @@ ANALYSIS DETAILS:
             }
             
         except Exception as e:
-            if verbose:
-                print(f"Error in region comparison: {e}")
+            logger.warning("Error in region comparison: %s", e)
             return {
                 'error': str(e),
                 'change_magnitude': 0.0,
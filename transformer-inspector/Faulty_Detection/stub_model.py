@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Stub YOLO Model
+Deterministic stand-in with the ultralytics call/result interface, for load tests
+and CI without weights, torch or ultralytics. It "detects" the hottest spot of a
+false-colour thermal image (red minus blue on a thumbnail), so similarity and
+region comparison see realistic boxes, and can sleep to emulate forward latency.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+STUB_CLASS_NAMES = {
+    0: 'Faulty',
+    1: 'faulty_loose_joint',
+    2: 'faulty_point_overload',
+    3: 'potential_faulty',
+    4: 'normal'
+}
+
+
+class _Array:
+    """numpy array with the tensor methods the result consumers call"""
+
+    def __init__(self, data):
+        self.data = np.asarray(data)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.data
+
+    def __getitem__(self, index):
+        return _Array(self.data[index])
+
+    def __len__(self):
+        return len(self.data)
+
+
+class StubBoxes:
+    def __init__(self, rows):
+        rows = np.asarray(rows, dtype=np.float32).reshape(-1, 6)
+        self.xyxy = _Array(rows[:, :4])
+        self.conf = _Array(rows[:, 4])
+        self.cls = _Array(rows[:, 5])
+        self._rows = rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        for row in self._rows:
+            yield StubBoxes(row[None])
+
+
+class StubResult:
+    def __init__(self, rows, orig_shape, names):
+        self.boxes = StubBoxes(rows)
+        self.orig_shape = orig_shape
+        self.names = names
+
+
+class StubYOLO:
+    """Callable like ultralytics.YOLO: model(source, conf=..., imgsz=..., verbose=...) -> [results]"""
+    backend = 'stub'
+
+    def __init__(self, latency_ms=0.0, names=None):
+        self.latency_ms = latency_ms
+        self.names = dict(names or STUB_CLASS_NAMES)
+
+    def __call__(self, source, conf=0.25, **kwargs):
+        sources = source if isinstance(source, list) else [source]
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+        return [self._predict(item, conf) for item in sources]
+
+    def _predict(self, source, conf):
+        img = cv2.imread(str(source)) if not isinstance(source, np.ndarray) else source
+        if img is None:
+            raise FileNotFoundError(f"Stub model could not read {source}")
+        h, w = img.shape[:2]
+        rows = []
+        if img.ndim == 3 and img.shape[2] >= 3 and h > 0 and w > 0:
+            scale = 64.0 / max(h, w)
+            thumb = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))),
+                               interpolation=cv2.INTER_AREA).astype(np.int16)
+            heat = np.clip(thumb[:, :, 2] - thumb[:, :, 0], 0, 255).astype(np.uint8)
+            _, peak, _, (px, py) = cv2.minMaxLoc(heat)
+            score = 0.3 + 0.6 * peak / 255.0
+            if peak > 64 and score >= conf:
+                cx, cy = (px + 0.5) / scale, (py + 0.5) / scale
+                half = 0.05 * max(w, h)
+                cls = 0 if peak > 160 else 3
+                rows.append([max(0.0, cx - half), max(0.0, cy - half),
+                             min(float(w), cx + half), min(float(h), cy + half), score, cls])
+        return StubResult(rows, (h, w), self.names)
@@ -6,20 +6,29 @@ Uses optimized algorithms for fast similarity detection
 
 import cv2
 import numpy as np
+import logging
 import sys
 import os
 import time
 from pathlib import Path
 
+from image_source import image_name, load_image
+from pipeline_metrics import stage
+
+logger = logging.getLogger(__name__)
+
 class SwiftMatcher:
-    def __init__(self, threshold=0.85):
+    def __init__(self, threshold=0.85, verbose=True):
         """
         Swift image matcher using optimized algorithms
         
         Args:
             threshold: Similarity threshold (0.0 to 1.0)
+            verbose: Default for swift_compare output; False keeps the matcher off stdout
+                     (errors still go to the module logger)
         """
         self.threshold = threshold
+        self.verbose = verbose
         # More robust feature detector for augmented images
         self.orb = cv2.ORB_create(nfeatures=2000, scaleFactor=1.2, nlevels=8)
         self.bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
@@ -32,8 +41,8 @@ class SwiftMatcher:
             self.sift_available = False
         
     def read_and_preprocess(self, path, target_size=(512, 512)):
-        """Fast image reading and preprocessing"""
-        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        """Fast image reading and preprocessing (path or in-memory image, see image_source.py)"""
+        img = load_image(path, cv2.IMREAD_GRAYSCALE)
         if img is None:
             raise FileNotFoundError(f"Cannot read {path}")
         
@@ -106,80 +115,26 @@ class SwiftMatcher:
         return max(scores) if scores else 0.0
     
     def feature_matching(self, desc1, desc2, kp1=None, kp2=None):
-        """Improved feature matching with ratio test and geometric verification"""
+        """
+        Cross-checked Hamming matching of ORB descriptors, scored by the mean distance of
+        the best matches (kp1/kp2 are accepted for callers; no geometric check is made)
+
+        This is the scoring the service has always produced: the earlier FLANN KD-tree
+        ratio test cannot index binary descriptors and fell through to it on every pair.
+        """
         if desc1 is None or desc2 is None or len(desc1) < 10 or len(desc2) < 10:
             return 0.0
         
         try:
-            # Use FLANN matcher for better performance
-            FLANN_INDEX_KDTREE = 1
-            index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
-            search_params = dict(checks=50)
-            flann = cv2.FlannBasedMatcher(index_params, search_params)
-            
-            # Get k=2 nearest neighbors for ratio test
-            if len(desc1) >= 2 and len(desc2) >= 2:
-                matches = flann.knnMatch(desc1, desc2, k=2)
-            else:
-                # Fallback to brute force matcher
-                matches = self.bf.match(desc1, desc2)
+            matches = self.bf.match(desc1, desc2)
+            if len(matches) > 10:
                 matches = sorted(matches, key=lambda x: x.distance)
-                good_matches = [m for m in matches if m.distance < 50]
-                if len(good_matches) > 0:
-                    match_ratio = len(good_matches) / min(len(desc1), len(desc2))
-                    avg_distance = np.mean([m.distance for m in good_matches])
-                    return max(0, 1.0 - (avg_distance / 100.0)) * match_ratio
-                return 0.0
-            
-            # Apply Lowe's ratio test
-            good_matches = []
-            for match_pair in matches:
-                if len(match_pair) == 2:
-                    m, n = match_pair
-                    if m.distance < 0.7 * n.distance:  # Lowe's ratio test
-                        good_matches.append(m)
-            
-            if len(good_matches) < 10:
-                return 0.0
-            
-            # Geometric verification using homography (if enough matches)
-            if len(good_matches) >= 15 and kp1 is not None and kp2 is not None:
-                src_pts = np.float32([kp1[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-                dst_pts = np.float32([kp2[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-                
-                # Find homography with RANSAC
-                M, mask = cv2.findHomography(src_pts, dst_pts, 
-                                           cv2.RANSAC, 5.0)
-                
-                if mask is not None:
-                    inliers = np.sum(mask)
-                    inlier_ratio = inliers / len(good_matches)
-                    
-                    # Score based on inlier ratio and number of matches
-                    match_score = (inlier_ratio * 0.7 + 
-                                 min(1.0, len(good_matches) / 100.0) * 0.3)
-                    return match_score
-            
-            # Standard scoring without geometric verification
-            match_ratio = len(good_matches) / min(len(desc1), len(desc2))
-            avg_distance = np.mean([m.distance for m in good_matches])
-            similarity = max(0, 1.0 - (avg_distance / 100.0))
-            
-            return similarity * match_ratio
-            
-        except Exception as e:
-            print(f"Feature matching error: {e}")
-            # Fallback to simple matching
-            try:
-                matches = self.bf.match(desc1, desc2)
-                if len(matches) > 10:
-                    matches = sorted(matches, key=lambda x: x.distance)
-                    good_matches = matches[:min(50, len(matches)//2)]
-                    avg_distance = np.mean([m.distance for m in good_matches])
-                    return max(0, 1.0 - (avg_distance / 100.0))
-            except:
-                pass
-            return 0.0
+                good_matches = matches[:min(50, len(matches)//2)]
+                avg_distance = np.mean([m.distance for m in good_matches])
+                return max(0, 1.0 - (avg_distance / 100.0))
+        except cv2.error as e:
+            logger.debug("Feature matching error: %s", e)
+        return 0.0
     
     def phase_correlation(self, img1, img2):
         """Phase correlation for translation detection"""
@@ -203,6 +158,14 @@ class SwiftMatcher:
         except Exception:
             return 0.0
     
+    def structural_similarity(self, img1, img2):
+        """Simple structural similarity on 64x64 thumbnails (resized for speed)"""
+        small1 = cv2.resize(img1, (64, 64))
+        small2 = cv2.resize(img2, (64, 64))
+        diff = cv2.absdiff(small1, small2)
+        mse = np.mean(diff ** 2)
+        return max(0, 1.0 - (mse / 255.0))
+    
     def augmentation_robust_compare(self, img1, img2):
         """Compare images robust to common augmentations"""
         scores = []
@@ -249,66 +212,73 @@ class SwiftMatcher:
         
         return max(scores) if scores else 0.0
     
-    def swift_compare(self, path1, path2, verbose=True):
+    def swift_compare(self, path1, path2, verbose=None):
         """
         Swift comparison using multiple fast algorithms
         
+        Args:
+            path1, path2: Image paths or in-memory images
+            verbose: Print the comparison report (None = the matcher's default)
+        
         Returns:
             tuple: (is_same_scene, confidence_score, best_method, processing_time)
         """
+        if verbose is None:
+            verbose = self.verbose
         start_time = time.time()
         
         if verbose:
             print(f"🚀 Swift Image Matching")
             print(f"=" * 50)
-            print(f"Image 1: {Path(path1).name}")
-            print(f"Image 2: {Path(path2).name}")
+            print(f"Image 1: {image_name(path1)}")
+            print(f"Image 2: {image_name(path2)}")
             print(f"Threshold: {self.threshold:.3f}")
             print("-" * 50)
         
         # Load and preprocess images
-        img1 = self.read_and_preprocess(path1)
-        img2 = self.read_and_preprocess(path2)
+        with stage('similarity_decode'):
+            img1 = self.read_and_preprocess(path1)
+            img2 = self.read_and_preprocess(path2)
         
         scores = {}
         methods = {}
         
         # 1. Histogram comparison (fastest)
-        hist_score = self.histogram_comparison(img1, img2)
+        with stage('score_histogram'):
+            hist_score = self.histogram_comparison(img1, img2)
         scores['histogram'] = hist_score
         methods['histogram'] = "Histogram Correlation"
         
         # 2. Template matching (fast)
-        template_score = self.template_matching(img1, img2)
+        with stage('score_template'):
+            template_score = self.template_matching(img1, img2)
         scores['template'] = template_score
         methods['template'] = "Template Matching"
         
         # 3. Phase correlation (fast)
-        phase_score = self.phase_correlation(img1, img2)
+        with stage('score_phase'):
+            phase_score = self.phase_correlation(img1, img2)
         scores['phase'] = phase_score
         methods['phase'] = "Phase Correlation"
         
         # 4. Feature matching (moderate speed, high accuracy)
-        kp1, desc1 = self.extract_features(img1)
-        kp2, desc2 = self.extract_features(img2)
-        feature_score = self.feature_matching(desc1, desc2, kp1, kp2)
+        with stage('score_features'):
+            kp1, desc1 = self.extract_features(img1)
+            kp2, desc2 = self.extract_features(img2)
+            feature_score = self.feature_matching(desc1, desc2, kp1, kp2)
         scores['features'] = feature_score
         methods['features'] = "ORB Feature Matching"
         
         # 5. Structural similarity (simple version)
         # Resize to small size for speed
-        small1 = cv2.resize(img1, (64, 64))
-        small2 = cv2.resize(img2, (64, 64))
-        
-        # Simple structural similarity
-        diff = cv2.absdiff(small1, small2)
-        mse = np.mean(diff ** 2)
-        struct_score = max(0, 1.0 - (mse / 255.0))
+        with stage('score_structural'):
+            struct_score = self.structural_similarity(img1, img2)
         scores['structural'] = struct_score
         methods['structural'] = "Structural Similarity"
         
         # 6. Augmentation-robust comparison
-        aug_score = self.augmentation_robust_compare(img1, img2)
+        with stage('score_augmentation'):
+            aug_score = self.augmentation_robust_compare(img1, img2)
         scores['augmentation'] = aug_score
         methods['augmentation'] = "Augmentation Robust"
         
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Synthetic Thermal Image Pairs
+Deterministic thermal-looking reference/target pairs for benchmarks and regression
+checks: a smooth temperature field with equipment shapes and hotspots, rendered
+through a false-colour map. The target is the same scene shifted, rotated and
+brightness-altered, optionally with injected hotspots whose boxes are returned.
+"""
+
+import os
+from typing import Dict, List, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+# Named pair variants: parameters for make_pair()
+PAIR_VARIANTS = {
+    'identical': {},
+    'shifted': {'shift': (12, 8)},
+    'rotated': {'rotation': 3.0},
+    'brightness': {'brightness': 25},
+    'hotspots': {'new_hotspots': 2},
+    'combined': {'shift': (-9, 6), 'rotation': -2.0, 'brightness': -15, 'new_hotspots': 1}
+}
+
+
+class SyntheticPair(NamedTuple):
+    reference: np.ndarray
+    target: np.ndarray
+    hotspots: List[List[int]]  # [x1, y1, x2, y2] of injected hotspots in target coordinates
+
+
+def parse_resolution(text: str) -> Tuple[int, int]:
+    """'640x480' -> (640, 480)"""
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def _add_hotspot(field: np.ndarray, cx: float, cy: float, radius: float, intensity: float):
+    h, w = field.shape
+    x1, x2 = int(max(0, cx - 3 * radius)), int(min(w, cx + 3 * radius + 1))
+    y1, y2 = int(max(0, cy - 3 * radius)), int(min(h, cy + 3 * radius + 1))
+    ys, xs = np.mgrid[y1:y2, x1:x2].astype(np.float32)
+    blob = np.exp(-((xs - cx) ** 2 + (ys - cy) ** 2) / (2 * radius ** 2))
+    np.maximum(field[y1:y2, x1:x2], field[y1:y2, x1:x2] + intensity * blob, out=field[y1:y2, x1:x2])
+
+
+def _random_hotspot(field: np.ndarray, rng: np.random.Generator, margin: float = 0.1) -> List[int]:
+    """Add one hotspot and return its visible box (about two sigma around the centre)"""
+    h, w = field.shape
+    radius = rng.uniform(0.015, 0.04) * min(w, h)
+    cx = rng.uniform(margin, 1 - margin) * w
+    cy = rng.uniform(margin, 1 - margin) * h
+    _add_hotspot(field, cx, cy, radius, rng.uniform(0.45, 0.7))
+    r = 2 * radius
+    return [int(max(0, cx - r)), int(max(0, cy - r)), int(min(w, cx + r)), int(min(h, cy + r))]
+
+
+def thermal_field(width: int, height: int, rng: np.random.Generator, hotspots: int = 3) -> np.ndarray:
+    """Float32 temperature field in [0, 1]: ambient gradient, equipment shapes and hotspots"""
+    coarse = rng.random((max(2, height // 64), max(2, width // 64))).astype(np.float32)
+    field = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC) * 0.25 + 0.1
+    field += np.linspace(0, 0.1, height, dtype=np.float32)[:, None]
+
+    # Transformer body, bushings and conductors at a moderate temperature
+    for _ in range(4):
+        x1, y1 = int(rng.uniform(0.05, 0.7) * width), int(rng.uniform(0.05, 0.7) * height)
+        x2 = min(width - 1, x1 + int(rng.uniform(0.08, 0.3) * width))
+        y2 = min(height - 1, y1 + int(rng.uniform(0.05, 0.3) * height))
+        cv2.rectangle(field, (x1, y1), (x2, y2), float(rng.uniform(0.35, 0.5)), -1)
+    for _ in range(2):
+        y = int(rng.uniform(0.1, 0.9) * height)
+        cv2.line(field, (0, y), (width - 1, int(y + rng.uniform(-0.1, 0.1) * height)),
+                 float(rng.uniform(0.3, 0.45)), max(2, min(width, height) // 120))
+    field = cv2.GaussianBlur(field, (0, 0), max(1.0, min(width, height) / 200))
+
+    for _ in range(hotspots):
+        _random_hotspot(field, rng)
+    return np.clip(field, 0, 1)
+
+
+def colorize(field: np.ndarray) -> np.ndarray:
+    """Temperature field -> BGR false-colour image (cool blue to hot red, like the camera palette)"""
+    return cv2.applyColorMap(np.clip(field * 255, 0, 255).astype(np.uint8), cv2.COLORMAP_JET)
+
+
+def make_pair(width: int, height: int, seed: int = 0, shift=(0, 0), rotation: float = 0.0,
+              brightness: float = 0, new_hotspots: int = 0) -> SyntheticPair:
+    """
+    Reference scene plus a target view of it
+
+    Args:
+        shift: Target translation (dx, dy) in pixels
+        rotation: Target rotation in degrees about the image centre
+        brightness: Additive brightness change of the rendered target
+        new_hotspots: Hotspots injected into the target only (boxes are returned)
+    """
+    rng = np.random.default_rng(seed)
+    field = thermal_field(width, height, rng)
+    reference = colorize(field)
+
+    target_field = field.copy()
+    boxes = [_random_hotspot(target_field, rng, margin=0.2) for _ in range(new_hotspots)]
+
+    matrix = cv2.getRotationMatrix2D((width / 2.0, height / 2.0), rotation, 1.0)
+    matrix[:, 2] += shift
+    if rotation or shift[0] or shift[1]:
+        target_field = cv2.warpAffine(target_field, matrix, (width, height), borderMode=cv2.BORDER_REFLECT)
+        warped = []
+        for x1, y1, x2, y2 in boxes:
+            corners = np.array([[x1, y1, 1], [x2, y1, 1], [x1, y2, 1], [x2, y2, 1]], dtype=np.float64)
+            points = corners @ matrix.T
+            warped.append([int(max(0, points[:, 0].min())), int(max(0, points[:, 1].min())),
+                           int(min(width, points[:, 0].max())), int(min(height, points[:, 1].max()))])
+        boxes = warped
+
+    target = colorize(target_field)
+    if brightness:
+        target = cv2.add(target, (float(brightness),) * 3)  # saturating, either sign
+    return SyntheticPair(reference, target, boxes)
+
+
+def make_variant_pairs(resolution: Tuple[int, int], seed: int = 0,
+                       variants=None) -> Dict[str, SyntheticPair]:
+    """One pair per named variant at the given (width, height); same scene seed for all"""
+    width, height = resolution
+    names = variants or list(PAIR_VARIANTS)
+    return {name: make_pair(width, height, seed=seed, **PAIR_VARIANTS[name]) for name in names}
+
+
+def write_pair(pair: SyntheticPair, out_dir: str, stem: str) -> Tuple[str, str]:
+    """Write a pair as lossless PNGs; returns (reference_path, target_path)"""
+    os.makedirs(out_dir, exist_ok=True)
+    reference_path = os.path.join(out_dir, f"{stem}_reference.png")
+    target_path = os.path.join(out_dir, f"{stem}_target.png")
+    cv2.imwrite(reference_path, pair.reference)
+    cv2.imwrite(target_path, pair.target)
+    return reference_path, target_path
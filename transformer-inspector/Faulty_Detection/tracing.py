@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Request Tracing - W3C Trace Context and Stage Spans
+A request accepts a `traceparent` header (or starts a new trace), gets a root span,
+and every pipeline_metrics.stage() that runs on its thread becomes a child span.
+Finished traces are exported as OTLP/JSON (ExportTraceServiceRequest) from a
+background thread: one JSON object per line to a file (the collector's file format)
+and/or POSTed to an OTLP/HTTP endpoint such as a local collector at :4318/v1/traces.
+Without an exporter only the ids are kept, for logs and response headers.
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_ERROR = 2
+
+_local = threading.local()
+
+
+def new_trace_id():
+    return os.urandom(16).hex()
+
+
+def new_span_id():
+    return os.urandom(8).hex()
+
+
+def parse_traceparent(header):
+    """
+    W3C traceparent -> (trace_id, parent_span_id, sampled), or None when absent/invalid
+    (an invalid header starts a new trace, as the spec requires)
+    """
+    match = _TRACEPARENT.match((header or '').strip().lower())
+    if not match:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == 'ff' or trace_id == '0' * 32 or span_id == '0' * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 0x01)
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'kind', 'start_ns', 'end_ns', '_start_perf',
+                 'attributes', 'error')
+
+    def __init__(self, name, parent_id, kind=SPAN_KIND_INTERNAL, attributes=None):
+        self.name = name
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self._start_perf = time.perf_counter_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def end(self):
+        # Monotonic duration on a wall-clock start keeps spans ordered within the trace
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._start_perf)
+
+    def to_otlp(self, trace_id):
+        span = {
+            'traceId': trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or self.start_ns),
+            'attributes': [_attribute(k, v) for k, v in self.attributes.items() if v is not None]
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.error:
+            span['status'] = {'code': STATUS_ERROR, 'message': self.error}
+        return span
+
+
+class Trace:
+    """One request: the root span, its finished children and the span stack of this thread"""
+
+    def __init__(self, name, trace_id, parent_id, sampled, recording, attributes=None):
+        self.trace_id = trace_id
+        self.sampled = sampled  # Propagated decision (traceparent flag)
+        self.recording = recording  # Spans are kept and exported
+        self.root = Span(name, parent_id, SPAN_KIND_SERVER, attributes)
+        self.spans = []
+        self._stack = [self.root]
+
+    @property
+    def traceparent(self):
+        """traceparent naming this service's root span (for downstream calls; also the traceresponse value)"""
+        return f"00-{self.trace_id}-{self.root.span_id}-{'01' if self.sampled else '00'}"
+
+    def set(self, **attributes):
+        self.root.attributes.update(attributes)
+
+
+class SpanExporter:
+    def __init__(self, file_path=None, endpoint=None, service_name='transx-ml-service', max_queue=1000):
+        """
+        Background OTLP/JSON exporter
+
+        Args:
+            file_path: Append one ExportTraceServiceRequest per line here
+            endpoint: OTLP/HTTP traces URL (e.g. http://localhost:4318/v1/traces)
+            max_queue: Traces buffered before new ones are dropped (never blocks requests)
+        """
+        self.file_path = file_path
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        if file_path:
+            os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        threading.Thread(target=self._run, name='trace-exporter', daemon=True).start()
+
+    def export(self, trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def payload(self, trace):
+        spans = [trace.root] + trace.spans
+        return {'resourceSpans': [{
+            'resource': {'attributes': [_attribute('service.name', self.service_name)]},
+            'scopeSpans': [{
+                'scope': {'name': 'transx.pipeline'},
+                'spans': [span.to_otlp(trace.trace_id) for span in spans]
+            }]
+        }]}
+
+    def _run(self):
+        while True:
+            trace = self._queue.get()
+            try:
+                body = json.dumps(self.payload(trace), separators=(',', ':'))
+                if self.file_path:
+                    with self._lock, open(self.file_path, 'a') as f:
+                        f.write(body + '\n')
+                if self.endpoint:
+                    post = urllib.request.Request(self.endpoint, data=body.encode(), method='POST',
+                                                  headers={'Content-Type': 'application/json'})
+                    urllib.request.urlopen(post, timeout=5).close()
+            except Exception as e:
+                logger.warning(f"Trace export failed: {e}")
+
+
+_exporter = None
+_sample_rate = 1.0
+
+
+def configure(file_path=None, endpoint=None, sample_rate=1.0, service_name='transx-ml-service'):
+    """Export finished traces (no exporter: ids only); sample_rate applies to new traces"""
+    global _exporter, _sample_rate
+    _sample_rate = sample_rate
+    _exporter = SpanExporter(file_path, endpoint, service_name) if (file_path or endpoint) else None
+    return _exporter
+
+
+def start_trace(name, traceparent=None, attributes=None):
+    """Begin the trace of the request handled by this thread (continuing traceparent if valid)"""
+    parent = parse_traceparent(traceparent)
+    if parent:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id, sampled = new_trace_id(), None, random.random() < _sample_rate
+    _local.trace = Trace(name, trace_id, parent_id, sampled, sampled and _exporter is not None, attributes)
+    return _local.trace
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def annotate(**attributes):
+    """Add attributes to the root span of this thread's trace (no-op without one)"""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.set(**attributes)
+
+
+def finish_trace(error=None):
+    """End this thread's trace and queue it for export when sampled"""
+    trace = getattr(_local, 'trace', None)
+    _local.trace = None
+    if trace is None:
+        return None
+    trace.root.error = error or trace.root.error
+    trace.root.end()
+    if trace.recording:
+        _exporter.export(trace)
+    return trace
+
+
+@contextmanager
+def span(name, **attributes):
+    """Child span of the innermost open span on this thread (a no-op outside a sampled trace)"""
+    trace = getattr(_local, 'trace', None)
+    if trace is None or not trace.recording:
+        yield None
+        return
+    current = Span(name, trace._stack[-1].span_id, attributes=attributes)
+    trace._stack.append(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end()
+        trace._stack.pop()
+        trace.spans.append(current)
@@ -8,7 +8,6 @@ predictions with ground truth annotations, providing detailed metrics and visual
 import os
 import sys
 import cv2
-import torch
 import numpy as np
 from pathlib import Path
 import matplotlib.pyplot as plt
@@ -17,25 +16,21 @@ from collections import defaultdict
 import json
 from datetime import datetime
 
-# Add patch for PyTorch compatibility
-def patch_torch_load():
-    original_load = torch.load
-    def patched_load(f, map_location=None, pickle_module=None, weights_only=None, **kwargs):
-        return original_load(f, map_location=map_location, pickle_module=pickle_module, 
-                           weights_only=False, **kwargs)
-    torch.load = patched_load
+from onnx_backend import patch_torch_load
 
-# Apply patch
+# Apply patch for PyTorch compatibility
 patch_torch_load()
 
 # Import ultralytics after patching
 from ultralytics import YOLO
 
 class YOLOComparison:
-    def __init__(self, model_path, dataset_path):
+    def __init__(self, model_path, dataset_path, model=None, split='test'):
         self.model_path = model_path
         self.dataset_path = Path(dataset_path)
-        self.model = YOLO(model_path)
+        # Any callable with the ultralytics predict interface works (e.g. an ONNX Runtime model)
+        self.model = model if model is not None else YOLO(model_path)
+        self.split = split
         
         # Class names from data.yaml
         self.class_names = ['Faulty', 'faulty_loose_joint', 'faulty_point_overload', 'potential_faulty']
@@ -164,7 +159,7 @@ class YOLOComparison:
     def process_single_image(self, image_path, confidence_threshold=0.25):
         """Process a single image and compare with ground truth"""
         image_path = Path(image_path)
-        label_path = self.dataset_path / 'labels' / 'test' / (image_path.stem + '.txt')
+        label_path = self.dataset_path / 'labels' / self.split / (image_path.stem + '.txt')
         
         # Load image
         img = cv2.imread(str(image_path))
@@ -178,7 +173,7 @@ class YOLOComparison:
         gt_boxes = self.parse_yolo_label(label_path, img_width, img_height)
         
         # Get predictions
-        results = self.model(str(image_path), conf=confidence_threshold)
+        results = self.model(str(image_path), conf=confidence_threshold, verbose=False)
         pred_boxes = []
         
         if len(results) > 0 and results[0].boxes is not None:
@@ -220,7 +215,7 @@ class YOLOComparison:
     
     def visualize_comparison(self, image_result, save_path=None):
         """Visualize predictions vs ground truth for a single image"""
-        image_path = self.dataset_path / 'images' / 'test' / image_result['image_name']
+        image_path = self.dataset_path / 'images' / self.split / image_result['image_name']
         img = cv2.imread(str(image_path))
         img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
         
@@ -273,7 +268,7 @@ class YOLOComparison:
         
     def run_batch_comparison(self, confidence_threshold=0.25, max_images=None):
         """Run batch comparison on test images"""
-        test_images_path = self.dataset_path / 'images' / 'test'
+        test_images_path = self.dataset_path / 'images' / self.split
         image_files = list(test_images_path.glob('*.jpg')) + list(test_images_path.glob('*.png'))
         
         if max_images:
@@ -367,11 +362,45 @@ class YOLOComparison:
             'precision': overall_precision,
             'recall': overall_recall,
             'f1_score': overall_f1,
+            'map50': self.calculate_average_precision(),
             'total_true_positives': total_tp,
             'total_false_positives': total_fp,
             'total_false_negatives': total_fn
         }
     
+    def calculate_average_precision(self):
+        """Calculate per-class AP@0.5 and return mAP@0.5 over classes with ground truth"""
+        class_preds = defaultdict(list)
+        class_gt_counts = defaultdict(int)
+
+        for image_result in self.results['per_image_results']:
+            matched_preds = {match['pred_idx'] for match in image_result['matches']}
+            for gt_box in image_result['gt_boxes']:
+                class_gt_counts[gt_box['class_id']] += 1
+            for i, pred_box in enumerate(image_result['pred_boxes']):
+                class_preds[pred_box['class_id']].append((pred_box['confidence'], i in matched_preds))
+
+        ap_values = []
+        for class_id, gt_count in class_gt_counts.items():
+            preds = sorted(class_preds.get(class_id, []), key=lambda p: p[0], reverse=True)
+            tp = np.cumsum([1 if is_tp else 0 for _, is_tp in preds]) if preds else np.zeros(0)
+            fp = np.cumsum([0 if is_tp else 1 for _, is_tp in preds]) if preds else np.zeros(0)
+            recall = tp / gt_count
+            precision = tp / np.maximum(tp + fp, 1)
+
+            # Area under the monotone precision envelope (continuous interpolation)
+            mrec = np.concatenate(([0.0], recall, [1.0]))
+            mpre = np.concatenate(([1.0], precision, [0.0]))
+            mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+            idx = np.where(mrec[1:] != mrec[:-1])[0]
+            ap = float(np.sum((mrec[idx + 1] - mrec[idx]) * mpre[idx + 1]))
+
+            ap_values.append(ap)
+            if class_id in self.results['per_class_metrics']:
+                self.results['per_class_metrics'][class_id]['ap50'] = ap
+
+        return float(np.mean(ap_values)) if ap_values else 0.0
+
     def print_results(self):
         """Print comprehensive results"""
         print("\n" + "="*80)
@@ -388,6 +417,7 @@ class YOLOComparison:
         print(f"  Precision: {overall['precision']:.4f}")
         print(f"  Recall: {overall['recall']:.4f}")
         print(f"  F1-Score: {overall['f1_score']:.4f}")
+        print(f"  mAP@0.5: {overall['map50']:.4f}")
         
         print(f"\nPer-Class Performance:")
         print(f"{'Class':<25} {'Precision':<12} {'Recall':<12} {'F1-Score':<12} {'TP':<6} {'FP':<6} {'FN':<6}")
@@ -4,15 +4,20 @@ TransX ML Service - Phase 2 & 3
 Python Flask service for YOLOv8 anomaly detection with similarity-based comparison
 """
 
-from flask import Flask, request, jsonify
+import time
+_PROCESS_START = time.perf_counter()
+
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from ultralytics import YOLO
-import torch
-import cv2
-import numpy as np
 from pathlib import Path
+from collections import OrderedDict
+from contextlib import contextmanager
+import importlib.util
+import hmac
+import threading
 import uuid
 import logging
+import signal
 import sys
 import os
 import json
@@ -22,35 +27,44 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Faulty_Detection'))
 
-# Setup logging first
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Setup logging first: 'text' lines or one JSON object per line ('json');
+# ML_LOG_LEVEL=DEBUG adds the per-request and per-detection detail
+from log_format import configure_logging
+LOG_FORMAT = os.environ.get('ML_LOG_FORMAT', 'text').lower()
+LOG_LEVEL = os.environ.get('ML_LOG_LEVEL', 'INFO')
+configure_logging(LOG_FORMAT, LOG_LEVEL, sys.stdout)
 logger = logging.getLogger(__name__)
 
-# Import similarity-based YOLO system
-try:
-    from similarity_yolo_system import SimilarityBasedYOLOSystem
-    SIMILARITY_SYSTEM_AVAILABLE = True
-    logger.info("Similarity-based YOLO system imported successfully")
-except ImportError as e:
-    SIMILARITY_SYSTEM_AVAILABLE = False
-    logger.warning(f"Could not import similarity system: {e}")
-    logger.warning("Falling back to single image inference")
-
-# Import enhanced dataset creator for auto fine-tuning
-try:
-    from targeted_dataset_creator import TargetedDatasetCreator
-    DATASET_CREATOR_AVAILABLE = True
-    logger.info("Enhanced dataset creator imported successfully")
-except ImportError as e:
-    DATASET_CREATOR_AVAILABLE = False
-    logger.warning(f"Could not import dataset creator: {e}")
-    logger.warning("Auto fine-tuning will not be available")
+from detection_classes import CLASS_COLORS, CLASS_NAMES
+from memory_guard import MB, MemoryLedger, MemoryWatchdog, current_rss_bytes, peak_rss_bytes, release_memory
+from model_provider import ModelProvider
+from onnx_backend import patch_torch_load
+from pipeline_metrics import CONTENT_TYPE, REGISTRY, stage, start_stage_timings, stop_stage_timings
+import response_format
+import tracing
+from tracing import annotate, current_trace, span
+
+# Heavy modules (torch, ultralytics, cv2, the similarity system and the dataset creator)
+# are imported on first use so the process can answer liveness probes right away.
+# Availability is only probed here; a failing import flips the flag when it happens.
+SIMILARITY_SYSTEM_AVAILABLE = importlib.util.find_spec('similarity_yolo_system') is not None
+DATASET_CREATOR_AVAILABLE = importlib.util.find_spec('targeted_dataset_creator') is not None
+if not SIMILARITY_SYSTEM_AVAILABLE:
+    logger.warning("Similarity system not found - falling back to single image inference")
+if not DATASET_CREATOR_AVAILABLE:
+    logger.warning("Dataset creator not found - auto fine-tuning will not be available")
+
+# Startup mode: 'background' serves immediately and warms the model in a thread,
+# 'eager' warms before serving, 'lazy' loads the model on the first request
+STARTUP_MODE = os.environ.get('ML_STARTUP_MODE', 'background').lower()
+
+# Startup progress reported by /api/health and the readiness probe
+STARTUP = {
+    'mode': STARTUP_MODE,
+    'state': 'cold',  # cold -> warming -> ready | failed
+    'error': None,
+    'phases_ms': {}
+}
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -60,84 +74,164 @@ CORS(app)
 MODEL_PATHS = [
     str(Path(__file__).parent.parent / "Faulty_Detection/yolov8p2.pt")
 ]
-MODEL_PATH = None  # Will be determined dynamically
-model = None
+
+# Epoch budget per incremental fine-tune (new feedback plus replayed corpus samples)
+FINETUNE_EPOCHS = int(os.environ.get('ML_FINETUNE_EPOCHS', '10'))
+# Epochs without validation mAP improvement before a fine-tune stops early
+FINETUNE_PATIENCE = int(os.environ.get('ML_FINETUNE_PATIENCE', '3'))
+# Wall-clock budget per fine-tune in minutes (0 = epochs only)
+FINETUNE_MAX_MINUTES = float(os.environ.get('ML_FINETUNE_MAX_MINUTES', '20'))
 
 # Similarity system instance
 similarity_system = None
 
-# Class mapping from rules.txt
-CLASS_NAMES = {
-    0: 'faulty',
-    1: 'faulty_loose_joint', 
-    2: 'faulty_point_overload',
-    3: 'potential_faulty'
-}
+# Request-level metrics for /metrics (stage histograms come from pipeline_metrics)
+DETECT_REQUESTS = REGISTRY.counter(
+    'ml_detect_requests_total', 'Detection requests by code path', ('path',))
+DETECT_FALLBACKS = REGISTRY.counter(
+    'ml_detect_fallbacks_total', 'Detection requests served by standard YOLO, by reason', ('reason',))
+DETECT_SECONDS = REGISTRY.histogram(
+    'ml_detect_duration_seconds', 'End-to-end /api/detect latency by code path', ('path',))
+DETECT_IN_FLIGHT = REGISTRY.gauge(
+    'ml_detect_in_flight', 'Detection requests currently being processed')
+FEEDBACK_QUEUE_JOBS = REGISTRY.gauge(
+    'ml_feedback_jobs', 'Feedback ingestion jobs by state', ('state',))
+FEEDBACK_JOB_STATES = ('queued', 'running', 'completed', 'skipped', 'failed')
+PROCESS_RSS = REGISTRY.gauge(
+    'ml_process_rss_bytes', 'Resident set size of this worker')
+MEMORY_COMPONENT_BYTES = REGISTRY.gauge(
+    'ml_memory_component_bytes', 'Estimated worker memory by component', ('component',))
 
-# Color mapping for visualization (RGB for JSON response)
-CLASS_COLORS = {
-    0: [255, 0, 0],      # Red - Faulty
-    1: [0, 255, 0],      # Green - faulty_loose_joint
-    2: [0, 0, 255],      # Blue - faulty_point_overload
-    3: [255, 255, 0]     # Yellow - potential_faulty
-}
+# Memory guard: RSS budget per worker in MB (0 = no watchdog). Over budget the worker
+# first releases memory; if still over, it turns not-ready, drains in-flight requests
+# and any running fine-tune, then exits so gunicorn / the orchestrator starts a fresh one
+RSS_BUDGET_MB = float(os.environ.get('ML_RSS_BUDGET_MB', '0'))
+MEMORY_CHECK_SECONDS = float(os.environ.get('ML_MEMORY_CHECK_SECONDS', '15'))
+RECYCLE_DRAIN_SECONDS = float(os.environ.get('ML_RECYCLE_DRAIN_SECONDS', '120'))
+MEMORY = MemoryLedger()  # Bytes held by in-flight work, per component
+active_trainings = {}  # fine-tune model name -> RSS when it started
+_active_trainings_lock = threading.Lock()
+memory_watchdog = None
+RECYCLE = {'state': None, 'reason': None}  # None -> draining -> recycling
 
+# Feedback uploads are queued durably and processed by a background worker
+# (ML_FEEDBACK_DIR points a load test or scratch instance at its own store)
+FEEDBACK_DIR = Path(os.environ.get('ML_FEEDBACK_DIR', Path(__file__).resolve().parent / 'feedback_data'))
+feedback_jobs = None
+_feedback_jobs_lock = threading.Lock()
 
-def patch_torch_load():
-    """Apply PyTorch compatibility patch for weights_only parameter"""
-    original_load = torch.load
-    
-    def patched_load(f, map_location=None, pickle_module=None, weights_only=None, **kwargs):
-        # Force weights_only=False for .pt files
-        if isinstance(f, (str, Path)):
-            if str(f).endswith('.pt'):
-                weights_only = False
-        elif hasattr(f, 'name') and f.name.endswith('.pt'):
-            weights_only = False
-        
-        return original_load(
-            f, 
-            map_location=map_location, 
-            pickle_module=pickle_module, 
-            weights_only=weights_only, 
-            **kwargs
-        )
-    
-    torch.load = patched_load
-    logger.info("PyTorch compatibility patch applied")
+# Change-guided ROI inference: when inspection and baseline show the same scene,
+# run YOLO only on the regions that differ from the baseline
+CHANGE_GUIDED_ROI = os.environ.get('ML_CHANGE_GUIDED_ROI', 'false').lower() in ('1', 'true', 'yes')
+
+# Image input without a shared filesystem: /api/detect also takes the images as bytes
+# (multipart or a raw image body), decoded in memory, or as the SHA-256 of bytes sent
+# before (kept in an LRU of ML_IMAGE_CACHE_MB) or of a file in the uploads catalog
+IMAGE_CACHE_MB = float(os.environ.get('ML_IMAGE_CACHE_MB', '256'))
+MAX_IMAGE_MB = float(os.environ.get('ML_MAX_IMAGE_MB', '32'))
+HASH_LOOKUP_UPLOADS = os.environ.get('ML_HASH_LOOKUP_UPLOADS', 'true').lower() in ('1', 'true', 'yes')
+RAW_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/bmp', 'image/webp', 'application/octet-stream')
+image_cache = None
+_image_cache_lock = threading.Lock()
+
+# The matcher / detector / similarity system run quiet in the service (no stdout reports)
+# and the detector does not write clean_detection_results/ per request unless enabled
+LIBRARY_VERBOSE = os.environ.get('ML_LIBRARY_VERBOSE', 'false').lower() in ('1', 'true', 'yes')
+SAVE_DETECTION_RESULTS = os.environ.get('ML_SAVE_DETECTION_RESULTS', 'false').lower() in ('1', 'true', 'yes')
+
+# Stub model mode for load tests and CI: serve a deterministic numpy stand-in
+# (stub_model.StubYOLO) instead of weights, with an emulated forward-pass latency;
+# triggered fine-tunes run a CPU-bound stand-in for ML_STUB_FINETUNE_SECONDS and swap models
+STUB_MODEL = os.environ.get('ML_STUB_MODEL', 'false').lower() in ('1', 'true', 'yes')
+STUB_LATENCY_MS = float(os.environ.get('ML_STUB_LATENCY_MS', '0'))
+STUB_FINETUNE_SECONDS = float(os.environ.get('ML_STUB_FINETUNE_SECONDS', '20'))
+
+# Request tracing: a W3C traceparent header continues the caller's trace (else a new one
+# starts); responses carry X-Trace-Id. Stage spans are exported as OTLP/JSON lines to
+# ML_TRACE_FILE and/or POSTed to an OTLP/HTTP collector at ML_OTLP_ENDPOINT (.../v1/traces)
+TRACE_FILE = os.environ.get('ML_TRACE_FILE', '')
+OTLP_ENDPOINT = os.environ.get('ML_OTLP_ENDPOINT', '')
+TRACE_SAMPLE_RATE = float(os.environ.get('ML_TRACE_SAMPLE_RATE', '1.0'))  # For requests without traceparent
+UNTRACED_PATHS = ('/api/health', '/metrics')  # Probes and scrapes
+
+# Admin endpoints (/api/admin/*) and the X-Profile request header require this token in
+# the X-Admin-Token header; they are disabled while ML_ADMIN_TOKEN is unset
+ADMIN_TOKEN = os.environ.get('ML_ADMIN_TOKEN', '')
+PROFILE_MAX_SECONDS = float(os.environ.get('ML_PROFILE_MAX_SECONDS', '60'))
+REQUEST_PROFILE_INTERVAL = 0.001  # One thread is sampled, so a finer interval stays cheap
+REQUEST_PROFILES_KEPT = 32
+request_profiles = OrderedDict()  # profile id -> collapsed stacks of one X-Profile request
+_request_profiles_lock = threading.Lock()
+_profile_lock = threading.Lock()  # One whole-process profile at a time
+
+# Rebuild the INT8 serving variant after every fine-tune so it never lags the FP32 weights
+QUANTIZE_AFTER_FINETUNE = os.environ.get('ML_QUANTIZE_AFTER_FINETUNE', 'true').lower() in ('1', 'true', 'yes')
+
+
+# One provider owns the served model: the plain detector and the similarity system
+# both use its single instance, and every (re)load gets an explicit version
+model_provider = ModelProvider(
+    model_dir=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Faulty_Detection')),
+    torch_setup=patch_torch_load
+)
+if STUB_MODEL:
+    from stub_model import StubYOLO
+    model_provider.install(StubYOLO(latency_ms=STUB_LATENCY_MS), 'stub')
+    logger.warning("ML_STUB_MODEL is set - serving the stub model, detections are synthetic")
+
+
+def record_phase(name, phase_start):
+    """Record a startup phase duration (milliseconds) for /api/health"""
+    STARTUP['phases_ms'][name] = round((time.perf_counter() - phase_start) * 1000, 1)
+
+
+def import_similarity_system():
+    """Import the similarity system on first use (pulls in cv2 and the detector stack)"""
+    global SIMILARITY_SYSTEM_AVAILABLE
+    try:
+        phase_start = time.perf_counter()
+        from similarity_yolo_system import SimilarityBasedYOLOSystem
+        if 'similarity_import' not in STARTUP['phases_ms']:
+            record_phase('similarity_import', phase_start)
+        return SimilarityBasedYOLOSystem
+    except ImportError as e:
+        SIMILARITY_SYSTEM_AVAILABLE = False
+        logger.warning(f"Could not import similarity system: {e}")
+        logger.warning("Falling back to single image inference")
+        raise
 
 
 def load_similarity_system():
-    """Initialize similarity-based YOLO system with Flask-safe configuration"""
+    """Initialize similarity-based YOLO system with Flask-safe configuration (shares the service model)"""
     global similarity_system
     
     if similarity_system is None and SIMILARITY_SYSTEM_AVAILABLE:
         try:
-            # Find the best model path for similarity system
-            selected_model_path = None
-            for path in MODEL_PATHS:
-                model_file = Path(path)
-                if model_file.exists():
-                    selected_model_path = str(model_file)
-                    break
-            
-            if selected_model_path is None:
-                raise FileNotFoundError(f"No model found for similarity system! Searched paths: {MODEL_PATHS}")
+            # Load through the shared provider so the detector reuses this exact instance
+            load_model()
+            SimilarityBasedYOLOSystem = import_similarity_system()
+            phase_start = time.perf_counter()
             
             # Initialize with default parameters
-            similarity_system = SimilarityBasedYOLOSystem(
+            system = SimilarityBasedYOLOSystem(
                 similarity_threshold=0.5,  # Default threshold for similarity
                 change_threshold=0.2,      # Default threshold for significance
-                model_path=selected_model_path
+                model_path=model_provider.model_path,
+                change_guided=CHANGE_GUIDED_ROI,
+                model_provider=model_provider,
+                verbose=LIBRARY_VERBOSE
             )
+            system.yolo_detector.save_results = SAVE_DETECTION_RESULTS
             
             # Patch the visualization method to prevent GUI issues in Flask
             def dummy_visualization(*args, **kwargs):
                 """Dummy visualization that returns None to avoid matplotlib GUI threading issues"""
                 return None
                 
-            similarity_system.create_comparison_visualization = dummy_visualization
-            logger.info("Similarity-based YOLO system initialized (Flask-safe) with model: {selected_model_path}")
+            system.create_comparison_visualization = dummy_visualization
+            similarity_system = system
+            record_phase('similarity_init', phase_start)
+            logger.info(f"Similarity-based YOLO system initialized (Flask-safe) with model: {model_provider.version}")
             return similarity_system
             
         except Exception as e:
@@ -148,52 +242,192 @@ def load_similarity_system():
 
 
 def load_model():
-    """Load YOLOv8p2 model with dynamic path selection (lazy loading, keeps in memory)"""
-    global model, MODEL_PATH
+    """Return the shared YOLOv8p2 model (newest yolov8p2_*.pt, else yolov8p2.pt; loaded once per process)"""
+    try:
+        served_model = model_provider.get()
+    except Exception as e:
+        logger.error(f"Failed to load model: {e}")
+        raise
     
-    if model is None:
-        try:
-            patch_torch_load()
-            # Always use the latest timestamped yolov8p2 model in Faulty_Detection if available
-            model_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Faulty_Detection'))
-            pt_files = [f for f in os.listdir(model_dir) if f.startswith('yolov8p2_') and f.endswith('.pt')]
-            selected_model_path = None
-            if pt_files:
-                pt_files.sort(reverse=True)  # Latest first
-                selected_model_path = os.path.join(model_dir, pt_files[0])
-            else:
-                # Fallback to default yolov8p2.pt
-                default_path = os.path.join(model_dir, 'yolov8p2.pt')
-                if os.path.exists(default_path):
-                    selected_model_path = default_path
-            if selected_model_path is None:
-                raise FileNotFoundError(f"No YOLOv8p2 model found in {model_dir}")
-            global MODEL_PATH
-            MODEL_PATH = selected_model_path
-            logger.info(f"Found YOLOv8p2 model: {MODEL_PATH}")
-            model = YOLO(MODEL_PATH)
-            logger.info("YOLOv8p2 model loaded successfully!")
-        except Exception as e:
-            logger.error(f"Failed to load model: {e}")
-            raise
-    return model
+    if 'model_load' not in STARTUP['phases_ms']:
+        STARTUP['phases_ms']['model_load'] = model_provider.info()['load_ms']
+        if STARTUP['state'] != 'warming':
+            STARTUP['state'] = 'ready'  # Loaded on demand (lazy mode)
+    return served_model
+
+
+def warm_start():
+    """Load the shared model, run one warm-up inference and build the similarity system"""
+    STARTUP['state'] = 'warming'
+    try:
+        warm_model = load_model()
+        
+        # The first inference pays for graph optimisation / allocator warm-up; do it before traffic
+        phase_start = time.perf_counter()
+        import numpy as np
+        warm_model(np.zeros((640, 640, 3), dtype=np.uint8), conf=0.25, verbose=False)
+        record_phase('warmup_inference', phase_start)
+        
+        if SIMILARITY_SYSTEM_AVAILABLE:
+            try:
+                load_similarity_system()
+            except Exception as e:
+                logger.error(f"Could not preload similarity system: {e}")
+        
+        STARTUP['state'] = 'ready'
+        record_phase('time_to_ready', _PROCESS_START)
+        logger.info(f"Model warm - ready to serve after {STARTUP['phases_ms']['time_to_ready']:.0f}ms")
+    except Exception as e:
+        STARTUP['state'] = 'failed'
+        STARTUP['error'] = str(e)
+        logger.error(f"Warm start failed: {e}")
+
+
+def start_warm_start():
+    """Warm the model according to ML_STARTUP_MODE"""
+    if STARTUP_MODE == 'eager':
+        warm_start()
+    elif STARTUP_MODE == 'background':
+        threading.Thread(target=warm_start, name='warm-start', daemon=True).start()
+    else:
+        logger.info("Lazy startup - model loads on the first request")
+
+
+def is_ready():
+    """Model warm (or lazy mode, where the first request loads it) and not draining for a recycle"""
+    return (model_provider.loaded or STARTUP_MODE == 'lazy') and RECYCLE['state'] is None
+
+
+def cache_bytes():
+    """In-process caches: kept X-Profile stacks and the augmentation lookup tables"""
+    total = sum(len(stacks) for stacks in list(request_profiles.values()))
+    kernels = sys.modules.get('augment_kernels')
+    if kernels is not None:
+        for lut in (kernels.brightness_lut, kernels.contrast_lut, kernels.gamma_lut,
+                    kernels.saturation_lut, kernels.hue_lut):
+            total += lut.cache_info().currsize * 768  # At most 256x3 uint8 per table
+    return total
+
+
+def memory_components():
+    """(RSS bytes, estimated bytes per component)"""
+    rss = current_rss_bytes()
+    with _active_trainings_lock:
+        training = sum(max(0, rss - started) for started in active_trainings.values())
+    return rss, {
+        'model_weights': (model_provider.info() or {}).get('weights_bytes') or 0,
+        'inflight_images': MEMORY.snapshot().get('inflight_images', 0),
+        'training': training,  # RSS growth since each running fine-tune started
+        'caches': cache_bytes(),
+        'image_cache': image_cache.nbytes if image_cache is not None else 0
+    }
+
+
+def memory_report():
+    """RSS and its estimated split by component (MB) for /api/health"""
+    rss, components = memory_components()
+    return {
+        'rss_mb': round(rss / MB, 1),
+        'peak_rss_mb': round(peak_rss_bytes() / MB, 1),
+        'components_mb': {name: round(value / MB, 1) for name, value in components.items()},
+        'unattributed_mb': round(max(0, rss - sum(components.values())) / MB, 1),
+        'active_trainings': len(active_trainings),
+        'watchdog': memory_watchdog.info() if memory_watchdog is not None else None,
+        'image_cache': image_cache.stats() if image_cache is not None else None,
+        'recycle': RECYCLE
+    }
+
+
+@contextmanager
+def accounted_training(model_name):
+    """Account a fine-tune's RSS growth while it runs and release its memory once it returns"""
+    with _active_trainings_lock:
+        active_trainings[model_name] = current_rss_bytes()
+    try:
+        yield
+    finally:
+        with _active_trainings_lock:
+            active_trainings.pop(model_name, None)
+        release_memory()
+        logger.info(f"Fine-tune {model_name} finished, RSS now {current_rss_bytes() / MB:.0f}MB")
+
+
+def begin_recycle(rss):
+    """
+    Memory watchdog callback: stop taking traffic (readiness 503), wait for in-flight
+    detections and any running fine-tune (up to ML_RECYCLE_DRAIN_SECONDS), then SIGTERM
+    this worker; gunicorn replaces it, and unfinished feedback jobs resume from the queue
+    """
+    RECYCLE.update(state='draining', reason=f"RSS {rss / MB:.0f}MB over the {RSS_BUDGET_MB:.0f}MB budget")
+    logger.warning(f"Recycling worker: {RECYCLE['reason']}; draining")
+    deadline = time.monotonic() + RECYCLE_DRAIN_SECONDS
+    while (active_trainings or DETECT_IN_FLIGHT.get() > 0) and time.monotonic() < deadline:
+        time.sleep(0.5)
+    with _active_trainings_lock:
+        running = list(active_trainings)
+    if running:
+        # A fine-tune can outlast any drain; the next worker re-queues its interrupted feedback job
+        logger.warning(f"Fine-tune still running after {RECYCLE_DRAIN_SECONDS:.0f}s, recycling anyway: "
+                       f"{', '.join(running)}")
+    RECYCLE['state'] = 'recycling'
+    logger.warning("Worker drained, exiting for a fresh worker")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def start_memory_watchdog():
+    """Watch RSS against ML_RSS_BUDGET_MB (no-op without a budget)"""
+    global memory_watchdog
+    if RSS_BUDGET_MB > 0 and memory_watchdog is None:
+        memory_watchdog = MemoryWatchdog(RSS_BUDGET_MB * MB, begin_recycle, MEMORY_CHECK_SECONDS).start()
+        logger.info(f"Memory watchdog on: {RSS_BUDGET_MB:.0f}MB RSS budget")
+
+
+@app.route('/api/health/live', methods=['GET'])
+def liveness_check():
+    """Liveness probe: the process is up and serving HTTP (never touches the model)"""
+    return jsonify({
+        'status': 'alive',
+        'uptime_s': round(time.perf_counter() - _PROCESS_START, 1)
+    }), 200
+
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 once the model is warm, 503 while loading or after a failed warm start"""
+    ready = is_ready()
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'state': STARTUP['state'],
+        'model_loaded': model_provider.loaded,
+        'model_version': model_provider.version,
+        'error': STARTUP['error']
+    }), 200 if ready else 503
 
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint with similarity system status"""
     try:
-        model_loaded = model is not None
-        model_path_exists = Path(MODEL_PATH).exists() if MODEL_PATH else False
+        model_loaded = model_provider.loaded
+        model_path = model_provider.model_path
+        model_path_exists = Path(model_path).exists() if model_path else False
         similarity_loaded = similarity_system is not None
+        from onnx_backend import accepted_int8_path, INFERENCE_BACKEND
         
         return jsonify({
             'status': 'healthy',
             'model_loaded': model_loaded,
-            'model_path': MODEL_PATH,
+            'model_path': model_path,
             'model_path_exists': model_path_exists,
+            'model_version': model_provider.info(),
+            'inference_backend': model_provider.info()['backend'] if model_loaded else None,
+            'inference_backend_setting': INFERENCE_BACKEND,
+            'int8_variant': accepted_int8_path(model_path) if model_path else None,
             'similarity_system_available': SIMILARITY_SYSTEM_AVAILABLE,
             'similarity_system_loaded': similarity_loaded,
+            'ready': is_ready(),
+            'startup': STARTUP,
+            'memory': memory_report(),
             'service': 'TransX ML Service with Similarity Engine',
             'version': '2.0.0',
             'features': [
@@ -210,6 +444,303 @@ def health_check():
         }), 500
 
 
+def refresh_memory_gauges():
+    """Sample RSS and the per-component estimates into their gauges"""
+    rss, components = memory_components()
+    PROCESS_RSS.set(rss)
+    for component, value in components.items():
+        MEMORY_COMPONENT_BYTES.set(value, component=component)
+
+
+def refresh_queue_gauges():
+    """Sample the feedback job queue into its gauges (only once the queue exists)"""
+    if feedback_jobs is None:
+        return
+    states = feedback_jobs.stats()['states']
+    for state in set(FEEDBACK_JOB_STATES) | set(states):
+        FEEDBACK_QUEUE_JOBS.set(states.get(state, 0), state=state)
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint: stage latency histograms, code-path counters and queue gauges"""
+    refresh_queue_gauges()
+    refresh_memory_gauges()
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def is_admin_request():
+    """The request carries the configured admin token"""
+    supplied = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+
+def admin_denied():
+    """403 for admin endpoints without a valid token (or with admin endpoints disabled)"""
+    message = 'Admin token required' if ADMIN_TOKEN else 'Admin endpoints are disabled (ML_ADMIN_TOKEN is not set)'
+    return jsonify({'status': 'error', 'error': message}), 403
+
+
+@app.before_request
+def start_request_trace():
+    """Open the request's trace (continuing the caller's traceparent)"""
+    if not request.path.startswith(UNTRACED_PATHS):
+        tracing.start_trace(f"{request.method} {request.path}", request.headers.get('traceparent'), {
+            'http.method': request.method,
+            'http.target': request.path
+        })
+
+
+@app.after_request
+def tag_request_trace(response):
+    """Record the status on the root span and return the trace id to the caller"""
+    trace = current_trace()
+    if trace is not None:
+        trace.set(**{'http.status_code': response.status_code})
+        response.headers['X-Trace-Id'] = trace.trace_id
+        # traceparent is a request header; responses name the server span in traceresponse
+        # (W3C Trace Context Level 2, same format)
+        response.headers['traceresponse'] = trace.traceparent
+    return response
+
+
+@app.teardown_request
+def finish_request_trace(exc=None):
+    """End and export the trace, also when the handler raised"""
+    tracing.finish_trace(error=f"{type(exc).__name__}: {exc}" if exc else None)
+
+
+@app.before_request
+def start_request_profile():
+    """X-Profile: 1 (admin only) samples the thread handling this one request"""
+    if request.headers.get('X-Profile', '').lower() in ('1', 'true', 'yes') and is_admin_request():
+        from sampling_profiler import SamplingProfiler
+        g.profiler = SamplingProfiler(REQUEST_PROFILE_INTERVAL, thread_ids=[threading.get_ident()],
+                                      include_idle=True).start()
+
+
+@app.after_request
+def finish_request_profile(response):
+    """Keep the request's collapsed stacks; X-Profile-Id names them for /api/admin/profile/<id>"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        profile_id = uuid.uuid4().hex[:12]
+        with _request_profiles_lock:
+            request_profiles[profile_id] = profiler.collapsed()
+            while len(request_profiles) > REQUEST_PROFILES_KEPT:
+                request_profiles.popitem(last=False)
+        response.headers['X-Profile-Id'] = profile_id
+        response.headers['X-Profile-Samples'] = str(profiler.samples)
+    return response
+
+
+@app.route('/api/admin/profile', methods=['GET'])
+def admin_profile():
+    """
+    Sample every thread of this worker for ?seconds=N (default 10) and return collapsed
+    stacks (text/plain) for flamegraph.pl / speedscope. Optional: interval_ms (default 5),
+    idle=true to keep parked threads.
+    """
+    if not is_admin_request():
+        return admin_denied()
+    from sampling_profiler import profile
+    
+    try:
+        seconds = float(request.args.get('seconds', 10.0))
+        interval_ms = float(request.args.get('interval_ms', 5.0))
+    except ValueError:
+        return jsonify({'status': 'error', 'error': 'seconds and interval_ms must be numbers'}), 400
+    include_idle = request.args.get('idle', 'false').lower() in ('1', 'true', 'yes')
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return jsonify({'status': 'error', 'error': f'seconds must be in (0, {PROFILE_MAX_SECONDS:g}]'}), 400
+    if not 0.5 <= interval_ms <= 1000:
+        return jsonify({'status': 'error', 'error': 'interval_ms must be in [0.5, 1000]'}), 400
+    if not _profile_lock.acquire(blocking=False):
+        return jsonify({'status': 'error', 'error': 'A profile is already running'}), 409
+    try:
+        logger.info(f"Profiling worker for {seconds:g}s at {interval_ms:g}ms intervals")
+        profiler = profile(seconds, interval_ms / 1000.0, include_idle)
+    finally:
+        _profile_lock.release()
+    return Response(profiler.collapsed(), content_type='text/plain; charset=utf-8', headers={
+        'X-Profile-Samples': str(profiler.samples),
+        'X-Profile-Seconds': f"{profiler.duration:.3f}"
+    })
+
+
+@app.route('/api/admin/profile/<profile_id>', methods=['GET'])
+def get_request_profile(profile_id):
+    """Collapsed stacks of an earlier X-Profile request (the newest 32 are kept)"""
+    if not is_admin_request():
+        return admin_denied()
+    with _request_profiles_lock:
+        stacks = request_profiles.get(profile_id)
+    if stacks is None:
+        return jsonify({'status': 'error', 'error': f'Unknown profile: {profile_id}'}), 404
+    return Response(stacks, content_type='text/plain; charset=utf-8')
+
+
+def finish_detect_request(path, request_start, timings, fallback_reason=None, **fields):
+    """
+    Close out one /api/detect request: count its code path, observe its latency and
+    log one summary event with the stage timings (a JSON object with ML_LOG_FORMAT=json)
+    """
+    duration = time.perf_counter() - request_start
+    DETECT_REQUESTS.inc(path=path)
+    DETECT_SECONDS.observe(duration, path=path)
+    if fallback_reason:
+        DETECT_FALLBACKS.inc(reason=fallback_reason)
+    event = dict(event='detect', path=path, fallback_reason=fallback_reason,
+                 duration_ms=round(duration * 1000, 2),
+                 stages_ms={name: round(seconds * 1000, 2) for name, seconds in timings.items()},
+                 **fields)
+    annotate(**{'detect.path': path, 'detect.fallback_reason': fallback_reason},
+             **{f'detect.{name}': value for name, value in fields.items()})
+    logger.info("Detection %s: %s detections in %.1fms", path, fields.get('detections', 0),
+                duration * 1000, extra={'event': event})
+
+
+class DetectInputError(Exception):
+    def __init__(self, message, status=400, **fields):
+        super().__init__(message)
+        self.status = status
+        self.fields = fields
+
+
+def get_image_cache():
+    """Images received as bytes, by SHA-256 (created on first use)"""
+    global image_cache
+    if image_cache is None:
+        with _image_cache_lock:
+            if image_cache is None:
+                from image_cache import ImageCache
+                image_cache = ImageCache(int(IMAGE_CACHE_MB * MB))
+    return image_cache
+
+
+def received_image(data, name):
+    """Decode the bytes of an uploaded image in memory and cache it under its SHA-256"""
+    from image_source import EncodedImage
+    if not data:
+        raise DetectInputError(f'{name} is empty')
+    if len(data) > MAX_IMAGE_MB * MB:
+        raise DetectInputError(f'{name} is larger than {MAX_IMAGE_MB:g}MB', 413)
+    image = EncodedImage(data, name=name)
+    with stage('decode'):
+        decoded = image.decode()
+    if decoded is None:
+        raise DetectInputError(f'Could not decode {name}')
+    return get_image_cache().put(image)
+
+
+def image_by_hash(sha256):
+    """EncodedImage for a hash sent before or found in the uploads catalog (None if unknown)"""
+    sha256 = sha256.strip().lower()
+    image = get_image_cache().get(sha256)
+    if image is not None or not HASH_LOOKUP_UPLOADS:
+        return image
+    from image_source import EncodedImage
+    from uploads_catalog import open_catalog
+    for entry in open_catalog().find_by_hash(sha256):
+        try:
+            with open(entry['path'], 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        image = EncodedImage(data, name=os.path.basename(entry['path']))
+        # A file changed since it was indexed is not the image the client means
+        if image.sha256 == sha256:
+            return get_image_cache().put(image)
+    return None
+
+
+def detect_inputs():
+    """
+    Parameters and images of a /api/detect request, in one of four input modes:
+        path       JSON with inspection_image_path / baseline_image_path (shared filesystem)
+        sha256     JSON with inspection_image_sha256 / baseline_image_sha256
+        multipart  form files inspection_image / baseline_image, fields as form values
+        raw        the inspection image as the body (Content-Type image/*), fields in the query
+    Each image resolves on its own - received bytes, else its *_sha256, else its *_path - so
+    the modes mix per image (e.g. a raw inspection plus a baseline_image_sha256, or an
+    inspection path plus a baseline hash). mode names how the request was sent.
+
+    Returns:
+        tuple: (params, inspection, baseline, mode) - images are paths or EncodedImage
+    Raises:
+        DetectInputError: Missing, unreadable or unknown images
+    """
+    if request.mimetype == 'multipart/form-data':
+        mode, params = 'multipart', request.form.to_dict()
+        files = {name: request.files.get(name) for name in ('inspection_image', 'image', 'baseline_image')}
+        inspection_file = files['inspection_image'] or files['image']
+        inspection = received_image(inspection_file.read(), inspection_file.filename or 'inspection_image') \
+            if inspection_file else None
+        baseline = received_image(files['baseline_image'].read(), files['baseline_image'].filename or 'baseline_image') \
+            if files['baseline_image'] else None
+    elif request.mimetype in RAW_IMAGE_TYPES:
+        mode, params = 'raw', request.args.to_dict()
+        inspection, baseline = received_image(request.get_data(cache=False), 'inspection_image'), None
+    else:
+        params = request.get_json(silent=True)
+        if not params:
+            raise DetectInputError('No JSON data provided')
+        mode, inspection, baseline = 'path', None, None
+
+    images, unknown = {'inspection': inspection, 'baseline': baseline}, []
+    for role, image in images.items():
+        sha256 = params.get(f'{role}_image_sha256')
+        if image is not None or not sha256:
+            continue
+        images[role] = image_by_hash(sha256)
+        if images[role] is None:
+            unknown.append(sha256)
+        elif mode == 'path':
+            mode = 'sha256'
+    if unknown:
+        raise DetectInputError('Unknown image hash - send the image bytes instead', 404, unknown_sha256=unknown)
+
+    # Shared-filesystem paths for whatever was neither sent nor named by hash
+    inspection = (images['inspection'] or params.get('inspection_image_path')
+                  or params.get('image_path'))  # backward compatibility
+    baseline = images['baseline'] or params.get('baseline_image_path')
+    if inspection is None:
+        raise DetectInputError('inspection_image_path is required' if mode == 'path' else
+                               'An inspection image is required (inspection_image or inspection_image_sha256)')
+
+    if mode in ('multipart', 'raw'):
+        # Form and query values are strings
+        if 'confidence_threshold' in params:
+            try:
+                params['confidence_threshold'] = float(params['confidence_threshold'])
+            except ValueError:
+                raise DetectInputError('confidence_threshold must be a number')
+        if 'change_guided' in params:
+            params['change_guided'] = params['change_guided'].lower() in ('1', 'true', 'yes')
+    return params, inspection, baseline, mode
+
+
+def image_hashes(inspection, baseline):
+    """SHA-256 of the images received in memory, for the client to send instead next time"""
+    return {role: image.sha256 for role, image in (('inspection', inspection), ('baseline', baseline))
+            if hasattr(image, 'sha256')}
+
+
+def detect_body(response, fmt, hashes=None):
+    """Serialize a detect response in the negotiated format (response_format.py)"""
+    if hashes:
+        response['image_sha256'] = hashes
+    with stage('serialization'):
+        if fmt == response_format.JSON:
+            body = jsonify(response)
+        else:
+            data, mimetype = response_format.encode(response, fmt)
+            body = Response(data, mimetype=mimetype)
+    body.headers['Vary'] = 'Accept'
+    return body
+
+
 @app.route('/api/detect', methods=['POST'])
 def detect_anomalies():
     """
@@ -219,9 +750,17 @@ def detect_anomalies():
     {
         "inspection_image_path": "/absolute/path/to/inspection.jpg",
         "baseline_image_path": "/absolute/path/to/baseline.jpg",  // optional but recommended
-        "confidence_threshold": 0.25  # threshold as decimal (0.0-1.0)
+        "confidence_threshold": 0.25,  # threshold as decimal (0.0-1.0)
+        "change_guided": true  # optional - run YOLO only on regions changed vs baseline
     }
     
+    Without a shared filesystem the images can be sent as bytes instead (multipart files
+    inspection_image / baseline_image, or a raw image body) or referenced by the
+    inspection_image_sha256 / baseline_image_sha256 returned for bytes sent before (detect_inputs)
+    
+    Response format: ?format=json|columnar|msgpack or the Accept header (response_format.py);
+    the compact formats carry detections as parallel arrays without static metadata
+    
     Response JSON:
     {
         "success": true,
@@ -232,100 +771,105 @@ def detect_anomalies():
         "similarity_analysis": {...}
     }
     """
+    request_start = time.perf_counter()
+    DETECT_IN_FLIGHT.inc()
+    timings = start_stage_timings()
+    held_image_bytes = 0
     try:
-        # Parse request
-        data = request.json
-        if not data:
+        try:
+            fmt = response_format.negotiate(request)
+        except response_format.UnsupportedFormat as e:
             return jsonify({
                 'success': False,
-                'error': 'No JSON data provided'
+                'error': str(e)
             }), 400
         
-        # Get parameters
-        inspection_image_path = data.get('inspection_image_path') or data.get('image_path')  # backward compatibility
-        logger.info(f"[DEBUG] Received inspection_image_path: {inspection_image_path}")
-        if inspection_image_path:
-            logger.info(f"[DEBUG] File exists: {os.path.exists(inspection_image_path)}")
-        baseline_image_path = data.get('baseline_image_path')
-        confidence_threshold = data.get('confidence_threshold', 0.25)
-        
-        # Debug prints
-        logger.info("SIMILARITY-BASED ANOMALY DETECTION")
-        logger.info(f"Inspection Image: {inspection_image_path}")
-        logger.info(f"Baseline Image: {baseline_image_path}")
-        logger.info(f"Confidence Threshold: {confidence_threshold}")
-        
-        if not inspection_image_path:
+        try:
+            data, inspection_image, baseline_image, input_mode = detect_inputs()
+        except DetectInputError as e:
             return jsonify({
                 'success': False,
-                'error': 'inspection_image_path is required'
-            }), 400
+                'error': str(e),
+                **e.fields
+            }), e.status
+        from image_source import image_name, is_in_memory, load_image, model_source
+        
+        # Get parameters
+        confidence_threshold = data.get('confidence_threshold', 0.25)
+        inspection_label = image_name(inspection_image) if is_in_memory(inspection_image) else inspection_image
+        baseline_label = image_name(baseline_image) if is_in_memory(baseline_image) else baseline_image
+        logger.debug("Detect request (%s): inspection=%s baseline=%s confidence_threshold=%s", input_mode,
+                     inspection_label, baseline_label, confidence_threshold)
+        annotate(**{'inspection.image': inspection_label, 'baseline.image': baseline_label,
+                    'detect.input': input_mode, 'detect.confidence_threshold': confidence_threshold})
         
-        # Verify inspection image exists
-        inspection_file = Path(inspection_image_path)
-        if not inspection_file.exists():
-            logger.error(f"Inspection image not found: {inspection_image_path}")
+        # Verify inspection image exists (images received in memory need no filesystem)
+        if not is_in_memory(inspection_image) and not Path(inspection_image).exists():
+            logger.error("Inspection image not found: %s", inspection_image)
             return jsonify({
                 'success': False,
-                'error': f'Inspection image file not found: {inspection_image_path}'
+                'error': f'Inspection image file not found: {inspection_image}'
             }), 404
         
         # Verify baseline image if provided
-        if baseline_image_path:
-            baseline_file = Path(baseline_image_path)
-            if not baseline_file.exists():
-                logger.warning(f"Baseline image not found: {baseline_image_path}")
-                baseline_image_path = None
-            else:
-                logger.info(f"Baseline image found: {baseline_image_path}")
-        
-        # Read inspection image to get dimensions
-        img = cv2.imread(str(inspection_file))
+        if baseline_image and not is_in_memory(baseline_image) and not Path(baseline_image).exists():
+            logger.warning("Baseline image not found: %s", baseline_image)
+            baseline_image = None
+        
+        # Read inspection image to get dimensions (in-memory images keep the decoding for the pipeline)
+        with stage('decode'):
+            img = load_image(inspection_image)
         if img is None:
-            logger.error(f"[DEBUG] cv2.imread returned None for: {inspection_image_path}")
+            logger.error("Could not read inspection image: %s", inspection_label)
             return jsonify({
                 'success': False,
-                'error': f'Could not read inspection image: {inspection_image_path}'
+                'error': f'Could not read inspection image: {inspection_label}'
             }), 400
-        else:
-            logger.info(f"[DEBUG] cv2.imread shape: {img.shape if img is not None else None}")
         height, width = img.shape[:2]
-        logger.info(f"Image dimensions: {width}x{height}")
+        # Decoded pixels held while the request runs (the similarity path decodes the pair again)
+        held_image_bytes = img.nbytes * (3 if baseline_image else 1)
+        MEMORY.add('inflight_images', held_image_bytes)
         
-        import time
         start_time = time.time()
         
         # Choose inference method based on baseline availability
-        if baseline_image_path and SIMILARITY_SYSTEM_AVAILABLE:
-            # Use similarity-based YOLO system
-            logger.info("SIMILARITY-BASED YOLO MODE")
-            logger.info("Running advanced comparison analysis...")
+        fallback_reason = None
+        if not baseline_image:
+            fallback_reason = 'no_baseline'
+        elif not SIMILARITY_SYSTEM_AVAILABLE:
+            fallback_reason = 'similarity_unavailable'
         else:
-            if not baseline_image_path:
-                logger.info("SINGLE IMAGE MODE - No baseline image provided")
-            if not SIMILARITY_SYSTEM_AVAILABLE:
-                logger.warning("SINGLE IMAGE MODE - Similarity system not available")
-            
+            # Use similarity-based YOLO system
             try:
                 # Initialize similarity system if needed
                 sim_system = load_similarity_system()
                 # Run similarity-based analysis (disable visualization to prevent GUI threading issues)
-                results = sim_system.analyze_image_pair(
-                    baseline_image_path,  # reference image
-                    inspection_image_path,  # target image
-                    verbose=False  # Disable verbose to avoid matplotlib GUI issues in Flask
-                )
+                with span('analyze_image_pair'):
+                    results = sim_system.analyze_image_pair(
+                        baseline_image,  # reference image
+                        inspection_image,  # target image
+                        verbose=False,  # Disable verbose to avoid matplotlib GUI issues in Flask
+                        change_guided=data.get('change_guided')  # None -> service default
+                    )
                 # Extract detections from similarity system results
                 detections = []
                 yolo_analysis = results.get('yolo_analysis', {})
                 target_detections = yolo_analysis.get('target_detections', [])
+                change_guided_run = yolo_analysis.get('mode') == 'change_guided'
+                if change_guided_run:
+                    logger.debug("Change-guided ROI inference: %d regions, changed fraction %.3f",
+                                 len(yolo_analysis.get('change_regions', [])),
+                                 yolo_analysis.get('changed_fraction', 0.0))
                 if target_detections:
-                    logger.info(f"Similarity system found {len(target_detections)} detections")
                     for detection in target_detections:
                         conf = detection['confidence']
                         if conf >= confidence_threshold:
                             class_name = detection.get('className', detection.get('class_name', 'unknown'))
+                            # CleanThermalDetector boxes are [x1, y1, x2, y2] lists
                             bbox = detection['bbox']
+                            if isinstance(bbox, dict):
+                                bbox = [bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2']]
+                            x1, y1, x2, y2 = (int(v) for v in bbox)
                             class_id = None
                             for cid, cname in CLASS_NAMES.items():
                                 if cname.lower() == class_name.lower():
@@ -343,19 +887,20 @@ def detect_anomalies():
                                 'className': CLASS_NAMES.get(class_id, class_name),
                                 'confidence': round(conf, 3),
                                 'bbox': {
-                                    'x1': bbox['x1'],
-                                    'y1': bbox['y1'],
-                                    'x2': bbox['x2'],
-                                    'y2': bbox['y2']
+                                    'x1': x1,
+                                    'y1': y1,
+                                    'x2': x2,
+                                    'y2': y2
                                 },
                                 'color': CLASS_COLORS.get(class_id, [255, 255, 255]),
                                 'source': 'similarity_ai'
                             }
                             detections.append(detection_obj)
-                            logger.info(f"Detection: {detection_obj['className']} @ ({bbox['x1']},{bbox['y1']},{bbox['x2']},{bbox['y2']}) conf={conf:.3f}")
-                else:
-                    logger.warning("No detections found by similarity system - falling back to standard YOLO detection")
-                    # Fallback to standard YOLO detection
+                            logger.debug("Detection: %s @ (%s,%s,%s,%s) conf=%.3f", detection_obj['className'],
+                                         x1, y1, x2, y2, conf)
+                elif not change_guided_run:
+                    # Fallback to standard YOLO detection (no change regions is a valid empty result)
+                    fallback_reason = 'no_detections'
                     raise Exception("No detections from similarity system")
                 # Calculate inference time
                 inference_time = (time.time() - start_time) * 1000
@@ -372,65 +917,68 @@ def detect_anomalies():
                     'model_info': {
                         'type': 'SimilarityBasedYOLO',
                         'classes': CLASS_NAMES,
-                        'engine': 'similarity_yolo_system.py'
+                        'engine': 'similarity_yolo_system.py',
+                        'version': model_provider.version
                     },
                     'similarity_analysis': {
-                        'is_similar': similarity_data.get('is_similar', False),
-                        'confidence': similarity_data.get('confidence', 0.0),
+                        # The matcher and region comparison return NumPy scalars
+                        'is_similar': bool(similarity_data.get('is_similar', False)),
+                        'confidence': float(similarity_data.get('confidence', 0.0)),
                         'method': similarity_data.get('best_method', 'unknown'),
-                        'change_detected': combined_data.get('significant_change', False),
-                        'change_magnitude': combined_data.get('change_magnitude', 0.0)
+                        'change_detected': bool(combined_data.get('significant_change', False)),
+                        'change_magnitude': float(combined_data.get('change_magnitude', 0.0)),
+                        'detection_mode': yolo_analysis.get('mode', 'full_frame')
                     }
                 }
-                logger.info(f"Similarity-based detection completed: {len(detections)} anomalies found in {inference_time:.1f}ms")
-                logger.info(f"   Similarity: {similarity_data.get('confidence', 0.0):.1%}, Change detected: {combined_data.get('significant_change', False)}")
-                return jsonify(response), 200
+                body = detect_body(response, fmt, image_hashes(inspection_image, baseline_image))
+                finish_detect_request('similarity', request_start, timings,
+                                      detections=len(detections), image=f"{width}x{height}", format=fmt, input=input_mode,
+                                      model_version=model_provider.version,
+                                      detection_mode=response['similarity_analysis']['detection_mode'],
+                                      similarity=round(response['similarity_analysis']['confidence'], 4),
+                                      change_detected=response['similarity_analysis']['change_detected'])
+                return body, 200
             except Exception as e:
-                logger.error(f"Similarity system failed or returned no detections, running standard YOLO: {e}")
+                if fallback_reason is None:
+                    fallback_reason = 'exception'
+                    logger.error("Similarity system failed, running standard YOLO: %s", e)
                 # Fallback to single image detection below
         
         # Fallback: Single image inference (when no baseline or similarity system failed)
-        logger.info("SINGLE IMAGE INFERENCE MODE")
-        logger.info("Using standard YOLOv8 detection...")
-        
-        # Load standard model
         model = load_model()
-        logger.info(f"[INFERENCE] Using model file: {MODEL_PATH}")
-
-        # Run YOLOv8 inference
-        logger.info(f"Running YOLOv8 inference with confidence threshold: {confidence_threshold}")
-        results = model(str(inspection_file), conf=confidence_threshold, verbose=False)
+        logger.debug("Standard YOLO inference (%s): model %s, confidence threshold %s",
+                     fallback_reason, model_provider.version, confidence_threshold)
+        with stage('yolo_forward'):
+            results = model(model_source(inspection_image), conf=confidence_threshold, verbose=False)
         result = results[0]
 
         # Process detections
-        detections = []
-        boxes = result.boxes
-
-        if boxes is not None and len(boxes) > 0:
-            logger.info(f"[DEBUG] Found {len(boxes)} detections")
-            for i, box in enumerate(boxes):
-                conf = float(box.conf[0].cpu().numpy())
-                cls = int(box.cls[0].cpu().numpy())
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int).tolist()
-                detection_obj = {
-                    'id': str(uuid.uuid4()),
-                    'classId': cls,
-                    'className': CLASS_NAMES.get(cls, f'Class_{cls}'),
-                    'confidence': round(conf, 3),
-                    'bbox': {
-                        'x1': x1,
-                        'y1': y1,
-                        'x2': x2,
-                        'y2': y2
-                    },
-                    'color': CLASS_COLORS.get(cls, [255, 255, 255]),
-                    'source': 'ai'
-                }
-                detections.append(detection_obj)
-                logger.info(f"Detection: {detection_obj['className']} @ ({x1},{y1},{x2},{y2}) conf={conf:.3f}")
-        else:
-            logger.info(f"[DEBUG] No anomalies detected. Boxes: {boxes}")
-            print(f"RESULT: No detections found for {Path(inspection_image_path).name}")
+        with stage('postprocess'):
+            detections = []
+            boxes = result.boxes
+
+            if boxes is not None and len(boxes) > 0:
+                for i, box in enumerate(boxes):
+                    conf = float(box.conf[0].cpu().numpy())
+                    cls = int(box.cls[0].cpu().numpy())
+                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int).tolist()
+                    detection_obj = {
+                        'id': str(uuid.uuid4()),
+                        'classId': cls,
+                        'className': CLASS_NAMES.get(cls, f'Class_{cls}'),
+                        'confidence': round(conf, 3),
+                        'bbox': {
+                            'x1': x1,
+                            'y1': y1,
+                            'x2': x2,
+                            'y2': y2
+                        },
+                        'color': CLASS_COLORS.get(cls, [255, 255, 255]),
+                        'source': 'ai'
+                    }
+                    detections.append(detection_obj)
+                    logger.debug("Detection: %s @ (%s,%s,%s,%s) conf=%.3f",
+                                 detection_obj['className'], x1, y1, x2, y2, conf)
 
         # Calculate inference time
         inference_time = (time.time() - start_time) * 1000
@@ -446,28 +994,41 @@ def detect_anomalies():
             'inference_time_ms': round(inference_time, 2),
             'model_info': {
                 'type': 'YOLOv8',
-                'classes': CLASS_NAMES
+                'classes': CLASS_NAMES,
+                'version': model_provider.version
             }
         }
 
-        logger.info(f"Standard detection completed: {len(detections)} anomalies found in {inference_time:.1f}ms")
-
-        return jsonify(response), 200
+        body = detect_body(response, fmt, image_hashes(inspection_image, baseline_image))
+        finish_detect_request('exception_fallback' if fallback_reason == 'exception' else 'fallback',
+                              request_start, timings, fallback_reason,
+                              detections=len(detections), image=f"{width}x{height}", format=fmt, input=input_mode,
+                              model_version=model_provider.version)
+        return body, 200
 
     except Exception as e:
         logger.error(f"Error during detection: {e}", exc_info=True)
+        finish_detect_request('error', request_start, timings, error=str(e))
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
+    finally:
+        stop_stage_timings()
+        DETECT_IN_FLIGHT.dec()
+        MEMORY.sub('inflight_images', held_image_bytes)
+        if image_cache is not None:
+            image_cache.trim()  # Decodings made by this request count against the budget now
 
 
 @app.route('/api/classes', methods=['GET'])
 def get_classes():
-    """Get available detection classes"""
+    """Get available detection classes (the static metadata left out of compact detect responses)"""
     return jsonify({
         'classes': CLASS_NAMES,
-        'count': len(CLASS_NAMES)
+        'colors': CLASS_COLORS,
+        'count': len(CLASS_NAMES),
+        'formats': response_format.available_formats()
     })
 
 
@@ -537,18 +1098,34 @@ def should_trigger_auto_finetune(feedback_data):
         return False
 
 
-def trigger_auto_finetune(inspection_number, feedback_data=None):
+def trigger_auto_finetune(inspection_number, feedback_data=None, on_stage=None):
     """
     Trigger automatic fine-tuning using enhanced dataset creation
     
     Args:
         inspection_number: The inspection number to create dataset for
         feedback_data: The actual feedback data from the current upload
+        on_stage: Optional callback(stage=...) used by the feedback job worker; when
+                  given, training runs in the caller's thread so the job tracks it
         
     Returns:
         dict: Result of the auto fine-tuning process
     """
     try:
+        if STUB_MODEL:
+            # No upload images or weights to build a dataset from: go straight to the
+            # training stand-in so load tests still see a fine-tune competing for the CPU
+            dataset_name = f"stub_feedback_{inspection_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            if on_stage is not None:
+                on_stage(stage='training', datasetName=dataset_name)
+            return {
+                'status': 'success',
+                'message': 'Stub fine-tuning started',
+                'datasetPath': None,
+                'datasetName': dataset_name,
+                'trainingResult': start_yolo_training(None, inspection_number, background=on_stage is None)
+            }
+        
         if not DATASET_CREATOR_AVAILABLE:
             return {
                 'status': 'error',
@@ -558,24 +1135,39 @@ def trigger_auto_finetune(inspection_number, feedback_data=None):
         logger.info(f"Starting auto fine-tuning for inspection: {inspection_number}")
         
         # Create dataset directly from current feedback data
+        try:
+            from targeted_dataset_creator import TargetedDatasetCreator
+        except ImportError as e:
+            logger.warning(f"Could not import dataset creator: {e}")
+            return {
+                'status': 'error',
+                'error': f'Dataset creator not available: {e}'
+            }
         dataset_creator = TargetedDatasetCreator()
         
         # Generate unique dataset name
-        from datetime import datetime
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         dataset_name = f"auto_feedback_{inspection_number}_{timestamp}"
         
-        # Create dataset directly from the current feedback data
-        dataset_path = dataset_creator.create_dataset_from_current_feedback(
+        # Add the feedback to the training corpus and build an incremental replay dataset
+        dataset_path = dataset_creator.create_dataset_from_corpus(
             inspection_number=inspection_number,
             dataset_name=dataset_name,
             feedback_data=feedback_data  # Pass the actual feedback data
         )
         
+        if dataset_path is None:
+            return {
+                'status': 'skipped',
+                'message': 'Feedback adds no new training samples (already in the training corpus with the same labels)'
+            }
+        
         logger.info(f"Enhanced dataset created at: {dataset_path}")
         
         # Start YOLO training in background
-        training_result = start_yolo_training(dataset_path, inspection_number)
+        if on_stage is not None:
+            on_stage(stage='training', datasetName=dataset_name)
+        training_result = start_yolo_training(dataset_path, inspection_number, background=on_stage is None)
         
         return {
             'status': 'success',
@@ -593,13 +1185,15 @@ def trigger_auto_finetune(inspection_number, feedback_data=None):
         }
 
 
-def start_yolo_training(dataset_path, inspection_number):
+def start_yolo_training(dataset_path, inspection_number, background=True):
     """
     Start YOLO training with the enhanced dataset
     
     Args:
         dataset_path: Path to the enhanced dataset
         inspection_number: The inspection number
+        background: Train in a separate thread; False trains in the caller's thread
+                    (the feedback job worker) and reports the outcome
         
     Returns:
         dict: Training initiation result
@@ -610,18 +1204,21 @@ def start_yolo_training(dataset_path, inspection_number):
         from datetime import datetime
         
         # Get the dataset.yaml path
-        dataset_yaml = os.path.join(dataset_path, 'dataset.yaml')
+        dataset_yaml = os.path.join(dataset_path, 'dataset.yaml') if dataset_path else None
         
         # Generate model name
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         model_name = f"enhanced_{inspection_number}_{timestamp}"
         
-        # Find the current best model to fine-tune from
-        base_model_path = None
-        for model_path in MODEL_PATHS:
-            if os.path.exists(model_path):
-                base_model_path = model_path
-                break
+        # Continue from the weights being served (the previous fine-tune), so each run
+        # only has to learn the new corpus samples
+        base_model_path = model_provider.model_path
+        if not base_model_path:
+            try:
+                from model_provider import resolve_model_path
+                base_model_path = resolve_model_path(model_provider.model_dir)
+            except FileNotFoundError:
+                base_model_path = None
         
         if not base_model_path:
             base_model_path = 'yolov8n.pt'
@@ -630,6 +1227,7 @@ def start_yolo_training(dataset_path, inspection_number):
             logger.info(f"Will fine-tune from existing model: {base_model_path}")
         
         logger.info(f"Starting YOLO fine-tuning with ultralytics for model: {model_name}")
+        outcome = {}
         
         def run_training():
             """Run fine-tuning in background thread using existing YOLOv8p2 model"""
@@ -645,33 +1243,98 @@ def start_yolo_training(dataset_path, inspection_number):
                 logger.info(f"Base model: {base_model_path}")
                 logger.info(f"Dataset: {dataset_yaml}")
                 
+                # In-memory corpus runs render augmented variants in the dataloader
+                from training_corpus import RUN_MANIFEST, is_in_memory_manifest
+                train_kwargs = {}
+                if is_in_memory_manifest(os.path.join(dataset_path, RUN_MANIFEST)):
+                    from feedback_dataset import FeedbackTrainer
+                    train_kwargs['trainer'] = FeedbackTrainer
+                
+                budget = {'started': time.time(), 'stopped': False}
+                if FINETUNE_MAX_MINUTES > 0:
+                    model.add_callback('on_fit_epoch_end', finetune_budget_callback(FINETUNE_MAX_MINUTES * 60, budget))
+                
                 # Fine-tune the model (shorter training for fine-tuning)
                 results = model.train(
                     data=dataset_yaml,
-                    epochs=50,   # Much fewer epochs for fine-tuning
+                    epochs=FINETUNE_EPOCHS,  # Short incremental run over new + replayed samples
                     imgsz=640,
                     batch=8,     # Smaller batch for stability
                     name=model_name,
-                    patience=3,  # Early stopping for fine-tuning
+                    patience=FINETUNE_PATIENCE,  # Early stopping on held-out validation mAP
                     lr0=0.0001,  # Lower learning rate for fine-tuning
                     save=True,
                     verbose=True,
-                    resume=False  # Start fine-tuning, don't resume
+                    resume=False,  # Start fine-tuning, don't resume
+                    **train_kwargs
                 )
                 
                 logger.info(f"✅ YOLO fine-tuning completed successfully for {model_name}")
                 logger.info(f"Fine-tuning results: {results}")
+                outcome.update(training_outcome(model.trainer, budget))
+                logger.info(f"Fine-tuning outcome: {outcome}")
+                
+                # Drop the trainer (optimizer, EMA, dataloaders) before the new weights load
+                model = None
+                results = None
+                release_memory()
                 
                 # Update model paths to use the new fine-tuned model
-                update_model_path_after_training(model_name, dataset_path)
+                return update_model_path_after_training(model_name, dataset_path, outcome)
                     
             except Exception as e:
                 logger.error(f"❌ Error during YOLO training for {model_name}: {e}")
                 import traceback
                 logger.error(f"Training traceback: {traceback.format_exc()}")
+                return False
+        
+        def run_stub_training():
+            """Stub mode: CPU-bound stand-in for model.train(), then a model swap"""
+            import numpy as np
+            from stub_model import StubYOLO
+            
+            started = time.time()
+            epochs = max(1, FINETUNE_EPOCHS)
+            weights = np.random.default_rng(0).random((256, 256), dtype=np.float32)
+            for epoch in range(epochs):
+                epoch_end = started + STUB_FINETUNE_SECONDS * (epoch + 1) / epochs
+                while time.time() < epoch_end:
+                    weights = np.tanh(weights @ weights.T / 256)
+            outcome.update({
+                'epochs': epochs,
+                'best_epoch': epochs,
+                'val_map50': None,
+                'val_map': None,
+                'train_seconds': round(time.time() - started, 1),
+                'stop_reason': 'epoch_budget'
+            })
+            logger.info(f"Stub fine-tuning completed for {model_name}: {outcome}")
+            model_provider.install(StubYOLO(latency_ms=STUB_LATENCY_MS), f"stub-{model_name}")
+            return True
+        
+        run = run_stub_training if STUB_MODEL else run_training
+        
+        def train():
+            try:
+                with accounted_training(model_name):
+                    return run()
+            finally:
+                # Trained or failed, the run's dataset is not needed any more
+                discard_training_dataset(dataset_path)
+        
+        if not background:
+            trained = train()
+            return {
+                'status': 'completed' if trained else 'error',
+                'message': f'Fine-tuning {"completed" if trained else "failed"} for model: {model_name}',
+                'modelName': model_name,
+                'baseModel': base_model_path,
+                'servedModel': model_provider.version if trained else None,
+                'training': outcome or None
+            }
         
         # Start training in background thread
-        training_thread = threading.Thread(target=run_training, daemon=True)
+        training_thread = threading.Thread(target=train, name='finetune', daemon=True)
         training_thread.start()
         
         return {
@@ -684,22 +1347,77 @@ def start_yolo_training(dataset_path, inspection_number):
         
     except Exception as e:
         logger.error(f"Error starting YOLO training: {e}")
+        discard_training_dataset(dataset_path)
         return {
             'status': 'error',
             'error': str(e)
         }
 
 
-def update_model_path_after_training(model_name):
+def discard_training_dataset(dataset_path):
+    """Delete a fine-tune dataset directory, release its dataset:<run> blob references and reclaim unused blobs"""
+    if not dataset_path or not os.path.exists(dataset_path):
+        return
+    try:
+        from training_corpus import open_corpus
+        open_corpus().discard_dataset(dataset_path)
+        logger.info(f"Deleted fine-tune dataset: {dataset_path}")
+    except Exception as e:
+        logger.warning(f"Could not delete fine-tune dataset: {e}")
+
+
+def finetune_budget_callback(max_seconds, budget):
+    """
+    Ultralytics on_fit_epoch_end callback enforcing a wall-clock budget
+
+    Stops after the current epoch when one more epoch at the average pace so far
+    would overrun max_seconds (early stopping on validation mAP runs alongside).
+    """
+    def on_fit_epoch_end(trainer):
+        elapsed = time.time() - budget['started']
+        projected = elapsed + elapsed / (trainer.epoch + 1)
+        if projected > max_seconds and not trainer.stop:
+            budget['stopped'] = True
+            trainer.stop = True
+            logger.info(f"Fine-tune time budget reached after epoch {trainer.epoch + 1} "
+                        f"({elapsed:.0f}s of {max_seconds:.0f}s)")
+    return on_fit_epoch_end
+
+
+def training_outcome(trainer, budget):
+    """Epochs, best epoch, validation mAP and duration of a finished fine-tune"""
+    metrics = getattr(trainer, 'metrics', None) or {}
+    stopper = getattr(trainer, 'stopper', None)
+    epochs = trainer.epoch + 1
+    if budget.get('stopped'):
+        stop_reason = 'time_budget'
+    elif epochs < trainer.epochs:
+        stop_reason = 'early_stopping'
+    else:
+        stop_reason = 'epoch_budget'
+    return {
+        'epochs': epochs,
+        'best_epoch': stopper.best_epoch + 1 if stopper is not None else None,
+        'val_map50': metrics.get('metrics/mAP50(B)'),
+        'val_map': metrics.get('metrics/mAP50-95(B)'),
+        'train_seconds': round(time.time() - budget['started'], 1),
+        'stop_reason': stop_reason
+    }
+
+
+def update_model_path_after_training(model_name, dataset_path=None, metrics=None):
     """
     Update the global model path to use newly trained model
-    
+
     Args:
         model_name: Name of the newly trained model
+        dataset_path: Dataset the run trained on (committed to the training corpus)
+        metrics: Validation metrics of the run, recorded with the corpus commit
+
+    Returns:
+        bool: True if the new weights were installed
     """
-def update_model_path_after_training(model_name, dataset_path=None):
     try:
-        import shutil
         # Look for the trained model
         possible_paths = [
             f"../Faulty_Detection/runs/detect/{model_name}/weights/best.pt",
@@ -709,25 +1427,41 @@ def update_model_path_after_training(model_name, dataset_path=None):
         from datetime import datetime
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         dest_path = os.path.join(dest_dir, f'yolov8p2_{timestamp}.pt')
+        from onnx_backend import export_onnx, INFERENCE_BACKEND
         for path in possible_paths:
             if os.path.exists(path):
-                shutil.copy2(path, dest_path)
-                logger.info(f"Copied best model to: {dest_path}")
-                # Delete the fine-tune dataset directory
-                try:
-                    import shutil as _shutil
-                    if dataset_path and os.path.exists(dataset_path):
-                        _shutil.rmtree(dataset_path)
-                        logger.info(f"Deleted fine-tune dataset: {dataset_path}")
-                except Exception as del_err:
-                    logger.warning(f"Could not delete fine-tune dataset: {del_err}")
-                global MODEL_PATH
-                MODEL_PATH = dest_path
-                logger.info(f"Updated MODEL_PATH to newly trained model: {dest_path}")
-                # Reload the model with new weights
-                global model
-                model = None  # Clear existing model
-                load_model()  # Reload with new path
+                # Register the weights by content; the registry entry is a link to the blob
+                from blob_store import open_blob_store
+                blobs = open_blob_store()
+                digest, link_mode = blobs.link_file(path, dest_path, owner=f"model:{Path(dest_path).stem}")
+                logger.info(f"Registered best model as {dest_path} ({link_mode} to blob {digest[:12]})")
+                # The run directory keeps best.pt as a link to the same blob; last.pt is not needed
+                blobs.link(digest, path, owner=f"run:{model_name}")
+                last_path = os.path.join(os.path.dirname(path), 'last.pt')
+                if os.path.exists(last_path):
+                    os.remove(last_path)
+                # Export the ONNX serving artifact now so the reload below does not pay for it
+                if INFERENCE_BACKEND != 'torch':
+                    try:
+                        export_onnx(dest_path, torch_setup=patch_torch_load)
+                    except Exception as export_err:
+                        logger.warning(f"ONNX export failed, model will be served with PyTorch: {export_err}")
+                if QUANTIZE_AFTER_FINETUNE and INFERENCE_BACKEND != 'torch':
+                    quantize_after_training(dest_path, dataset_path)
+                # The corpus samples of this run are trained now; later runs replay them
+                if dataset_path:
+                    try:
+                        from training_corpus import open_corpus
+                        open_corpus().commit_run(dataset_path, model=dest_path, metrics=metrics)
+                    except Exception as corpus_err:
+                        logger.warning(f"Could not commit training corpus run: {corpus_err}")
+                # Swap in the new weights; the similarity detector follows the provider and
+                # drops its reference to the old model now, so the provider's release frees it
+                version = model_provider.reload(dest_path)
+                if similarity_system is not None:
+                    similarity_system.yolo_detector._ensure_model()
+                    release_memory()
+                logger.info(f"Now serving newly trained model: {version['version_id']}")
                 return True
         logger.warning(f"Could not find trained model for {model_name}")
         return False
@@ -736,12 +1470,109 @@ def update_model_path_after_training(model_name, dataset_path=None):
         return False
 
 
+def quantize_after_training(weights_path, dataset_path=None):
+    """
+    Build and validate the INT8 variant for freshly fine-tuned weights
+
+    Validates on ML_QUANT_VALIDATION_DATASET when configured, otherwise on the
+    fine-tune dataset's held-out images/val. Without either, quantization is skipped:
+    an unvalidated variant would never be accepted (and in-memory runs have no
+    images/train to fall back to).
+    """
+    try:
+        from int8_quantization import quantize_and_register, VALIDATION_DATASET, VALIDATION_SPLIT
+        if VALIDATION_DATASET:
+            validation_dataset, split = VALIDATION_DATASET, VALIDATION_SPLIT
+        elif dataset_path and os.path.isdir(os.path.join(dataset_path, 'images', 'val')):
+            validation_dataset, split = dataset_path, 'val'
+        else:
+            logger.info("INT8 quantization skipped: the training corpus has no held-out validation "
+                        "samples yet and ML_QUANT_VALIDATION_DATASET is not set")
+            return
+        manifest = quantize_and_register(weights_path, validation_dataset, split,
+                                         torch_setup=patch_torch_load)
+        if manifest['accepted']:
+            logger.info(f"INT8 variant registered: {manifest['int8_model']}")
+        else:
+            logger.warning(f"INT8 variant not registered: {manifest.get('reason')}")
+    except Exception as e:
+        logger.warning(f"INT8 quantization failed, FP32 model stays in service: {e}")
+
+
+def process_feedback_job(job, feedback_data, update):
+    """
+    Background stages of a feedback upload: persist -> evaluate -> dataset -> training
+    
+    Args:
+        job: Job record from the feedback queue
+        feedback_data: The uploaded feedback JSON
+        update: Callback journaling job progress
+    """
+    # Append the feedback to the store read by the dataset creator (re-uploads append,
+    # the newest upload of an inspection supersedes older ones; retries are idempotent)
+    update(stage='persist')
+    stored = get_feedback_store().append_upload(feedback_data, upload_id=job['job_id'],
+                                                received_at=job.get('created_at'))
+    feedback_ref = {'uploadId': stored['upload_id'], 'firstSeq': stored['first_seq'],
+                    'lastSeq': stored['last_seq']}
+    
+    # Optionally trigger auto fine-tuning if conditions are met
+    update(stage='evaluate', feedbackStore=feedback_ref)
+    inspection_number = feedback_data.get('inspectionNumber')
+    if not inspection_number or not should_trigger_auto_finetune(feedback_data):
+        return {
+            'state': 'skipped',
+            'feedbackStore': feedback_ref,
+            'reason': 'Auto fine-tuning not triggered'
+        }
+    
+    update(stage='dataset')
+    auto_finetune_result = trigger_auto_finetune(inspection_number, feedback_data, on_stage=update)
+    if auto_finetune_result.get('status') == 'skipped':
+        return {
+            'state': 'skipped',
+            'feedbackStore': feedback_ref,
+            'reason': auto_finetune_result['message']
+        }
+    if auto_finetune_result.get('status') == 'error':
+        raise Exception(auto_finetune_result.get('error', 'Auto fine-tuning failed'))
+    training_result = auto_finetune_result.get('trainingResult', {})
+    if training_result.get('status') == 'error':
+        raise Exception(training_result.get('error') or training_result.get('message', 'Training failed'))
+    
+    return {
+        'feedbackStore': feedback_ref,
+        'autoFineTuning': auto_finetune_result
+    }
+
+
+def get_feedback_store():
+    """Append-only feedback store (legacy feedback_*.json files are imported on first use)"""
+    from feedback_store import open_store
+    return open_store(str(FEEDBACK_DIR))
+
+
+def get_feedback_jobs():
+    """Durable feedback job queue (created on first use; recovers unfinished jobs)"""
+    global feedback_jobs
+    if feedback_jobs is None:
+        with _feedback_jobs_lock:
+            if feedback_jobs is None:
+                from feedback_jobs import FeedbackJobQueue
+                feedback_jobs = FeedbackJobQueue(str(FEEDBACK_DIR / 'jobs'), process_feedback_job)
+    return feedback_jobs
+
+
 @app.route('/api/feedback/upload', methods=['POST'])
 def upload_feedback():
     """
     Upload feedback data for model fine-tuning (Phase 3 - FR3.3)
     Accepts JSON feedback export from backend
     
+    The feedback is made durable and acknowledged with 202 and a job id; persisting,
+    fine-tune evaluation, dataset building and training run in the background.
+    Poll GET /api/feedback/jobs/<jobId> for progress.
+    
     Expected JSON format:
     {
         "inspectionId": "uuid",
@@ -764,57 +1595,25 @@ def upload_feedback():
             if field not in feedback_data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
-        # Create feedback storage directory
-        feedback_dir = Path('feedback_data')
-        feedback_dir.mkdir(exist_ok=True)
-        
-        # Save feedback with timestamp
         inspection_id = feedback_data['inspectionId']
-        feedback_file = feedback_dir / f"feedback_{inspection_id}.json"
-
-
+        job = get_feedback_jobs().submit(
+            feedback_data,
+            inspection_id=inspection_id,
+            inspection_number=feedback_data.get('inspectionNumber')
+        )
+        logger.info(f"Feedback for inspection {inspection_id} queued as job {job['job_id']}")
         
-        # Save feedback file
-        with open(feedback_file, 'w') as f:
-            json.dump(feedback_data, f, indent=2)
-
-        # Prepare summary for response
-        summary = feedback_data.get('summary', {})
-
-        # Optionally trigger auto fine-tuning if conditions are met
-        auto_finetune_result = None
-        inspection_number = feedback_data.get('inspectionNumber')
-        if inspection_number and should_trigger_auto_finetune(feedback_data):
-            auto_finetune_result = trigger_auto_finetune(inspection_number, feedback_data)
-
-        response_data = {
-            'status': 'success',
-            'message': 'Feedback data received successfully',
-            'inspectionId': inspection_id,
-            'feedbackFile': str(feedback_file),
-            'comparisonsCount': len(feedback_data.get('comparisons', [])),
-            'summary': summary,
-            'note': 'This data can be used for model fine-tuning. See feedback_data directory.'
-        }
-
-        if auto_finetune_result:
-            response_data['autoFineTuning'] = auto_finetune_result
-
-        return jsonify(response_data), 200
         response_data = {
-            'status': 'success',
-            'message': 'Feedback data received successfully',
+            'status': 'accepted',
+            'message': 'Feedback data received and queued for processing',
+            'jobId': job['job_id'],
+            'jobStatusUrl': f"/api/feedback/jobs/{job['job_id']}",
             'inspectionId': inspection_id,
-            'feedbackFile': str(feedback_file),
             'comparisonsCount': len(feedback_data.get('comparisons', [])),
-            'summary': summary,
-            'note': 'This data can be used for model fine-tuning. See feedback_data directory.'
+            'summary': feedback_data.get('summary', {}),
+            'note': 'Fine-tuning evaluation runs in background. Poll jobStatusUrl for progress.'
         }
-        
-        if auto_finetune_result:
-            response_data['autoFineTuning'] = auto_finetune_result
-        
-        return jsonify(response_data), 200
+        return jsonify(response_data), 202
         
     except Exception as e:
         logger.error(f"Error uploading feedback: {e}")
@@ -824,6 +1623,52 @@ def upload_feedback():
         }), 500
 
 
+@app.route('/api/feedback/jobs/<job_id>', methods=['GET'])
+def get_feedback_job(job_id):
+    """Status of a feedback ingestion job"""
+    job = get_feedback_jobs().get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'error': f'Unknown job: {job_id}'}), 404
+    return jsonify(job), 200
+
+
+@app.route('/api/feedback/jobs', methods=['GET'])
+def list_feedback_jobs():
+    """Recent feedback ingestion jobs (newest first) and queue statistics"""
+    limit = request.args.get('limit', default=50, type=int)
+    jobs = get_feedback_jobs()
+    return jsonify({'jobs': jobs.recent(limit), 'queue': jobs.stats()}), 200
+
+
+_services_started = False
+_services_lock = threading.Lock()
+
+
+def start_background_services():
+    """Start the trace exporter, model warm-up, feedback job worker and memory watchdog (once)"""
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
+    tracing.configure(TRACE_FILE or None, OTLP_ENDPOINT or None, TRACE_SAMPLE_RATE)
+    start_warm_start()
+    get_feedback_jobs()
+    start_memory_watchdog()
+
+
+def create_app():
+    """
+    The serving app with its background services running. Entry point for WSGI servers
+    (gunicorn "app:create_app()" - each worker warms its own model); importing this
+    module starts nothing, so tools and tests can import it without a job worker.
+    """
+    start_background_services()
+    return app
+
+
+record_phase('app_import', _PROCESS_START)
+
 if __name__ == '__main__':
     logger.info("=" * 80)
     logger.info("Starting TransX ML Service with Similarity-Based YOLOv8p2")
@@ -836,19 +1681,10 @@ if __name__ == '__main__':
     logger.info(f"Similarity System Available: {'Yes' if SIMILARITY_SYSTEM_AVAILABLE else 'No'}")
     logger.info("=" * 80)
     
-    # Preload components on startup
-    try:
-        load_model()
-        logger.info("Standard model preloaded from: {MODEL_PATH}")
-    except Exception as e:
-        logger.error(f"Could not preload standard model: {e}")
-    
-    if SIMILARITY_SYSTEM_AVAILABLE:
-        try:
-            load_similarity_system()
-            logger.info("Similarity-based YOLO system preloaded")
-        except Exception as e:
-            logger.error(f"Could not preload similarity system: {e}")
+    # With the debug reloader this module runs twice; only the reloaded child serves requests
+    debug = True
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
     
     # Start Flask server
     logger.info("Server Features:")
@@ -858,4 +1694,4 @@ if __name__ == '__main__':
     logger.info("Smart detection filtering")
     logger.info("Feedback upload for model fine-tuning (FR3.3)")
     logger.info("Starting Flask server on http://0.0.0.0:5001")
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    app.run(host='0.0.0.0', port=5001, debug=debug)
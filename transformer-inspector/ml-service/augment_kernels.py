@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+In-place Augmentation Kernels
+
+Executes augmentation steps on uint8 images without per-variant temporaries. Pointwise
+ops (brightness, contrast, gamma, saturation, hue) are 256-entry lookup tables applied
+with cv2.LUT, geometric ops are 2x3 affine matrices, and adjacent steps of the same
+kind are fused (tables compose, matrices multiply), so a chain of augmentations costs
+one pass per kind. The HSV, noise and warp scratch buffers belong to the calling
+thread and are reused for every variant of the same size.
+
+Affine matrices use continuous pixel coordinates (the image spans [0, w] x [0, h]),
+the same convention as the boxes they transform.
+"""
+
+import threading
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Step kinds: (kind, parameter)
+LUT = 'lut'          # (256,) uint8 table applied to every BGR channel
+HSV_LUT = 'hsv_lut'  # (256, 1, 3) uint8 table applied per channel in HSV space
+AFFINE = 'affine'    # 2x3 matrix
+NOISE = 'noise'      # (high, seed): add uniform noise in [0, high)
+BLUR = 'blur'        # Gaussian kernel size
+
+_FUSABLE = (LUT, HSV_LUT, AFFINE)
+_LEVELS = np.arange(256, dtype=np.float64)
+_LEVELS32 = np.arange(256, dtype=np.float32)  # convertScaleAbs computes in float32
+
+
+# Deterministic renders re-draw the same parameters every epoch, so tables are cached
+@lru_cache(maxsize=1024)
+def brightness_lut(beta: float) -> np.ndarray:
+    """Same values as cv2.convertScaleAbs(img, alpha=1, beta=beta)"""
+    return np.clip(np.rint(np.abs(_LEVELS32 + np.float32(beta))), 0, 255).astype(np.uint8)
+
+
+@lru_cache(maxsize=1024)
+def contrast_lut(alpha: float) -> np.ndarray:
+    """Same values as cv2.convertScaleAbs(img, alpha=alpha, beta=0)"""
+    return np.clip(np.rint(np.abs(_LEVELS32 * np.float32(alpha))), 0, 255).astype(np.uint8)
+
+
+@lru_cache(maxsize=1024)
+def gamma_lut(gamma: float) -> np.ndarray:
+    return (((_LEVELS / 255.0) ** (1.0 / gamma)) * 255).astype(np.uint8)
+
+
+def _hsv_table(hue=None, saturation=None, value=None) -> np.ndarray:
+    identity = np.arange(256, dtype=np.uint8)
+    channels = [identity if t is None else t for t in (hue, saturation, value)]
+    return np.stack(channels, -1).reshape(256, 1, 3)
+
+
+@lru_cache(maxsize=1024)
+def saturation_lut(scale: float) -> np.ndarray:
+    return _hsv_table(saturation=np.clip(_LEVELS * scale, 0, 255).astype(np.uint8))
+
+
+@lru_cache(maxsize=1024)
+def hue_lut(shift: float) -> np.ndarray:
+    """OpenCV 8-bit hue wraps at 180"""
+    return _hsv_table(hue=((_LEVELS + shift) % 180).astype(np.uint8))
+
+
+def _compose(kind: str, first, second):
+    """Single step equivalent to applying first, then second"""
+    if kind == LUT:
+        return second[first]
+    if kind == HSV_LUT:
+        return np.stack([second[first[:, 0, c], 0, c] for c in range(3)], -1).reshape(256, 1, 3)
+    return (np.vstack([second, [0, 0, 1]]) @ np.vstack([first, [0, 0, 1]]))[:2]
+
+
+def fuse(steps: List[Tuple]) -> List[Tuple]:
+    """Merge adjacent LUT / HSV_LUT / AFFINE steps"""
+    fused = []
+    for kind, param in steps:
+        if fused and fused[-1][0] == kind and kind in _FUSABLE:
+            fused[-1] = (kind, _compose(kind, fused[-1][1], param))
+        else:
+            fused.append((kind, param))
+    return fused
+
+
+class AugmentKernels:
+    """Scratch buffers plus the step executors; use one instance per thread"""
+
+    def __init__(self):
+        self._buffers = {}
+
+    def buffer(self, name: str, shape) -> np.ndarray:
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != tuple(shape):
+            buf = self._buffers[name] = np.empty(shape, dtype=np.uint8)
+        return buf
+
+    def run(self, img: np.ndarray, steps: List[Tuple]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Apply steps to img in place
+
+        Returns:
+            tuple: (img, combined 2x3 affine matrix of the geometric steps or None)
+        """
+        matrix = None
+        for kind, param in fuse(steps):
+            if kind == LUT:
+                cv2.LUT(img, param, dst=img)
+            elif kind == HSV_LUT:
+                hsv = self.buffer('hsv', img.shape)
+                cv2.cvtColor(img, cv2.COLOR_BGR2HSV, dst=hsv)
+                cv2.LUT(hsv, param, dst=hsv)
+                cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR, dst=img)
+            elif kind == AFFINE:
+                self._warp(img, param)
+                matrix = param if matrix is None else _compose(AFFINE, matrix, param)
+            elif kind == NOISE:
+                high, seed = param
+                noise = self.buffer('noise', img.shape)
+                cv2.setRNGSeed(seed)
+                cv2.randu(noise, 0, high)
+                cv2.add(img, noise, dst=img)
+            elif kind == BLUR:
+                cv2.GaussianBlur(img, (param, param), 0, dst=img)
+            else:
+                raise ValueError(f"Unknown augmentation step: {kind}")
+        return img, matrix
+
+    def _warp(self, img: np.ndarray, matrix):
+        h, w = img.shape[:2]
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if np.array_equal(matrix, [[-1.0, 0.0, w], [0.0, 1.0, 0.0]]):
+            cv2.flip(img, 1, dst=img)
+            return
+        # Continuous coordinates -> pixel-centre indices as warpAffine expects
+        pixel_matrix = matrix.copy()
+        pixel_matrix[:, 2] += matrix[:, :2].sum(1) * 0.5 - 0.5
+        out = self.buffer('warp', img.shape)
+        cv2.warpAffine(img, pixel_matrix, (w, h), dst=out,
+                       borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
+        np.copyto(img, out)
+
+
+_local = threading.local()
+
+
+def kernels() -> AugmentKernels:
+    """The calling thread's kernels (dataloader workers and render threads each get one)"""
+    instance = getattr(_local, 'kernels', None)
+    if instance is None:
+        instance = _local.kernels = AugmentKernels()
+    return instance
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Augmentation Operations for Fine-tune Samples
+
+The ten augmentations used for fine-tune variants. Every op draws its parameters
+from rng and returns the kernel steps that render it in place (augment_kernels.py).
+Geometric ops are affine matrices mapping source pixel coordinates to augmented
+ones, so boxes can follow them exactly instead of being jittered.
+"""
+
+import random
+
+import cv2
+import numpy as np
+
+from augment_kernels import AFFINE, BLUR, HSV_LUT, LUT, NOISE, kernels
+from augment_kernels import brightness_lut, contrast_lut, gamma_lut, hue_lut, saturation_lut
+
+# Boxes keeping less than this fraction of their area after clipping are dropped
+MIN_VISIBLE_FRACTION = 0.2
+MIN_BOX_SIZE = 2.0  # pixels
+
+
+def rotate_image(h, w, rng=random):
+    """Rotate image by small angle"""
+    angle = rng.uniform(-15, 15)  # Random rotation between -15 to 15 degrees
+    return [(AFFINE, cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0))]
+
+
+def flip_image(h, w, rng=random):
+    """Flip image horizontally"""
+    return [(AFFINE, np.array([[-1.0, 0.0, w], [0.0, 1.0, 0.0]]))]
+
+
+def brightness_adjustment(h, w, rng=random):
+    """Adjust brightness"""
+    beta = rng.uniform(-30, 30)  # Brightness adjustment
+    return [(LUT, brightness_lut(beta))]
+
+
+def contrast_adjustment(h, w, rng=random):
+    """Adjust contrast"""
+    alpha = rng.uniform(0.8, 1.2)  # Contrast adjustment
+    return [(LUT, contrast_lut(alpha))]
+
+
+def noise_addition(h, w, rng=random):
+    """Add random noise"""
+    return [(NOISE, (25, rng.getrandbits(31)))]
+
+
+def blur_image(h, w, rng=random):
+    """Apply slight blur"""
+    return [(BLUR, rng.choice([3, 5]))]
+
+
+def gamma_correction(h, w, rng=random):
+    """Apply gamma correction"""
+    return [(LUT, gamma_lut(rng.uniform(0.8, 1.2)))]
+
+
+def saturation_adjustment(h, w, rng=random):
+    """Adjust saturation"""
+    return [(HSV_LUT, saturation_lut(rng.uniform(0.8, 1.2)))]
+
+
+def hue_shift(h, w, rng=random):
+    """Shift hue slightly"""
+    return [(HSV_LUT, hue_lut(rng.uniform(-10, 10)))]
+
+
+def scale_image(h, w, rng=random):
+    """Scale image slightly (center crop when scaled up, zero pad when scaled down)"""
+    scale = rng.uniform(0.9, 1.1)
+    new_h, new_w = int(h * scale), int(w * scale)
+    sx, sy = new_w / w, new_h / h
+    if scale > 1.0:
+        # Scaled up: crop the center back to the original size
+        tx, ty = -((new_w - w) // 2), -((new_h - h) // 2)
+    else:
+        # Scaled down: pad to the original size
+        tx, ty = (w - new_w) // 2, (h - new_h) // 2
+    return [(AFFINE, np.array([[sx, 0.0, tx], [0.0, sy, ty]]))]
+
+
+# Each augmentation plans its kernel steps for an h x w image (see augment_kernels)
+AUGMENTATIONS = [
+    rotate_image,
+    flip_image,
+    brightness_adjustment,
+    contrast_adjustment,
+    noise_addition,
+    blur_image,
+    gamma_correction,
+    saturation_adjustment,
+    hue_shift,
+    scale_image
+]
+
+
+def _output(img, out):
+    if out is None:
+        return img.copy()
+    np.copyto(out, img)
+    return out
+
+
+def apply_augmentation(img, augmentation_index: int, rng=random, out=None):
+    """
+    Apply the augmentation for this index (cycling through AUGMENTATIONS)
+
+    Args:
+        img: Source image (left untouched)
+        out: Optional preallocated array of img's shape receiving the result
+             (default: a new array)
+
+    Returns:
+        tuple: (augmented image, 2x3 affine matrix or None)
+    """
+    h, w = img.shape[:2]
+    steps = AUGMENTATIONS[augmentation_index % len(AUGMENTATIONS)](h, w, rng)
+    return kernels().run(_output(img, out), steps)
+
+
+def apply_chain(img, augmentation_indices, rng=random, out=None):
+    """
+    Apply several augmentations in one pass
+
+    Geometric steps run first (as one warp), the pixel steps after them in the
+    given order with adjacent lookup tables fused.
+
+    Returns:
+        tuple: (augmented image, combined 2x3 affine matrix or None)
+    """
+    h, w = img.shape[:2]
+    steps = [step for index in augmentation_indices
+             for step in AUGMENTATIONS[index % len(AUGMENTATIONS)](h, w, rng)]
+    steps = [s for s in steps if s[0] == AFFINE] + [s for s in steps if s[0] != AFFINE]
+    return kernels().run(_output(img, out), steps)
+
+
+def transform_boxes(boxes, matrix, width: int, height: int):
+    """
+    Map xyxy pixel boxes through an affine matrix and clip them to the image
+
+    Rotated boxes become the axis-aligned box enclosing their four corners. Boxes
+    that end up mostly outside the image are dropped.
+
+    Args:
+        boxes: (n, 4) array of x1, y1, x2, y2 in source pixels
+        matrix: 2x3 affine matrix (None = identity)
+        width, height: Size of the augmented image
+
+    Returns:
+        tuple: (kept boxes (m, 4), boolean keep mask (n,))
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if matrix is not None and len(boxes):
+        x1, y1, x2, y2 = boxes.T
+        corners = np.stack([np.stack([x1, y1], 1), np.stack([x2, y1], 1),
+                            np.stack([x1, y2], 1), np.stack([x2, y2], 1)], 1)  # (n, 4, 2)
+        mapped = corners @ np.asarray(matrix)[:, :2].T + np.asarray(matrix)[:, 2]
+        boxes = np.concatenate([mapped.min(1), mapped.max(1)], 1)
+
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    clipped = boxes.copy()
+    clipped[:, [0, 2]] = clipped[:, [0, 2]].clip(0, width)
+    clipped[:, [1, 3]] = clipped[:, [1, 3]].clip(0, height)
+    box_w = clipped[:, 2] - clipped[:, 0]
+    box_h = clipped[:, 3] - clipped[:, 1]
+    keep = ((box_w >= MIN_BOX_SIZE) & (box_h >= MIN_BOX_SIZE)
+            & (box_w * box_h >= MIN_VISIBLE_FRACTION * np.maximum(area, 1e-9)))
+    return clipped[keep], keep
+
+
+def transform_yolo(xywhn, matrix, width: int, height: int):
+    """
+    transform_boxes for normalized YOLO boxes (cx, cy, w, h)
+
+    Returns:
+        tuple: (kept boxes (m, 4) normalized xywh, boolean keep mask (n,))
+    """
+    scale = np.array([width, height, width, height], dtype=np.float64)
+    xywh = np.asarray(xywhn, dtype=np.float64).reshape(-1, 4) * scale
+    xyxy = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], 1)
+    boxes, keep = transform_boxes(xyxy, matrix, width, height)
+    xywh = np.concatenate([(boxes[:, :2] + boxes[:, 2:]) / 2, boxes[:, 2:] - boxes[:, :2]], 1)
+    return xywh / scale, keep
+
+
+def transform_yolo_lines(lines, matrix, width: int, height: int):
+    """Map YOLO label lines through an augmentation's matrix (None leaves them unchanged)"""
+    if matrix is None or not lines:
+        return list(lines)
+    rows = [line.split() for line in lines]
+    boxes, keep = transform_yolo([[float(v) for v in row[1:5]] for row in rows], matrix, width, height)
+    kept_classes = [row[0] for row, k in zip(rows, keep) if k]
+    return [f"{class_id} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}"
+            for class_id, (cx, cy, w, h) in zip(kept_classes, boxes)]
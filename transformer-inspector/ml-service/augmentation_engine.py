@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Augmentation Engine for Fine-tune Dataset Creation
+
+Decodes the source image once and renders all augmented variants in parallel.
+OpenCV releases the GIL for the pixel work and for JPEG encoding, so a thread pool
+scales across cores without copying the decoded image into worker processes.
+Every variant gets its own RNG seeded from (seed, index), so a dataset is
+reproducible regardless of scheduling order.
+"""
+
+import os
+import random
+import shutil
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+AUGMENT_SEED = int(os.environ.get('ML_AUGMENT_SEED', '0'))
+AUGMENT_WORKERS = int(os.environ.get('ML_AUGMENT_WORKERS', '0')) or min(8, os.cpu_count() or 1)
+JPEG_QUALITY = 95
+
+
+class RenderedVariant(NamedTuple):
+    written: bool
+    matrix: Optional[object] = None  # 2x3 affine matrix of the geometric ops, None = identity
+    width: int = 0
+    height: int = 0
+
+
+class AugmentationEngine:
+    def __init__(self, max_workers: int = AUGMENT_WORKERS, seed: int = AUGMENT_SEED,
+                 jpeg_quality: int = JPEG_QUALITY):
+        """
+        Parallel decode-once augmentation engine
+
+        Args:
+            max_workers: Threads used to augment and encode variants
+            seed: Base seed; variant i always uses the RNG for (seed, i)
+            jpeg_quality: JPEG quality for the written variants
+        """
+        self.max_workers = max(1, max_workers)
+        self.seed = seed
+        self.jpeg_quality = jpeg_quality
+
+    def rng_for(self, index: int) -> random.Random:
+        """Deterministic per-variant RNG (string seeds hash identically across runs)"""
+        return random.Random(f"{self.seed}:{index}")
+
+    def render(self, source_image: str, dest_paths: List[str],
+               augment: Callable, blob_store=None, owner: str = None) -> List[RenderedVariant]:
+        """
+        Render one augmented variant per destination path
+
+        Args:
+            source_image: Image decoded once and shared (read-only) by all variants
+            dest_paths: Output JPEG paths; position i is augmentation index i
+            augment: Callable(img, index, rng) -> (augmented image, 2x3 affine matrix or
+                     None); must not modify img
+            blob_store: Optional BlobStore; variants are then stored by content and
+                        linked to dest_paths (a variant rendered before is not written
+                        again, since the same seed and index give the same bytes)
+            owner: Blob reference owner for the links (required with blob_store)
+
+        Returns:
+            List of RenderedVariant; the matrix maps source pixels to the variant's
+            pixels, so labels can follow it (a copied original has no matrix)
+        """
+        import cv2
+
+        img = cv2.imread(source_image)
+        if img is None:
+            logger.error(f"Could not read image: {source_image} - copying the original instead")
+            return [RenderedVariant(self._copy_original(source_image, dest)) for dest in dest_paths]
+
+        encode_params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+
+        def render_one(index):
+            dest = dest_paths[index]
+            try:
+                augmented, matrix = augment(img, index, self.rng_for(index))
+                rendered = RenderedVariant(True, matrix, augmented.shape[1], augmented.shape[0])
+                if blob_store is not None:
+                    ok, encoded = cv2.imencode('.jpg', augmented, encode_params)
+                    if ok:
+                        blob_store.link_bytes(encoded.tobytes(), dest, owner)
+                        return rendered
+                elif cv2.imwrite(dest, augmented, encode_params):
+                    return rendered
+                raise Exception(f"Failed to save augmented image: {dest}")
+            except Exception as e:
+                logger.error(f"Error creating augmented image {index}: {e}")
+                # Fallback: just copy the original image
+                return RenderedVariant(self._copy_original(source_image, dest))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(render_one, range(len(dest_paths))))
+
+    @staticmethod
+    def _copy_original(source_image: str, dest: str) -> bool:
+        try:
+            shutil.copy2(source_image, dest)
+            return True
+        except OSError as e:
+            logger.error(f"Could not copy {source_image} to {dest}: {e}")
+            return False
+
+
+def write_label_files(labels: Dict[str, List[str]]) -> int:
+    """
+    Write all YOLO label files in one pass
+
+    Args:
+        labels: Mapping of label file path -> label lines
+
+    Returns:
+        Total number of label lines written
+    """
+    total = 0
+    for label_path, lines in labels.items():
+        with open(label_path, 'w') as f:
+            f.write(''.join(line + '\n' for line in lines))
+        total += len(lines)
+    return total
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Content-addressed Blob Store
+
+Corpus images, augmented variants and model weights are stored once under their
+SHA-256 (blobs/<aa>/<sha256>) and materialized where they are needed (dataset
+directories, the Faulty_Detection weights registry) as hardlinks, falling back to
+symlinks or copies across filesystems. Every materialization is recorded as a
+reference owned by e.g. 'dataset:<run>' or 'model:<name>'; the garbage collector
+deletes blobs nobody references any more.
+
+Blobs are made read-only (on POSIX) because every hardlink shares their inode: a
+writer that reopened a materialized file in place would otherwise corrupt all of them.
+
+Writers (put, link) hold a shared lock on the store and gc an exclusive one (flock on
+gc.lock, so a `blob_store.py gc` in another process is excluded too): a blob is never
+deleted between being stored or checked and being linked.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOB_DIR = os.environ.get('ML_BLOB_STORE_DIR', str(Path(__file__).resolve().parent / 'blobs'))
+
+# Unreferenced blobs younger than this survive GC (they may be between put and link)
+GC_GRACE_SECONDS = float(os.environ.get('ML_BLOB_GC_GRACE', '3600'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS refs (
+    owner TEXT NOT NULL,
+    path TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (owner, path)
+);
+CREATE INDEX IF NOT EXISTS idx_refs_sha256 ON refs (sha256);
+"""
+
+
+def _flock(f, exclusive=True):
+    try:
+        import fcntl
+    except ImportError:
+        return  # No cross-process locking on this platform
+    fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    def __init__(self, root: str = DEFAULT_BLOB_DIR):
+        """
+        Content-addressed blob store with reference counting
+
+        Args:
+            root: Holds <aa>/<sha256> blob files and refs.sqlite3
+        """
+        self.root = root
+        self.index_path = os.path.join(root, 'refs.sqlite3')
+        self.lock_path = os.path.join(root, 'gc.lock')
+        os.makedirs(root, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._conn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    @contextmanager
+    def _store_lock(self, exclusive=False):
+        """Shared for put/link, exclusive for gc (flock locks per open file, so threads too)"""
+        with open(self.lock_path, 'a') as f:
+            _flock(f, exclusive)
+            yield
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path(sha256))
+
+    # ------------------------------------------------------------------ writing
+
+    def _commit_blob(self, tmp_path: str, sha256: str) -> str:
+        """Move a fully written temp file into place (or drop it if the blob exists)"""
+        blob_path = self.path(sha256)
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+        else:
+            if os.name == 'posix':
+                os.chmod(tmp_path, 0o444)  # Windows could not delete read-only links
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(tmp_path, blob_path)
+        with self._connection() as conn:
+            conn.execute('INSERT OR IGNORE INTO blobs (sha256, size, created_at) VALUES (?, ?, ?)',
+                         (sha256, os.path.getsize(blob_path), time.time()))
+        return sha256
+
+    def put_file(self, src: str) -> str:
+        """
+        Store the file's content (the source is left untouched)
+
+        Returns:
+            str: SHA-256 of the content
+        """
+        with self._store_lock():
+            return self._put_file(src)
+
+    def _put_file(self, src: str) -> str:
+        sha256 = file_sha256(src)
+        if self.exists(sha256):
+            return self._touch(sha256)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        os.close(fd)
+        shutil.copyfile(src, tmp_path)
+        return self._commit_blob(tmp_path, sha256)
+
+    def put_bytes(self, data: bytes) -> str:
+        """Store in-memory content (e.g. an encoded image); returns its SHA-256"""
+        with self._store_lock():
+            return self._put_bytes(data)
+
+    def _put_bytes(self, data: bytes) -> str:
+        sha256 = hashlib.sha256(data).hexdigest()
+        if self.exists(sha256):
+            return self._touch(sha256)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return self._commit_blob(tmp_path, sha256)
+
+    def _touch(self, sha256: str) -> str:
+        # Refresh the GC grace period of a blob that is about to be linked again
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO blobs (sha256, size, created_at) VALUES (?, ?, ?)',
+                         (sha256, os.path.getsize(self.path(sha256)), time.time()))
+        return sha256
+
+    def link(self, sha256: str, dest: str, owner: str) -> str:
+        """
+        Materialize a blob at dest and record the reference
+
+        Returns:
+            str: 'hardlink', 'symlink' or 'copy'
+        Raises:
+            FileNotFoundError: The blob is not in the store (e.g. collected since it was put;
+                               link_file / link_bytes store it again instead)
+        """
+        with self._store_lock():
+            return self._link(sha256, dest, owner)
+
+    def link_file(self, src: str, dest: str, owner: str) -> Tuple[str, str]:
+        """
+        put_file + link under one lock, so gc cannot collect the blob in between
+
+        Returns:
+            tuple: (sha256, link mode)
+        """
+        with self._store_lock():
+            return self._put_and_link(self._put_file, src, dest, owner)
+
+    def link_bytes(self, data: bytes, dest: str, owner: str) -> Tuple[str, str]:
+        """put_bytes + link under one lock; returns (sha256, link mode)"""
+        with self._store_lock():
+            return self._put_and_link(self._put_bytes, data, dest, owner)
+
+    def _put_and_link(self, put, content, dest: str, owner: str) -> Tuple[str, str]:
+        sha256 = put(content)
+        try:
+            return sha256, self._link(sha256, dest, owner)
+        except FileNotFoundError:
+            # Deleted behind the store's back since put: store it again rather than link to nothing
+            return sha256, self._link(put(content), dest, owner)
+
+    def _link(self, sha256: str, dest: str, owner: str) -> str:
+        blob_path = self.path(sha256)
+        if not os.path.exists(blob_path):
+            # A symlink or copy fallback would leave a dangling link or fail further on
+            raise FileNotFoundError(f"Blob {sha256} is not in the store")
+        if os.path.lexists(dest):
+            os.remove(dest)
+        try:
+            os.link(blob_path, dest)
+            mode = 'hardlink'
+        except FileNotFoundError:
+            raise
+        except OSError:
+            try:
+                os.symlink(blob_path, dest)
+                mode = 'symlink'
+            except OSError:
+                shutil.copyfile(blob_path, dest)
+                mode = 'copy'
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO refs (owner, path, sha256, mode, created_at) VALUES (?, ?, ?, ?, ?)',
+                         (owner, os.path.abspath(dest), sha256, mode, datetime.now().isoformat()))
+        return mode
+
+    def add_ref(self, sha256: str, owner: str, name: str):
+        """Reference a blob without materializing it (e.g. corpus samples)"""
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO refs (owner, path, sha256, mode, created_at) VALUES (?, ?, ?, ?, ?)',
+                         (owner, name, sha256, 'ref', datetime.now().isoformat()))
+
+    def release(self, owner: str, path: str = None) -> int:
+        """
+        Drop an owner's references (all of them, or the one for path)
+
+        Returns:
+            int: Number of references dropped
+        """
+        with self._connection() as conn:
+            if path is None:
+                return conn.execute('DELETE FROM refs WHERE owner = ?', (owner,)).rowcount
+            return conn.execute('DELETE FROM refs WHERE owner = ? AND path IN (?, ?)',
+                                (owner, path, os.path.abspath(path))).rowcount
+
+    # ------------------------------------------------------------------ GC
+
+    def refcount(self, sha256: str) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM refs WHERE sha256 = ?', (sha256,)).fetchone()[0]
+
+    def gc(self, grace_seconds: float = GC_GRACE_SECONDS) -> Dict:
+        """
+        Reclaim unreferenced blobs
+
+        Materialized references whose file was deleted (or replaced by other content)
+        are dropped first, so deleting a dataset directory or an old weights file is
+        enough to release its blobs.
+
+        Returns:
+            dict: stale_refs, blobs_deleted, bytes_freed
+        """
+        with self._store_lock(exclusive=True):
+            return self._gc(grace_seconds)
+
+    def _gc(self, grace_seconds: float) -> Dict:
+        conn = self._conn()
+        stale = []
+        for row in conn.execute("SELECT owner, path, sha256, mode FROM refs WHERE mode != 'ref'"):
+            try:
+                if row['mode'] == 'hardlink':
+                    alive = os.path.samefile(row['path'], self.path(row['sha256']))
+                elif row['mode'] == 'symlink':
+                    alive = os.path.realpath(row['path']) == os.path.realpath(self.path(row['sha256']))
+                else:
+                    alive = os.path.exists(row['path'])
+            except OSError:
+                alive = False
+            if not alive:
+                stale.append((row['owner'], row['path']))
+        with self._connection() as conn:
+            conn.executemany('DELETE FROM refs WHERE owner = ? AND path = ?', stale)
+
+        cutoff = time.time() - grace_seconds
+        orphans = conn.execute(
+            'SELECT b.sha256, b.size FROM blobs b LEFT JOIN refs r ON r.sha256 = b.sha256 '
+            'WHERE r.sha256 IS NULL AND b.created_at < ?', (cutoff,)).fetchall()
+        deleted = freed = 0
+        for row in orphans:
+            try:
+                os.remove(self.path(row['sha256']))
+                freed += row['size']
+            except FileNotFoundError:
+                pass
+            deleted += 1
+        with self._connection() as conn:
+            conn.executemany('DELETE FROM blobs WHERE sha256 = ?', [(row['sha256'],) for row in orphans])
+
+        if stale or deleted:
+            logger.info(f"Blob GC: dropped {len(stale)} stale reference(s), deleted {deleted} blob(s), "
+                        f"freed {freed / 1e6:.1f} MB")
+        return {'stale_refs': len(stale), 'blobs_deleted': deleted, 'bytes_freed': freed}
+
+    def stats(self) -> Dict:
+        conn = self._conn()
+        blobs, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs').fetchone()
+        modes = {row['mode']: row['n'] for row in conn.execute('SELECT mode, COUNT(*) AS n FROM refs GROUP BY mode')}
+        return {'blobs': blobs, 'bytes': size, 'refs': modes}
+
+
+_stores: Dict[str, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_blob_store(root: str = DEFAULT_BLOB_DIR) -> BlobStore:
+    """Shared blob store per directory within a process"""
+    key = os.path.abspath(root)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = BlobStore(key)
+        return store
+
+
+def main():
+    """blob_store.py [stats|gc] - inspect the store or reclaim unreferenced blobs"""
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    if command not in ('stats', 'gc'):
+        print("Usage: python blob_store.py [stats|gc]")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    store = open_blob_store()
+    result = store.gc() if command == 'gc' else store.stats()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Detection Classes
+Class ids, names and display colours shared by the service (app.py) and the dataset
+creator, which must label training data with the ids the service serves. Kept out of
+app.py so tools can read the mapping without importing the service.
+"""
+
+# Class mapping from rules.txt
+CLASS_NAMES = {
+    0: 'faulty',
+    1: 'faulty_loose_joint',
+    2: 'faulty_point_overload',
+    3: 'potential_faulty'
+}
+
+# Color mapping for visualization (RGB for JSON response)
+CLASS_COLORS = {
+    0: [255, 0, 0],      # Red - Faulty
+    1: [0, 255, 0],      # Green - faulty_loose_joint
+    2: [0, 0, 255],      # Blue - faulty_point_overload
+    3: [255, 255, 0]     # Yellow - potential_faulty
+}
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+In-memory Augmentation Dataset for Fine-tuning
+
+Trains on a corpus run manifest instead of a directory of pre-rendered JPEGs. Each
+dataloader worker decodes every source image once, keeps it in memory and renders
+augmented variants lazily when a batch asks for them; boxes follow the geometric
+ops through their affine matrices. Apart from the manifest (and links to the
+held-out validation images) nothing is written to disk.
+
+Usage (ultralytics):
+    YOLO(weights).train(data=<dataset.yaml>, trainer=FeedbackTrainer, ...)
+where dataset.yaml points train (and val, when the corpus has no held-out split yet)
+at the corpus run manifest.
+"""
+
+import json
+import random
+from copy import deepcopy
+
+import cv2
+import numpy as np
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import colorstr
+from ultralytics.utils.torch_utils import de_parallel
+
+from augment_ops import apply_augmentation, transform_yolo
+from training_corpus import is_in_memory_manifest
+
+# Virtual image name: <source path>::<sample index>:<variant>
+VARIANT_SEPARATOR = '::'
+
+
+class FeedbackAugmentDataset(YOLODataset):
+    def __init__(self, *args, img_path=None, train_variants=True, **kwargs):
+        """
+        Args:
+            img_path: Corpus run manifest (corpus_run.json with in_memory=True)
+            train_variants: Expose every augmented variant (train); False exposes
+                            only the untouched source images (val)
+            *args, **kwargs: Passed to YOLODataset
+        """
+        with open(img_path, 'r') as f:
+            self.manifest = json.load(f)
+        self.samples = self.manifest['samples']
+        self.seed = self.manifest.get('seed', 0)
+        self.train_variants = train_variants
+        self._decoded = {}  # sample index -> decoded BGR image (per worker process)
+        super().__init__(*args, img_path=img_path, **kwargs)
+
+    @staticmethod
+    def _parse_name(im_file: str):
+        _, key = im_file.rsplit(VARIANT_SEPARATOR, 1)
+        sample_index, variant = key.split(':')
+        return int(sample_index), int(variant)
+
+    def get_img_files(self, img_path):
+        """One virtual file per (sample, variant); variant 0 is the untouched image"""
+        files = []
+        for index, sample in enumerate(self.samples):
+            variants = sample['variants'] if self.train_variants else 1
+            files.extend(f"{sample['image']}{VARIANT_SEPARATOR}{index}:{v}" for v in range(variants))
+        return files
+
+    def get_labels(self):
+        labels = []
+        for im_file in self.im_files:
+            sample = self.samples[self._parse_name(im_file)[0]]
+            rows = np.array([[float(v) for v in line.split()[:5]] for line in sample['labels']],
+                            dtype=np.float32).reshape(-1, 5)
+            labels.append({
+                'im_file': im_file,
+                'shape': (sample['height'], sample['width']),
+                'cls': rows[:, :1],
+                'bboxes': rows[:, 1:],
+                'segments': [],
+                'keypoints': None,
+                'normalized': True,
+                'bbox_format': 'xywh'
+            })
+        return labels
+
+    def _source(self, sample_index: int):
+        img = self._decoded.get(sample_index)
+        if img is None:
+            img = cv2.imread(self.samples[sample_index]['image'])
+            if img is None:
+                raise FileNotFoundError(f"Image not found: {self.samples[sample_index]['image']}")
+            self._decoded[sample_index] = img
+        return img
+
+    def _render(self, index: int):
+        """Augmented image and its labels (normalized xywh) for dataset index"""
+        label = deepcopy(self.labels[index])
+        sample_index, variant = self._parse_name(label['im_file'])
+        img = self._source(sample_index)
+        if variant == 0:
+            return img, label
+
+        sample_id = self.samples[sample_index]['sample_id']
+        rng = random.Random(f"{self.seed}:{sample_id}:{variant}")
+        img, matrix = apply_augmentation(img, variant - 1, rng)
+        if matrix is not None:
+            h, w = img.shape[:2]
+            boxes, keep = transform_yolo(label['bboxes'], matrix, w, h)
+            label['cls'] = label['cls'][keep]
+            label['bboxes'] = boxes.astype(np.float32)
+        return img, label
+
+    def load_image(self, i, rect_mode=True):
+        """Same resize rules as BaseDataset.load_image, but from the in-memory variant"""
+        img, _ = self._render(i)
+        return self._resize(img, rect_mode)
+
+    def _resize(self, img, rect_mode=True):
+        h0, w0 = img.shape[:2]
+        if rect_mode:
+            r = self.imgsz / max(h0, w0)
+            if r != 1:
+                w, h = (min(int(np.ceil(w0 * r)), self.imgsz), min(int(np.ceil(h0 * r)), self.imgsz))
+                img = cv2.resize(img, (w, h), interpolation=cv2.INTER_LINEAR)
+        elif not (h0 == w0 == self.imgsz):
+            img = cv2.resize(img, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+        return img, (h0, w0), img.shape[:2]
+
+    def get_image_and_label(self, index):
+        """Render the variant once and return image and matching labels together"""
+        img, label = self._render(index)
+        label.pop('shape', None)
+        label['img'], label['ori_shape'], label['resized_shape'] = self._resize(img)
+        label['ratio_pad'] = (
+            label['resized_shape'][0] / label['ori_shape'][0],
+            label['resized_shape'][1] / label['ori_shape'][1],
+        )
+        if self.rect:
+            label['rect_shape'] = self.batch_shapes[self.batch[index]]
+        return self.update_labels_info(label)
+
+    def cache_images(self, *args, **kwargs):
+        """Sources are kept decoded already; rendered variants are not cached"""
+        self.cache = None
+
+
+class FeedbackTrainer(DetectionTrainer):
+    """DetectionTrainer whose datasets come from a corpus run manifest"""
+
+    def build_dataset(self, img_path, mode='train', batch=None):
+        if not is_in_memory_manifest(img_path):
+            # Held-out validation split linked as a regular images/val directory
+            return super().build_dataset(img_path, mode, batch)
+        gs = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+        cfg = self.args
+        return FeedbackAugmentDataset(
+            img_path=img_path,
+            train_variants=mode == 'train',
+            imgsz=cfg.imgsz,
+            batch_size=batch,
+            augment=mode == 'train',
+            hyp=cfg,
+            rect=cfg.rect or mode == 'val',
+            cache=None,
+            single_cls=cfg.single_cls or False,
+            stride=gs,
+            pad=0.0 if mode == 'train' else 0.5,
+            prefix=colorstr(f"{mode}: "),
+            task=cfg.task,
+            classes=cfg.classes,
+            data=self.data,
+            fraction=cfg.fraction if mode == 'train' else 1.0
+        )
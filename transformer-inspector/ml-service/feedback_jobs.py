@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Durable Feedback Job Queue
+
+/api/feedback/upload only has to make the feedback durable and hand back a job id;
+persisting, trigger evaluation, dataset building and training run in a background
+worker. Every state change is appended (fsynced) to a JSONL journal, so queued or
+interrupted jobs are picked up again after a restart and their status stays
+queryable.
+
+Several service processes (e.g. gunicorn workers) can share one journal: all of
+them accept jobs and answer status queries, but only the process holding the
+worker lock runs jobs, so a fine-tune is never started twice.
+"""
+
+import os
+import json
+import uuid
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = ('completed', 'skipped', 'failed')
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 1.0  # Seconds between journal checks for jobs submitted by other processes
+COMPACT_SLACK = 1000  # Superseded journal records tolerated before the worker compacts
+
+
+def _flock(f, exclusive=True, blocking=True):
+    try:
+        import fcntl
+    except ImportError:
+        return True  # No cross-process locking on this platform
+    flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    if not blocking:
+        flags |= fcntl.LOCK_NB
+    try:
+        fcntl.flock(f, flags)
+        return True
+    except BlockingIOError:
+        return False
+
+
+class FeedbackJobQueue:
+    def __init__(self, jobs_dir: str, handler: Callable, autostart: bool = True):
+        """
+        Durable single-worker job queue
+
+        Args:
+            jobs_dir: Directory holding the journal (jobs.jsonl) and queued payloads
+            handler: Callable(job, payload, update) run by the worker; update(**fields)
+                     journals progress (e.g. stage='dataset'). Its return value is
+                     stored as the job result; returning {'state': 'skipped', ...}
+                     marks the job skipped instead of completed.
+            autostart: Start the worker thread immediately
+        """
+        self.jobs_dir = jobs_dir
+        self.payload_dir = os.path.join(jobs_dir, 'payloads')
+        self.journal_path = os.path.join(jobs_dir, 'jobs.jsonl')
+        self.handler = handler
+
+        os.makedirs(self.payload_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict] = {}
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._queued_ids = set()
+        self._queued_jobs = set()  # Jobs whose latest record is state 'queued'
+        self._journal_inode = None
+        self._journal_offset = 0
+        self._journal_records = 0
+        self._worker = None
+        self.is_worker = False
+
+        self._sync()
+        if autostart:
+            self.start()
+
+    def start(self):
+        """Start the background worker (idempotent); it waits for the worker lock"""
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='feedback-jobs', daemon=True)
+            self._worker.start()
+
+    def submit(self, payload: Dict, **fields) -> Dict:
+        """
+        Durably enqueue a job; returns once payload and journal entry are on disk
+
+        Returns:
+            dict: The queued job record
+        """
+        job_id = uuid.uuid4().hex
+        payload_path = self._payload_path(job_id)
+        tmp_path = payload_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(payload, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, payload_path)
+
+        now = datetime.now().isoformat()
+        job = dict(fields, job_id=job_id, state='queued', stage='queued',
+                   created_at=now, updated_at=now, attempts=0)
+        with self._journal() as journal:
+            with self._lock:
+                self._remember(job)
+            self._append(journal, job)
+        if self.is_worker:
+            self._enqueue(job_id)
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        self._sync()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def recent(self, limit: int = 50) -> list:
+        """Most recent jobs first"""
+        self._sync()
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda j: j['created_at'], reverse=True)
+            return [dict(j) for j in jobs[:limit]]
+
+    def stats(self) -> Dict:
+        self._sync()
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['state']] = counts.get(job['state'], 0) + 1
+        return {'pending': counts.get('queued', 0), 'states': counts, 'worker': self.is_worker}
+
+    def _payload_path(self, job_id: str) -> str:
+        return os.path.join(self.payload_dir, f"{job_id}.json")
+
+    def _enqueue(self, job_id: str):
+        with self._lock:
+            if job_id in self._queued_ids:
+                return
+            self._queued_ids.add(job_id)
+        self._queue.put(job_id)
+
+    def _update(self, job_id: str, **fields) -> Dict:
+        with self._journal() as journal:
+            with self._lock:
+                job = dict(self._jobs[job_id], **fields)
+                job['updated_at'] = datetime.now().isoformat()
+                self._remember(job)
+            self._append(journal, job)
+        return dict(job)
+
+    def _remember(self, job: Dict):
+        """Store a job record (caller holds the thread lock)"""
+        self._jobs[job['job_id']] = job
+        if job['state'] == 'queued':
+            self._queued_jobs.add(job['job_id'])
+        else:
+            self._queued_jobs.discard(job['job_id'])
+
+    @contextmanager
+    def _journal(self):
+        """
+        The journal opened for appending, under its file lock. Lock order is always the
+        file lock first, then the thread lock (_append, _compact), so they cannot deadlock.
+        """
+        while True:
+            f = open(self.journal_path, 'a')
+            try:
+                _flock(f)
+                # Compaction may have replaced the file while we waited for the lock
+                if os.fstat(f.fileno()).st_ino == os.stat(self.journal_path).st_ino:
+                    yield f
+                    return
+            finally:
+                f.close()
+
+    @staticmethod
+    def _append(journal, job: Dict):
+        """Append the full job record to the journal (caller holds its file lock)"""
+        journal.write(json.dumps(job, default=str) + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+
+    def _sync(self):
+        """Read journal records appended since the last sync (by any process)"""
+        try:
+            stat = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if stat.st_ino != self._journal_inode:
+                # Journal was compacted (replaced) - re-read it from the start
+                self._journal_inode = stat.st_ino
+                self._journal_offset = 0
+                self._journal_records = 0
+            if stat.st_size <= self._journal_offset:
+                return
+            with open(self.journal_path, 'r') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+            # Only consume complete lines; a torn tail is re-read next time
+            complete = data[:data.rfind('\n') + 1]
+            self._journal_offset += len(complete.encode())
+            for line in complete.splitlines():
+                self._journal_records += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn line from a crash mid-append
+                self._remember(record)
+
+    def _compact(self):
+        """Rewrite one line per job so the journal does not grow without bound (worker only)"""
+        with self._journal():
+            self._sync()
+            tmp_path = self.journal_path + '.tmp'
+            with self._lock:
+                with open(tmp_path, 'w') as f:
+                    for job in sorted(self._jobs.values(), key=lambda j: j['created_at']):
+                        f.write(json.dumps(job, default=str) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.journal_path)
+        self._sync()
+
+    def _compact_if_needed(self):
+        """Compact once the journal holds COMPACT_SLACK records beyond one per job"""
+        self._sync()
+        with self._lock:
+            superseded = self._journal_records - len(self._jobs)
+        if superseded >= COMPACT_SLACK:
+            self._compact()
+
+    def _recover(self):
+        """Re-queue every job that did not finish (called once the worker lock is held)"""
+        self._compact()
+        requeued = 0
+        for job in sorted(self.recent(limit=None), key=lambda j: j['created_at']):
+            if job['state'] in TERMINAL_STATES:
+                continue
+            if not os.path.exists(self._payload_path(job['job_id'])):
+                self._update(job['job_id'], state='failed', error='Payload lost')
+                continue
+            if job['state'] != 'queued':
+                self._update(job['job_id'], state='queued', stage='queued')
+            self._enqueue(job['job_id'])
+            requeued += 1
+        if requeued:
+            logger.info(f"Recovered {requeued} unfinished feedback job(s) from {self.journal_path}")
+
+    def _run(self):
+        # Only one process runs jobs; the others block here and take over if it exits
+        lock_file = open(os.path.join(self.jobs_dir, 'worker.lock'), 'w')
+        _flock(lock_file)
+        self.is_worker = True
+        logger.info("Feedback job worker started")
+        self._recover()
+
+        while True:
+            try:
+                job_id = self._queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # Pick up jobs accepted by other service processes
+                self._sync()
+                with self._lock:
+                    pending = self._queued_jobs - self._queued_ids
+                for pending_id in pending:
+                    self._enqueue(pending_id)
+                self._compact_if_needed()
+                continue
+            try:
+                self._process(job_id)
+            except Exception as e:
+                logger.error(f"Feedback job {job_id} crashed the worker loop: {e}")
+            finally:
+                with self._lock:
+                    self._queued_ids.discard(job_id)
+                self._queue.task_done()
+            self._compact_if_needed()
+
+    def _process(self, job_id: str):
+        job = self.get(job_id)
+        if job is None or job['state'] in TERMINAL_STATES:
+            return
+        if job['attempts'] >= MAX_ATTEMPTS:
+            self._update(job_id, state='failed', error=f"Gave up after {job['attempts']} attempts")
+            return
+
+        job = self._update(job_id, state='running', attempts=job['attempts'] + 1)
+        try:
+            with open(self._payload_path(job_id), 'r') as f:
+                payload = json.load(f)
+            result = self.handler(job, payload, lambda **fields: self._update(job_id, **fields)) or {}
+            state = result.pop('state', 'completed')
+            self._update(job_id, state=state, stage='done', result=result, error=None)
+            os.remove(self._payload_path(job_id))
+        except Exception as e:
+            logger.error(f"Feedback job {job_id} failed: {e}")
+            self._update(job_id, state='failed', error=str(e))
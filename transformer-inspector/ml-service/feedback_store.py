@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Append-only Feedback Store
+
+Feedback comparisons are appended as JSON Lines to size-rotated segment files and
+indexed in SQLite by inspection, transformer, image, class and action. Every record
+gets a monotonically increasing sequence number, so consumers can read just the
+records added since their last watermark instead of re-parsing the whole history.
+Re-uploads never overwrite anything: the newest upload of an inspection
+supersedes earlier ones at query time.
+"""
+
+import os
+import glob
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAX_BYTES = 16 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    upload_id TEXT PRIMARY KEY,
+    inspection_id TEXT NOT NULL,
+    inspection_number TEXT,
+    transformer_code TEXT,
+    exported_at TEXT,
+    received_at TEXT NOT NULL,
+    summary TEXT,
+    first_seq INTEGER,
+    last_seq INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_uploads_inspection ON uploads (inspection_id);
+
+CREATE TABLE IF NOT EXISTS records (
+    seq INTEGER PRIMARY KEY,
+    upload_id TEXT NOT NULL,
+    inspection_id TEXT NOT NULL,
+    transformer_code TEXT,
+    image_id TEXT,
+    action TEXT,
+    kind TEXT,
+    class_id INTEGER,
+    class_name TEXT,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_records_inspection ON records (inspection_id);
+CREATE INDEX IF NOT EXISTS idx_records_transformer ON records (transformer_code);
+CREATE INDEX IF NOT EXISTS idx_records_class ON records (class_id);
+CREATE INDEX IF NOT EXISTS idx_records_action ON records (action);
+CREATE INDEX IF NOT EXISTS idx_records_upload ON records (upload_id);
+
+CREATE TABLE IF NOT EXISTS watermarks (
+    consumer TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS legacy_imports (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    upload_id TEXT
+);
+"""
+
+
+def _flock(f):
+    try:
+        import fcntl
+        fcntl.flock(f, fcntl.LOCK_EX)
+    except ImportError:
+        pass
+
+
+def _comparison_label(comparison: Dict) -> Tuple[str, Optional[int], Optional[str]]:
+    """
+    Which annotation a comparison contributes to training: ('human'|'ai'|'none', class_id, class_name)
+
+    Added detections carry the human box; approved/edited/created/rejected ones are about the AI box.
+    """
+    human = comparison.get('humanAnnotation')
+    ai = comparison.get('aiPrediction')
+    if human and (comparison.get('actionTaken') == 'added' or not ai):
+        return 'human', human.get('classId'), human.get('className')
+    if ai:
+        return 'ai', ai.get('classId'), ai.get('className')
+    return 'none', None, None
+
+
+class FeedbackStore:
+    def __init__(self, store_dir: str, segment_max_bytes: int = SEGMENT_MAX_BYTES):
+        """
+        Append-only feedback store
+
+        Args:
+            store_dir: Directory for segments/ and index.sqlite3
+            segment_max_bytes: Size after which a new segment file is started
+        """
+        self.store_dir = store_dir
+        self.segment_dir = os.path.join(store_dir, 'segments')
+        self.index_path = os.path.join(store_dir, 'index.sqlite3')
+        self.lock_path = os.path.join(store_dir, 'write.lock')
+        self.segment_max_bytes = segment_max_bytes
+
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+        with self._write_lock():
+            self._recover_tail()
+
+    # ------------------------------------------------------------------ internals
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._conn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize writers across threads and processes"""
+        with open(self.lock_path, 'a') as lock_file:
+            _flock(lock_file)
+            yield
+
+    def _current_segment(self) -> str:
+        segments = sorted(glob.glob(os.path.join(self.segment_dir, 'seg-*.jsonl')))
+        if segments and os.path.getsize(segments[-1]) < self.segment_max_bytes:
+            return segments[-1]
+        number = int(os.path.basename(segments[-1])[4:10]) + 1 if segments else 1
+        return os.path.join(self.segment_dir, f"seg-{number:06d}.jsonl")
+
+    def _recover_tail(self):
+        """Index records that reached a segment but not the index (crash between the two)"""
+        conn = self._conn()
+        row = conn.execute('SELECT segment, offset, length FROM records ORDER BY seq DESC LIMIT 1').fetchone()
+        segments = sorted(glob.glob(os.path.join(self.segment_dir, 'seg-*.jsonl')))
+        if not segments:
+            return
+        if row:
+            start_segment = row['segment']
+            start_offset = row['offset'] + row['length']
+        else:
+            start_segment = os.path.basename(segments[0])
+            start_offset = 0
+
+        recovered = 0
+        for path in segments:
+            name = os.path.basename(path)
+            if name < start_segment:
+                continue
+            offset = start_offset if name == start_segment else 0
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                for raw in f:
+                    if not raw.endswith(b'\n'):
+                        break  # Torn write; the next append starts a clean line after it
+                    try:
+                        record = json.loads(raw)
+                    except ValueError:
+                        offset += len(raw)
+                        continue
+                    self._index_record(conn, record, name, offset, len(raw))
+                    offset += len(raw)
+                    recovered += 1
+        if recovered:
+            conn.commit()
+            logger.warning(f"Recovered {recovered} unindexed feedback record(s) from segments")
+
+    @staticmethod
+    def _ends_with_newline(path: str, size: int) -> bool:
+        with open(path, 'rb') as f:
+            f.seek(size - 1)
+            return f.read(1) == b'\n'
+
+    def _index_record(self, conn, record: Dict, segment: str, offset: int, length: int):
+        kind, class_id, class_name = _comparison_label(record['comparison'])
+        conn.execute(
+            'INSERT OR IGNORE INTO uploads (upload_id, inspection_id, inspection_number, transformer_code, '
+            'exported_at, received_at, summary) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (record['upload_id'], record['inspection_id'], record.get('inspection_number'),
+             record.get('transformer_code'), record.get('exported_at'), record['received_at'],
+             json.dumps(record.get('summary') or {}))
+        )
+        conn.execute(
+            'INSERT OR IGNORE INTO records (seq, upload_id, inspection_id, transformer_code, image_id, action, '
+            'kind, class_id, class_name, segment, offset, length) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (record['seq'], record['upload_id'], record['inspection_id'], record.get('transformer_code'),
+             record['comparison'].get('imageId'), record['comparison'].get('actionTaken'),
+             kind, class_id, class_name, segment, offset, length)
+        )
+        conn.execute(
+            'UPDATE uploads SET first_seq = COALESCE(MIN(first_seq, ?), ?), last_seq = MAX(COALESCE(last_seq, 0), ?) '
+            'WHERE upload_id = ?',
+            (record['seq'], record['seq'], record['seq'], record['upload_id'])
+        )
+
+    # ------------------------------------------------------------------ writing
+
+    def append_upload(self, feedback_data: Dict, upload_id: str, received_at: str = None) -> Dict:
+        """
+        Append one feedback upload (one record per comparison); idempotent per upload_id
+
+        Returns:
+            dict: upload_id, inspection_id, first_seq, last_seq, records
+        """
+        received_at = received_at or datetime.now().isoformat()
+        with self._write_lock():
+            conn = self._conn()
+            existing = conn.execute('SELECT first_seq, last_seq FROM uploads WHERE upload_id = ?',
+                                    (upload_id,)).fetchone()
+            if existing:
+                return {'upload_id': upload_id, 'inspection_id': feedback_data.get('inspectionId'),
+                        'first_seq': existing['first_seq'], 'last_seq': existing['last_seq'],
+                        'records': 0, 'duplicate': True}
+
+            next_seq = (conn.execute('SELECT COALESCE(MAX(seq), 0) FROM records').fetchone()[0]) + 1
+            segment_path = self._current_segment()
+            segment = os.path.basename(segment_path)
+
+            base = {
+                'upload_id': upload_id,
+                'received_at': received_at,
+                'inspection_id': feedback_data['inspectionId'],
+                'inspection_number': feedback_data.get('inspectionNumber'),
+                'transformer_code': feedback_data.get('transformerCode'),
+                'exported_at': feedback_data.get('exportedAt'),
+                'summary': feedback_data.get('summary', {})
+            }
+            comparisons = feedback_data.get('comparisons', [])
+            lines = []
+            for i, comparison in enumerate(comparisons):
+                record = dict(base, seq=next_seq + i, comparison=comparison)
+                lines.append((record, (json.dumps(record, separators=(',', ':')) + '\n').encode()))
+
+            with open(segment_path, 'ab') as f:
+                offset = f.tell()
+                if offset and lines and not self._ends_with_newline(segment_path, offset):
+                    f.write(b'\n')  # Terminate a torn line left by a crash mid-append
+                    offset += 1
+                f.write(b''.join(line for _, line in lines))
+                f.flush()
+                os.fsync(f.fileno())
+
+            with self._connection() as conn:
+                if not lines:
+                    conn.execute(
+                        'INSERT INTO uploads (upload_id, inspection_id, inspection_number, transformer_code, '
+                        'exported_at, received_at, summary) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (upload_id, base['inspection_id'], base['inspection_number'], base['transformer_code'],
+                         base['exported_at'], received_at, json.dumps(base['summary']))
+                    )
+                for record, line in lines:
+                    self._index_record(conn, record, segment, offset, len(line))
+                    offset += len(line)
+
+        first_seq = next_seq if lines else None
+        last_seq = next_seq + len(lines) - 1 if lines else None
+        return {'upload_id': upload_id, 'inspection_id': base['inspection_id'],
+                'first_seq': first_seq, 'last_seq': last_seq, 'records': len(lines)}
+
+    def import_legacy_files(self, feedback_dir: str) -> int:
+        """
+        Import legacy feedback_<inspectionId>.json files (each file version once)
+
+        Returns:
+            int: Number of files imported
+        """
+        imported = 0
+        for path in sorted(glob.glob(os.path.join(feedback_dir, 'feedback_*.json'))):
+            mtime = os.path.getmtime(path)
+            row = self._conn().execute('SELECT mtime FROM legacy_imports WHERE path = ?',
+                                       (os.path.abspath(path),)).fetchone()
+            if row and row['mtime'] >= mtime:
+                continue
+            try:
+                with open(path, 'r') as f:
+                    feedback_data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable legacy feedback file {path}: {e}")
+                continue
+            if 'inspectionId' not in feedback_data:
+                continue
+
+            # A file older than feedback already uploaded into the store must not supersede it
+            latest = self.latest_upload(feedback_data['inspectionId'])
+            if latest and not latest['upload_id'].startswith('legacy:'):
+                continue
+
+            upload_id = f"legacy:{os.path.basename(path)}:{int(mtime)}"
+            received_at = datetime.fromtimestamp(mtime).isoformat()
+            self.append_upload(feedback_data, upload_id, received_at=received_at)
+            with self._connection() as conn:
+                conn.execute('INSERT OR REPLACE INTO legacy_imports (path, mtime, upload_id) VALUES (?, ?, ?)',
+                             (os.path.abspath(path), mtime, upload_id))
+            imported += 1
+        if imported:
+            logger.info(f"Imported {imported} legacy feedback file(s) from {feedback_dir}")
+        return imported
+
+    # ------------------------------------------------------------------ reading
+
+    def _read_records(self, rows) -> Iterator[Dict]:
+        """Read the segment lines behind index rows (grouped per segment, in seq order)"""
+        handles = {}
+        try:
+            for row in rows:
+                f = handles.get(row['segment'])
+                if f is None:
+                    f = handles[row['segment']] = open(os.path.join(self.segment_dir, row['segment']), 'rb')
+                f.seek(row['offset'])
+                yield json.loads(f.read(row['length']))
+        finally:
+            for f in handles.values():
+                f.close()
+
+    def query(self, since_seq: int = 0, inspection_id: str = None, transformer_code: str = None,
+              class_id: int = None, action=None, kind: str = None, latest_only: bool = True,
+              limit: int = None) -> List[Dict]:
+        """
+        Records matching the filters, in sequence order
+
+        Args:
+            since_seq: Only records with seq > since_seq (a watermark)
+            action: Single action or list of actions (e.g. ['approved', 'edited'])
+            kind: 'human' or 'ai'
+            latest_only: Skip records of uploads superseded by a newer upload of the same inspection
+                         (uploads are ordered by arrival in the store)
+        """
+        clauses = ['r.seq > ?']
+        params = [since_seq]
+        for column, value in (('r.inspection_id', inspection_id), ('r.transformer_code', transformer_code),
+                              ('r.class_id', class_id), ('r.kind', kind)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if action is not None:
+            actions = [action] if isinstance(action, str) else list(action)
+            clauses.append(f"r.action IN ({','.join('?' * len(actions))})")
+            params.extend(actions)
+        if latest_only:
+            clauses.append(
+                'r.upload_id = (SELECT u.upload_id FROM uploads u WHERE u.inspection_id = r.inspection_id '
+                'ORDER BY u.rowid DESC LIMIT 1)'
+            )
+
+        sql = f"SELECT r.* FROM records r WHERE {' AND '.join(clauses)} ORDER BY r.seq"
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+        rows = self._conn().execute(sql, params).fetchall()
+        return list(self._read_records(rows))
+
+    def read_since(self, consumer: str, commit: bool = True, **filters) -> Tuple[List[Dict], int]:
+        """
+        Incremental reader: records added since the consumer's watermark
+
+        Args:
+            consumer: Watermark name (e.g. 'dataset_creator')
+            commit: Advance the watermark to the newest record read
+            filters: Extra query() filters (latest_only defaults to False here - every new record counts)
+
+        Returns:
+            tuple: (records, new watermark)
+        """
+        filters.setdefault('latest_only', False)
+        watermark = self.get_watermark(consumer)
+        records = self.query(since_seq=watermark, **filters)
+        new_watermark = max([watermark] + [r['seq'] for r in records])
+        if commit and new_watermark > watermark:
+            self.set_watermark(consumer, new_watermark)
+        return records, new_watermark
+
+    def get_watermark(self, consumer: str) -> int:
+        row = self._conn().execute('SELECT seq FROM watermarks WHERE consumer = ?', (consumer,)).fetchone()
+        return row['seq'] if row else 0
+
+    def set_watermark(self, consumer: str, seq: int):
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO watermarks (consumer, seq, updated_at) VALUES (?, ?, ?)',
+                         (consumer, seq, datetime.now().isoformat()))
+
+    def latest_upload(self, inspection_id: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            'SELECT * FROM uploads WHERE inspection_id = ? ORDER BY rowid DESC LIMIT 1',
+            (inspection_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def uploads_since(self, rowid: int = 0) -> List[Dict]:
+        """Uploads that arrived after the given upload position (rowid), in arrival order"""
+        rows = self._conn().execute('SELECT rowid AS position, * FROM uploads WHERE rowid > ? ORDER BY rowid',
+                                    (rowid,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict:
+        conn = self._conn()
+        return {
+            'uploads': conn.execute('SELECT COUNT(*) FROM uploads').fetchone()[0],
+            'records': conn.execute('SELECT COUNT(*) FROM records').fetchone()[0],
+            'inspections': conn.execute('SELECT COUNT(DISTINCT inspection_id) FROM uploads').fetchone()[0],
+            'max_seq': conn.execute('SELECT COALESCE(MAX(seq), 0) FROM records').fetchone()[0],
+            'segments': len(glob.glob(os.path.join(self.segment_dir, 'seg-*.jsonl')))
+        }
+
+
+class LatestFeedbackView:
+    def __init__(self, store: FeedbackStore, actions: Optional[List[str]] = None):
+        """
+        In-memory view of the latest upload of every inspection, kept current incrementally
+
+        Each refresh() reads only uploads and records added since the previous one,
+        so a long-running process pays for new feedback, not for the whole history.
+
+        Args:
+            store: Feedback store to follow
+            actions: Keep only records with these actions (default: all)
+        """
+        self.store = store
+        self.actions = set(actions) if actions else None
+        self.watermark = 0
+        self.upload_position = 0
+        self._inspections: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> int:
+        """
+        Apply feedback added since the last refresh
+
+        Returns:
+            int: Number of new records kept
+        """
+        with self._lock:
+            # Records first: every upload they belong to is then visible in the uploads query
+            records = self.store.query(since_seq=self.watermark, latest_only=False)
+            for upload in self.store.uploads_since(self.upload_position):
+                # A newer upload of an inspection replaces the older one entirely
+                self._inspections[upload['inspection_id']] = {'upload_id': upload['upload_id'], 'records': []}
+                self.upload_position = upload['position']
+
+            kept = 0
+            for record in records:
+                self.watermark = max(self.watermark, record['seq'])
+                entry = self._inspections.get(record['inspection_id'])
+                if entry is None or entry['upload_id'] != record['upload_id']:
+                    continue  # Superseded by a newer upload
+                if self.actions is None or record['comparison'].get('actionTaken') in self.actions:
+                    entry['records'].append(record)
+                    kept += 1
+            return kept
+
+    def records(self) -> List[Dict]:
+        """Records of the latest upload per inspection, in sequence order"""
+        with self._lock:
+            records = [r for entry in self._inspections.values() for r in entry['records']]
+        return sorted(records, key=lambda r: r['seq'])
+
+
+_stores: Dict[str, FeedbackStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(feedback_dir: str) -> FeedbackStore:
+    """
+    Shared store under <feedback_dir>/store; legacy feedback_*.json files in
+    feedback_dir are imported the first time the store is opened in a process
+    """
+    key = os.path.abspath(feedback_dir)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = FeedbackStore(os.path.join(key, 'store'))
+            store.import_legacy_files(key)
+            _stores[key] = store
+        return store
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Image Cache
+Images received as bytes by /api/detect, kept in memory under their SHA-256 so a
+client can refer to them by hash on later requests (a baseline is typically compared
+with many inspections) instead of sending them again. Entries are EncodedImage objects
+that also keep their decodings, so a hit skips the decode too. Least recently used
+entries are evicted beyond the byte budget.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ImageCache:
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes: Budget for encoded plus decoded bytes (0 disables the cache)
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, image):
+        """Cache an EncodedImage; returns the cached entry when the same content is already in"""
+        with self._lock:
+            cached = self._entries.get(image.sha256)
+            if cached is not None:
+                self._entries.move_to_end(image.sha256)
+                return cached
+            if self.max_bytes > 0:
+                self._entries[image.sha256] = image
+                self._evict()
+        return image
+
+    def get(self, sha256):
+        with self._lock:
+            image = self._entries.get(sha256.lower())
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(image.sha256)
+            self.hits += 1
+            return image
+
+    def _evict(self):
+        # Decodings grow entries after insertion, so the total is recomputed here
+        total = self._total_bytes()
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, image = self._entries.popitem(last=False)
+            total -= image.nbytes
+            self.evictions += 1
+
+    def _total_bytes(self):
+        return sum(image.nbytes for image in self._entries.values())
+
+    def trim(self):
+        """Evict down to the budget (entries decoded since they were added count now)"""
+        with self._lock:
+            self._evict()
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return self._total_bytes()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'mb': round(self._total_bytes() / (1024 * 1024), 1),
+                'budget_mb': round(self.max_bytes / (1024 * 1024), 1),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
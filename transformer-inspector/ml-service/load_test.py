@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+ML Service Load Test
+Open-loop HTTP load generator for the Flask service (asyncio, stdlib only, local
+targets only). Requests are drawn from a mix - weighted JSONL entries such as
+/api/detect with and without a baseline and /api/feedback/upload bursts - and sent
+at Poisson arrival times regardless of how fast the service answers, so latency
+includes queueing once the service falls behind. Each rate step reports throughput,
+latency percentiles and error rate against a p99 SLO; the first step that misses it
+is the saturation point.
+
+With --spawn the service is started with ML_STUB_MODEL=1 in scratch directories,
+so no weights are needed and feedback uploads trigger stub fine-tunes that compete
+for the CPU in the background.
+
+Mix file (one JSON object per line):
+    {"name": "detect_baseline", "method": "POST", "path": "/api/detect",
+     "json": {...}, "weight": 6, "burst": 1, "at": 1.5}
+Strings may contain {uuid} and {seq}, replaced per request. "weight" drives random
+draws; with --replay the entries are sent once in file order at their "at" offsets.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import asyncio
+import argparse
+import ipaddress
+import subprocess
+import tempfile
+import shutil
+from urllib.parse import urlsplit
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Faulty_Detection'))
+
+SERVICE_DIR = Path(__file__).resolve().parent
+# Offered rate must be met within this fraction for a step to count as sustained
+MIN_THROUGHPUT_RATIO = 0.9
+
+
+def summarize(latencies_ms):
+    if not latencies_ms:
+        return {'n': 0}
+    arr = np.array(latencies_ms)
+    return {
+        'n': int(arr.size),
+        'mean_ms': float(arr.mean()),
+        'p50_ms': float(np.percentile(arr, 50)),
+        'p90_ms': float(np.percentile(arr, 90)),
+        'p95_ms': float(np.percentile(arr, 95)),
+        'p99_ms': float(np.percentile(arr, 99)),
+        'max_ms': float(arr.max())
+    }
+
+
+def local_target(url):
+    """(host, port) of a loopback URL; anything else is refused"""
+    parts = urlsplit(url)
+    if parts.scheme != 'http' or not parts.hostname:
+        raise ValueError(f"Only plain http:// URLs are supported: {url}")
+    try:
+        address = ipaddress.ip_address(socket.gethostbyname(parts.hostname))
+    except socket.gaierror as e:
+        raise ValueError(f"Cannot resolve {parts.hostname}: {e}")
+    if not address.is_loopback:
+        raise ValueError(f"Refusing non-local target {parts.hostname} ({address}); load tests run against localhost only")
+    return parts.hostname, parts.port or 80
+
+
+def load_mix(path):
+    """Read and validate a JSONL request mix"""
+    entries = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if 'method' not in entry or 'path' not in entry:
+                raise ValueError(f"{path}:{line_no}: mix entries need 'method' and 'path'")
+            entry.setdefault('name', f"{entry['method']} {entry['path']}")
+            entry.setdefault('weight', 1)
+            entry.setdefault('burst', 1)
+            entries.append(entry)
+    if not entries:
+        raise ValueError(f"{path}: empty request mix")
+    return entries
+
+
+def default_mix(work_dir, resolution='640x480', seed=0):
+    """
+    Synthetic thermal pairs on disk plus the mix that uses them: detect with a
+    baseline (several pair variants), detect without one and feedback upload bursts
+    """
+    from synthetic_thermal import make_variant_pairs, parse_resolution, write_pair
+
+    entries = []
+    for name, pair in make_variant_pairs(parse_resolution(resolution), seed=seed,
+                                         variants=['identical', 'shifted', 'hotspots', 'combined']).items():
+        reference_path, target_path = write_pair(pair, work_dir, name)
+        entries.append({
+            'name': 'detect_baseline', 'method': 'POST', 'path': '/api/detect', 'weight': 2,
+            'json': {'inspection_image_path': target_path, 'baseline_image_path': reference_path,
+                     'confidence_threshold': 0.25}
+        })
+        if name == 'hotspots':
+            entries.append({
+                'name': 'detect_single', 'method': 'POST', 'path': '/api/detect', 'weight': 3,
+                'json': {'inspection_image_path': target_path, 'confidence_threshold': 0.25}
+            })
+
+    comparison = {
+        'imageId': 'load-test-{seq}',
+        'actionTaken': 'approved',
+        'aiPrediction': {'classId': 0, 'className': 'faulty', 'confidence': 0.8,
+                         'bbox': {'x1': 100, 'y1': 80, 'x2': 160, 'y2': 140}}
+    }
+    entries.append({
+        'name': 'feedback_upload', 'method': 'POST', 'path': '/api/feedback/upload', 'weight': 0.2, 'burst': 5,
+        'json': {'inspectionId': '{uuid}', 'inspectionNumber': 'LT-{seq}', 'transformerCode': 'LOAD-TEST',
+                 'comparisons': [comparison], 'summary': {'approved': 1}}
+    })
+    entries.append({'name': 'health', 'method': 'GET', 'path': '/api/health/ready', 'weight': 1})
+    return entries
+
+
+def render(value, seq):
+    """Fill {uuid} / {seq} placeholders in a request body"""
+    if isinstance(value, str):
+        if '{' in value:
+            return value.replace('{uuid}', str(uuid.uuid4())).replace('{seq}', str(seq))
+        return value
+    if isinstance(value, dict):
+        return {k: render(v, seq) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render(v, seq) for v in value]
+    return value
+
+
+async def http_request(host, port, method, path, body=None, timeout=30.0):
+    """One HTTP/1.1 request on a fresh connection; returns (status, body bytes)"""
+    async def exchange():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            payload = json.dumps(body).encode() if body is not None else b''
+            head = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", "Connection: close",
+                    f"Content-Length: {len(payload)}"]
+            if body is not None:
+                head.append("Content-Type: application/json")
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + payload)
+            await writer.drain()
+
+            header_block = await reader.readuntil(b'\r\n\r\n')
+            lines = header_block.decode('latin-1').split('\r\n')
+            status = int(lines[0].split()[1])
+            length = None
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value.strip())
+            data = await (reader.readexactly(length) if length is not None else reader.read())
+            return status, data
+        finally:
+            writer.close()
+
+    return await asyncio.wait_for(exchange(), timeout)
+
+
+class LoadRun:
+    """Open-loop sender for one rate step; latency counts from the scheduled arrival time"""
+
+    def __init__(self, host, port, timeout, max_in_flight):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.seq = 0
+        self.results = []
+        self.in_flight = set()
+        self.dropped = 0
+
+    async def _send(self, entry, scheduled):
+        loop = asyncio.get_running_loop()
+        self.seq += 1
+        body = render(entry['json'], self.seq) if 'json' in entry else None
+        status, error = None, None
+        try:
+            status, _ = await http_request(self.host, self.port, entry['method'], entry['path'], body, self.timeout)
+        except asyncio.TimeoutError:
+            error = 'timeout'
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            error = type(e).__name__
+        self.results.append({
+            'name': entry['name'],
+            'status': status,
+            'error': error,
+            'ok': status is not None and 200 <= status < 300,
+            'latency_ms': (loop.time() - scheduled) * 1000,
+            'done': loop.time()
+        })
+
+    def _dispatch(self, entry, scheduled):
+        for _ in range(int(entry.get('burst', 1))):
+            if len(self.in_flight) >= self.max_in_flight:
+                self.dropped += 1
+                continue
+            task = asyncio.ensure_future(self._send(entry, scheduled))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    async def _wait_until(self, at):
+        delay = at - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def run_rate(self, entries, rate, duration, rng):
+        """Poisson arrivals at `rate` per second for `duration` seconds, entries drawn by weight"""
+        loop = asyncio.get_running_loop()
+        weights = [float(e.get('weight', 1)) for e in entries]
+        start = loop.time()
+        at = start
+        while True:
+            at += rng.expovariate(rate)
+            if at - start >= duration:
+                break
+            await self._wait_until(at)
+            self._dispatch(rng.choices(entries, weights)[0], at)
+        if self.in_flight:
+            await asyncio.wait(list(self.in_flight))
+        return start, loop.time()
+
+    async def replay(self, entries, rate, speed):
+        """Each entry once in file order, at its 'at' offset (scaled by speed) or 1/rate apart"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for i, entry in enumerate(entries):
+            offset = entry['at'] / speed if 'at' in entry else i / rate
+            await self._wait_until(start + offset)
+            self._dispatch(entry, start + offset)
+        if self.in_flight:
+            await asyncio.wait(list(self.in_flight))
+        return start, loop.time()
+
+
+def step_report(run, offered_rate, started, finished, duration, slo_p99_ms, max_error_rate):
+    """Throughput, latency percentiles, error rate and SLO verdict of one rate step"""
+    results = run.results
+    sent = len(results) + run.dropped
+    ok = [r for r in results if r['ok']]
+    # Requests still draining after the arrival window stretch the step: a saturated
+    # service shows up as throughput below the offered rate
+    wall = max(duration, finished - started)
+    errors = sent - len(ok)
+    status_counts = {}
+    for r in results:
+        key = str(r['status']) if r['status'] is not None else r['error']
+        status_counts[key] = status_counts.get(key, 0) + 1
+    if run.dropped:
+        status_counts['dropped'] = run.dropped
+
+    by_name = {}
+    for r in results:
+        by_name.setdefault(r['name'], []).append(r)
+    requests = {}
+    for name, rows in sorted(by_name.items()):
+        requests[name] = dict(summarize([r['latency_ms'] for r in rows if r['ok']]),
+                              sent=len(rows), errors=sum(1 for r in rows if not r['ok']))
+
+    latency = summarize([r['latency_ms'] for r in ok])
+    report = {
+        'offered_rps': offered_rate,
+        'sent': sent,
+        'ok': len(ok),
+        'throughput_rps': len(ok) / wall if wall > 0 else 0.0,
+        'error_rate': errors / sent if sent else 0.0,
+        'wall_s': wall,
+        'latency': latency,
+        'requests': requests,
+        'status_counts': status_counts
+    }
+    failures = []
+    if not sent:
+        failures.append("no arrivals in the step (raise --duration)")
+    elif not ok:
+        failures.append("no successful requests")
+    elif latency['p99_ms'] > slo_p99_ms:
+        failures.append(f"p99 {latency['p99_ms']:.0f}ms > {slo_p99_ms:.0f}ms")
+    if report['error_rate'] > max_error_rate:
+        failures.append(f"error rate {report['error_rate']:.1%} > {max_error_rate:.1%}")
+    if offered_rate and sent and report['throughput_rps'] < MIN_THROUGHPUT_RATIO * sent / duration:
+        failures.append(f"throughput {report['throughput_rps']:.1f}/s behind arrivals")
+    report['slo_met'] = not failures
+    report['slo_failures'] = failures
+    return report
+
+
+def print_step(report):
+    lat = report['latency']
+    verdict = '✅' if report['slo_met'] else '❌'
+    rate = f"{report['offered_rps']:.1f}" if report['offered_rps'] else 'replay'
+    print(f"{verdict} {rate:>7} {report['sent']:>6} {report['throughput_rps']:>8.2f} "
+          f"{lat.get('p50_ms', float('nan')):>9.1f} {lat.get('p95_ms', float('nan')):>9.1f} "
+          f"{lat.get('p99_ms', float('nan')):>9.1f} {report['error_rate']:>7.1%}  {'; '.join(report['slo_failures'])}")
+    for name, stats in report['requests'].items():
+        print(f"      {name:<22} sent {stats['sent']:>5}  errors {stats['errors']:>4}  "
+              f"p50 {stats.get('p50_ms', float('nan')):>8.1f}  p99 {stats.get('p99_ms', float('nan')):>8.1f}")
+
+
+def spawn_service(port, scratch_dir, stub_latency_ms, finetune_seconds):
+    """Start the service with the stub model and scratch feedback / corpus stores"""
+    env = dict(os.environ,
+               ML_STUB_MODEL='1',
+               ML_STUB_LATENCY_MS=str(stub_latency_ms),
+               ML_STUB_FINETUNE_SECONDS=str(finetune_seconds),
+               ML_STARTUP_MODE='eager',
+               ML_LOG_LEVEL=os.environ.get('ML_LOG_LEVEL', 'WARNING'),
+               ML_FEEDBACK_DIR=os.path.join(scratch_dir, 'feedback_data'),
+               ML_TRAINING_CORPUS_DIR=os.path.join(scratch_dir, 'training_corpus'),
+               ML_UPLOADS_CATALOG=os.path.join(scratch_dir, 'uploads_catalog.sqlite3'))
+    code = f"import app; app.create_app().run(host='127.0.0.1', port={port}, threaded=True)"
+    return subprocess.Popen([sys.executable, '-c', code], cwd=str(SERVICE_DIR), env=env)
+
+
+async def wait_ready(host, port, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            status, _ = await http_request(host, port, 'GET', '/api/health/ready', timeout=2.0)
+            if status == 200:
+                return True
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            pass
+        await asyncio.sleep(0.25)
+    return False
+
+
+async def feedback_queue_stats(host, port):
+    """Feedback job queue statistics after the run (shows fine-tunes triggered by the uploads)"""
+    try:
+        status, data = await http_request(host, port, 'GET', '/api/feedback/jobs?limit=1', timeout=5.0)
+        return json.loads(data).get('queue') if status == 200 else None
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+        return None
+
+
+async def run(args, host, port, entries):
+    rng = random.Random(args.seed)
+    steps = []
+    print(f"\n   {'rate':>7} {'sent':>6} {'ok/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    if args.replay:
+        load = LoadRun(host, port, args.timeout, args.max_in_flight)
+        started, finished = await load.replay(entries, args.rates[0], args.speed)
+        report = step_report(load, None, started, finished, finished - started, args.slo_p99_ms, args.max_error_rate)
+        print_step(report)
+        steps.append(report)
+    else:
+        for rate in args.rates:
+            load = LoadRun(host, port, args.timeout, args.max_in_flight)
+            started, finished = await load.run_rate(entries, rate, args.duration, rng)
+            report = step_report(load, rate, started, finished, args.duration, args.slo_p99_ms, args.max_error_rate)
+            print_step(report)
+            steps.append(report)
+            if not report['slo_met'] and not args.keep_going:
+                break
+    return steps, await feedback_queue_stats(host, port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Open-loop load test for the ML service (local targets only)')
+    parser.add_argument('--url', default='http://127.0.0.1:5001', help='Service base URL (loopback only)')
+    parser.add_argument('--mix', default=None, help='JSONL request mix (default: synthetic detect + feedback mix)')
+    parser.add_argument('--write-mix', default=None, help='Write the default mix (and its images) here and exit')
+    parser.add_argument('--resolution', default='640x480', help='Synthetic image size for the default mix')
+    parser.add_argument('--rates', default='2,4,8,16',
+                        help='Comma-separated arrival rates (requests/s), stepped until the SLO breaks')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds of arrivals per rate step')
+    parser.add_argument('--replay', action='store_true', help='Send the mix once in file order instead of by weight')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay time scale for "at" offsets')
+    parser.add_argument('--slo-p99-ms', type=float, default=2000.0, help='p99 latency objective per step')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='Error rate objective per step')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--max-in-flight', type=int, default=256,
+                        help='Client-side concurrency cap; arrivals beyond it count as dropped errors')
+    parser.add_argument('--keep-going', action='store_true', help='Run every rate step even after the SLO breaks')
+    parser.add_argument('--seed', type=int, default=0, help='Arrival and request-draw seed')
+    parser.add_argument('--spawn', action='store_true',
+                        help='Start the service with ML_STUB_MODEL=1 and scratch stores on --url\'s port')
+    parser.add_argument('--stub-latency-ms', type=float, default=30.0, help='Emulated forward pass with --spawn')
+    parser.add_argument('--finetune-seconds', type=float, default=20.0, help='Stub fine-tune length with --spawn')
+    parser.add_argument('--output', default=None, help='Write the report as JSON to this file')
+    args = parser.parse_args()
+    args.rates = [float(r) for r in args.rates.split(',') if r.strip()]
+
+    try:
+        host, port = local_target(args.url)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.write_mix:
+        image_dir = os.path.join(os.path.dirname(os.path.abspath(args.write_mix)), 'load_test_images')
+        with open(args.write_mix, 'w') as f:
+            for entry in default_mix(image_dir, args.resolution, args.seed):
+                f.write(json.dumps(entry) + '\n')
+        print(f"💾 Mix written: {args.write_mix} (images in {image_dir})")
+        return 0
+
+    scratch_dir = tempfile.mkdtemp(prefix='ml_load_test_')
+    service = None
+    try:
+        entries = load_mix(args.mix) if args.mix else default_mix(os.path.join(scratch_dir, 'images'),
+                                                                  args.resolution, args.seed)
+        print("🚦 ML service load test")
+        print("=" * 50)
+        print(f"Target: {args.url}  mix: {args.mix or 'default'} ({len(entries)} entries)")
+        print(f"SLO: p99 <= {args.slo_p99_ms:.0f}ms, errors <= {args.max_error_rate:.1%}")
+
+        if args.spawn:
+            service = spawn_service(port, scratch_dir, args.stub_latency_ms, args.finetune_seconds)
+            if not asyncio.run(wait_ready(host, port)):
+                print("❌ Service did not become ready")
+                return 1
+            print(f"📦 Spawned stub-model service (pid {service.pid})")
+
+        steps, queue = asyncio.run(run(args, host, port, entries))
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait(timeout=10)
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    sustained = [s['offered_rps'] for s in steps if s['slo_met']]
+    saturated = next((s for s in steps if not s['slo_met']), None)
+    # A fine-tune that fails (crashed worker, broken training stand-in) frees the CPU it
+    # was meant to compete for, so the latency numbers alone would look better than they are
+    failed_jobs = (queue or {}).get('states', {}).get('failed', 0)
+    summary = {
+        'max_sustained_rps': max(sustained) if sustained and not args.replay else None,
+        'saturation_rps': saturated['offered_rps'] if saturated else None,
+        'saturation_reason': saturated['slo_failures'] if saturated else None,
+        'failed_feedback_jobs': failed_jobs
+    }
+    print()
+    if args.replay:
+        print(f"Replay {'met' if steps[0]['slo_met'] else 'missed'} the SLO")
+    elif saturated:
+        print(f"🔥 Saturation at {saturated['offered_rps']:g} req/s ({'; '.join(saturated['slo_failures'])}); "
+              f"max sustained: {summary['max_sustained_rps'] if sustained else 'none'}")
+    else:
+        print(f"✅ SLO met up to {args.rates[-1]:g} req/s (no saturation in the tested range)")
+    if queue:
+        print(f"Feedback queue after the run: {queue}")
+    if failed_jobs:
+        print(f"❌ {failed_jobs} feedback job(s) failed - see /api/feedback/jobs for their errors")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'target': args.url, 'mix': args.mix or 'default', 'slo_p99_ms': args.slo_p99_ms,
+                       'max_error_rate': args.max_error_rate, 'steps': steps, 'summary': summary,
+                       'feedback_queue': queue}, f, indent=2)
+        print(f"💾 Results saved: {args.output}")
+    return 0 if saturated is None and not failed_jobs else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Service Log Formatting
+Plain text (the default) or one JSON object per line. In JSON mode a record's
+`event` extra (a dict) is merged into the object, so a request summary like
+logger.info("detect ...", extra={'event': {...}}) becomes one machine-readable
+event with its stage timings and counts instead of a dozen free-text lines. Records
+logged while a request is traced carry its trace_id (tracing.py).
+"""
+
+import json
+import logging
+from datetime import datetime, timezone
+
+from tracing import current_trace
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, message, trace_id plus the `event` fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        trace = current_trace()
+        if trace is not None:
+            entry['trace_id'] = trace.trace_id
+        event = getattr(record, 'event', None)
+        if isinstance(event, dict):
+            entry.update(event)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(log_format='text', level='INFO', stream=None):
+    """
+    Install the root handler
+
+    Args:
+        log_format: 'text' or 'json'
+        level: Root level name; per-detection detail is only emitted at DEBUG
+    """
+    handler = logging.StreamHandler(stream)
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    logging.basicConfig(level=getattr(logging, level.upper(), logging.INFO), handlers=[handler])
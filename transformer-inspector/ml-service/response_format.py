@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Detection Response Formats
+/api/detect answers in one of three formats, chosen per request:
+    json      the verbose default: one object per detection (id, className, bbox dict,
+              color) plus the class map in model_info
+    columnar  compact JSON: detections as parallel arrays, no per-detection ids,
+              names or colors and no class map (fetch both once from /api/classes)
+    msgpack   the columnar payload as MessagePack (needs the optional msgpack package)
+The format comes from ?format=<name> or, failing that, the Accept header
+(application/vnd.transx.columnar+json, application/x-msgpack). Errors stay JSON.
+"""
+
+import importlib.util
+import json
+
+JSON = 'json'
+COLUMNAR = 'columnar'
+MSGPACK = 'msgpack'
+
+MIMETYPES = {
+    JSON: 'application/json',
+    COLUMNAR: 'application/vnd.transx.columnar+json',
+    MSGPACK: 'application/x-msgpack'
+}
+MSGPACK_AVAILABLE = importlib.util.find_spec('msgpack') is not None
+# Per-detection fields that become one array each in the compact formats
+COLUMNS = ('classId', 'confidence', 'x1', 'y1', 'x2', 'y2', 'source')
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+def available_formats():
+    return [JSON, COLUMNAR] + ([MSGPACK] if MSGPACK_AVAILABLE else [])
+
+
+def negotiate(request):
+    """
+    Response format for a request: ?format= wins, else the best Accept match (JSON when
+    the header is absent or only matches wildcards)
+
+    Raises:
+        UnsupportedFormat: ?format= names an unknown format or msgpack is not installed
+    """
+    requested = request.args.get('format')
+    if requested:
+        requested = requested.lower()
+        if requested not in available_formats():
+            raise UnsupportedFormat(f"Unsupported format '{requested}' (available: {', '.join(available_formats())})")
+        return requested
+    offers = {MIMETYPES[name]: name for name in available_formats()}
+    # JSON first so that */* and a missing header keep the verbose default
+    best = request.accept_mimetypes.best_match(list(offers), default=MIMETYPES[JSON])
+    return offers.get(best, JSON)
+
+
+def columnar(response):
+    """Verbose detect response -> compact payload (the verbose dict is left unchanged)"""
+    detections = response.get('detections', [])
+    columns = {name: [] for name in COLUMNS}
+    for detection in detections:
+        bbox = detection['bbox']
+        columns['classId'].append(detection['classId'])
+        columns['confidence'].append(detection['confidence'])
+        columns['x1'].append(bbox['x1'])
+        columns['y1'].append(bbox['y1'])
+        columns['x2'].append(bbox['x2'])
+        columns['y2'].append(bbox['y2'])
+        columns['source'].append(detection['source'])
+    compact = {key: value for key, value in response.items() if key not in ('detections', 'model_info')}
+    compact['format'] = COLUMNAR
+    compact['count'] = len(detections)
+    compact['detections'] = columns
+    compact['model_info'] = {key: value for key, value in response.get('model_info', {}).items()
+                             if key != 'classes'}
+    return compact
+
+
+def encode(response, fmt):
+    """Compact (columnar or msgpack) body and its mimetype for a verbose detect response"""
+    payload = columnar(response)
+    if fmt == MSGPACK:
+        import msgpack
+        return msgpack.packb(payload, use_bin_type=True), MIMETYPES[MSGPACK]
+    return json.dumps(payload, separators=(',', ':')), MIMETYPES[COLUMNAR]
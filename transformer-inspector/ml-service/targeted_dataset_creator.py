@@ -20,19 +20,47 @@ from typing import List, Dict, Any, Tuple, Optional
 import glob
 import random
 
+from augmentation_engine import AugmentationEngine, write_label_files
+from augment_kernels import kernels
+from augment_ops import apply_augmentation, transform_yolo_lines
+from detection_classes import CLASS_NAMES
+from feedback_store import LatestFeedbackView, open_store
+from uploads_catalog import open_catalog, resolve_uploads_dir
+from training_corpus import open_corpus, NEW_SAMPLE_AUGMENTS, IN_MEMORY_AUGMENT, RUN_MANIFEST
+
+TRAINING_ACTIONS_AI = ('approved', 'created', 'edited')
+
+# One incremental view per store, shared by the creators of a process
+_feedback_views: Dict[str, LatestFeedbackView] = {}
+
+
+def _feedback_view(store) -> LatestFeedbackView:
+    view = _feedback_views.get(store.store_dir)
+    if view is None:
+        view = _feedback_views.setdefault(
+            store.store_dir, LatestFeedbackView(store, actions=('added',) + TRAINING_ACTIONS_AI))
+    return view
+
+
 class TargetedDatasetCreator:
     def __init__(self, base_dir: str = None):
         """Initialize the dataset creator with configuration"""
         self.base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
-        self.feedback_dir = os.path.join(self.base_dir, 'feedback_data')
-        self.uploads_dir = os.path.join(self.base_dir, '..', 'backend', 'uploads')
+        self.feedback_dir = os.environ.get('ML_FEEDBACK_DIR', os.path.join(self.base_dir, 'feedback_data'))
+        self.feedback_store = open_store(self.feedback_dir)
+        self.uploads_dir = resolve_uploads_dir(self.base_dir)
+        self.uploads_catalog = open_catalog(self.uploads_dir)
+        self.training_corpus = open_corpus()
         
         # Setup logging
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
         
-        # Load class mapping dynamically from app.py
-        self.class_mapping = self._load_class_mapping_from_app()
+        # Class mapping shared with the service
+        self.class_mapping = self._load_class_mapping()
+        
+        # Decode-once, parallel augmentation with per-index seeding
+        self.augmentation_engine = AugmentationEngine()
         
         # No default class ID - preserve actual class IDs from feedback
         # Only use fallback for truly unknown/invalid classes
@@ -40,97 +68,43 @@ class TargetedDatasetCreator:
         self.logger.info(f"TargetedDatasetCreator initialized with base directory: {self.base_dir}")
         self.logger.info(f"Feedback directory: {self.feedback_dir}")
 
-    def _load_class_mapping_from_app(self) -> Dict[int, str]:
+    def _load_class_mapping(self) -> Dict[int, str]:
         """
-        Load CLASS_NAMES mapping from app.py to ensure consistency
+        Class mapping of the served model (detection_classes.CLASS_NAMES), so training
+        labels use the ids the service reports
         """
-        try:
-            # Import app.py to get the current CLASS_NAMES
-            import sys
-            import os
-            
-            # Add current directory to path if not already there
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            if current_dir not in sys.path:
-                sys.path.insert(0, current_dir)
-            
-            # Import the CLASS_NAMES from app.py
-            from app import CLASS_NAMES
-            
-            # Create mapping with class 4 -> class 3 transformation
-            class_mapping = {}
-            for class_id, class_name in CLASS_NAMES.items():
-                class_mapping[class_id] = class_name
-            
-            # Add mapping for class 4 (human marked potential) -> maps to class 3
-            if 3 in CLASS_NAMES:
-                class_mapping[4] = CLASS_NAMES[3]  # potential_faulty
-            
-            self.logger.info(f"Loaded class mapping from app.py: {class_mapping}")
-            return class_mapping
-            
-        except ImportError as e:
-            self.logger.warning(f"Could not import CLASS_NAMES from app.py: {e}")
-            # Fallback to hardcoded mapping
-            fallback_mapping = {
-                0: "faulty",
-                1: "faulty_loose_joint", 
-                2: "faulty_point_overload",
-                3: "potential_faulty"
-            }
-            self.logger.info(f"Using fallback class mapping: {fallback_mapping}")
-            return fallback_mapping
-        except Exception as e:
-            self.logger.error(f"Error loading class mapping from app.py: {e}")
-            # Fallback to hardcoded mapping
-            fallback_mapping = {
-                0: "faulty",
-                1: "faulty_loose_joint",
-                2: "faulty_point_overload", 
-                3: "potential_faulty"
-            }
-            return fallback_mapping
+        class_mapping = dict(CLASS_NAMES)
+        
+        # Add mapping for class 4 (human marked potential) -> maps to class 3
+        if 3 in CLASS_NAMES:
+            class_mapping[4] = CLASS_NAMES[3]  # potential_faulty
+        
+        self.logger.info(f"Loaded class mapping: {class_mapping}")
+        return class_mapping
 
-    def find_latest_inspection_directory(self) -> Optional[str]:
-        """Find the most recent inspection directory in uploads"""
+    def find_latest_inspection_directory(self, inspection_number: str = None) -> Optional[str]:
+        """
+        Find the upload directory of an inspection via the uploads catalog
+        
+        Uses the directory holding the inspection's annotated export when there is one,
+        otherwise the directory with the most recently uploaded image.
+        """
         try:
-            # Try to read upload_base from application.properties (app.storage.root)
-            upload_base = None
-            properties_path = os.path.join(self.base_dir, '..', 'backend','src','main','resources','application.properties')
-            if os.path.exists(properties_path):
-                try:
-                    with open(properties_path, 'r') as prop_file:
-                        for line in prop_file:
-                            if line.strip().startswith('app.storage.root'):
-                                key, value = line.strip().split('=', 1)
-                                upload_base = value.strip()
-                                break
-                except Exception as prop_err:
-                    self.logger.warning(f"Could not read application.properties: {prop_err}")
-            # Fallback to hardcoded path if not found
-            if not upload_base:
-                upload_base = "/Users/jaliya/Desktop/Jaliya/Semester 7/Software/TransXTransformer-Maintenance-Platform/transformer-inspector/backend/uploads"
-
-            if not os.path.exists(upload_base):
-                self.logger.error(f"Upload directory does not exist: {upload_base}")
-                return None
-
-            # Find all directories in uploads
-            directories = []
-            for item in os.listdir(upload_base):
-                item_path = os.path.join(upload_base, item)
-                if os.path.isdir(item_path):
-                    directories.append(item_path)
-
-            if not directories:
-                self.logger.error("No inspection directories found in uploads")
+            entry = None
+            if inspection_number:
+                entry = self.uploads_catalog.latest_for_inspection(inspection_number)
+                if not entry:
+                    self.logger.warning(f"No annotated image for inspection {inspection_number}, "
+                                        f"using the most recent upload")
+            entry = entry or self.uploads_catalog.latest_image()
+            if not entry:
+                self.logger.error(f"No inspection directories found in uploads: {self.uploads_catalog.uploads_dir}")
                 return None
-
-            # Sort by modification time, get the latest
-            latest_dir = max(directories, key=os.path.getmtime)
+            
+            latest_dir = os.path.dirname(entry['folder'])
             self.logger.info(f"Found latest inspection directory: {latest_dir}")
             return latest_dir
-
+            
         except Exception as e:
             self.logger.error(f"Error finding latest inspection directory: {e}")
             return None
@@ -138,21 +112,11 @@ class TargetedDatasetCreator:
     def find_image_file(self, image_id: str, inspection_dir: str) -> Optional[str]:
         """Find the actual image file for a given image ID"""
         try:
-            # Check both baseline and inspection folders
-            for subdir in ['baseline', 'inspection']:
-                search_dir = os.path.join(inspection_dir, subdir)
-                if not os.path.exists(search_dir):
-                    continue
-                    
-                # Look for files starting with the image ID
-                pattern = os.path.join(search_dir, f"{image_id}*")
-                matching_files = glob.glob(pattern)
-                
-                if matching_files:
-                    image_path = matching_files[0]
-                    self.logger.info(f"Found image: {image_path}")
-                    return image_path
-                    
+            entry = self.uploads_catalog.get_image(image_id, transformer_id=os.path.basename(inspection_dir))
+            if entry:
+                self.logger.info(f"Found image: {entry['path']}")
+                return entry['path']
+            
             self.logger.warning(f"Image not found for ID: {image_id}")
             return None
             
@@ -162,7 +126,10 @@ class TargetedDatasetCreator:
     
     def parse_feedback_data(self) -> Tuple[List[Dict], List[Dict]]:
         """
-        Parse all feedback files and extract training data
+        Collect training data from the latest feedback upload of every inspection
+        
+        Reads the feedback store through an incremental view, so repeated runs in
+        one process only read feedback added since the previous run.
         
         Returns:
             Tuple of (human_annotations, ai_detections) for training
@@ -171,53 +138,47 @@ class TargetedDatasetCreator:
         ai_detections = []
         
         try:
-            feedback_files = glob.glob(os.path.join(self.feedback_dir, 'feedback_*.json'))
-            self.logger.info(f"Processing {len(feedback_files)} feedback files")
-            
-            for feedback_file in feedback_files:
-                with open(feedback_file, 'r') as f:
-                    feedback_data = json.load(f)
+            view = _feedback_view(self.feedback_store)
+            new_records = view.refresh()
+            records = view.records()
+            self.logger.info(f"Processing {len(records)} feedback records ({new_records} new)")
+            
+            for record in records:
+                comparison = record['comparison']
+                inspection_id = record['inspection_id']
+                image_id = comparison.get('imageId')
+                action_taken = comparison.get('actionTaken')
                 
-                inspection_id = feedback_data.get('inspectionId')
-                self.logger.info(f"Processing feedback for inspection: {inspection_id}")
+                # Process human annotations (missed detections)
+                human_annotation = comparison.get('humanAnnotation')
+                if human_annotation and action_taken == 'added':
+                    annotation_data = {
+                        'image_id': image_id,
+                        'bbox': human_annotation['bbox'],
+                        'class_id': human_annotation['classId'],
+                        'class_name': human_annotation['className'],
+                        'confidence': human_annotation['confidence'],
+                        'source': 'human_missed',
+                        'inspection_id': inspection_id,
+                        'action_taken': action_taken
+                    }
+                    human_annotations.append(annotation_data)
                 
-                for comparison in feedback_data.get('comparisons', []):
-                    image_id = comparison.get('imageId')
-                    action_taken = comparison.get('actionTaken')
-                    
-                    # Process human annotations (missed detections)
-                    human_annotation = comparison.get('humanAnnotation')
-                    if human_annotation and action_taken == 'added':
-                        annotation_data = {
-                            'image_id': image_id,
-                            'bbox': human_annotation['bbox'],
-                            'class_id': human_annotation['classId'],
-                            'class_name': human_annotation['className'],
-                            'confidence': human_annotation['confidence'],
-                            'source': 'human_missed',
-                            'inspection_id': inspection_id,
-                            'action_taken': action_taken
-                        }
-                        human_annotations.append(annotation_data)
-                        self.logger.info(f"Added human annotation: {human_annotation['className']} for image {image_id}")
-                    
-                    # Process AI detections that were approved or implicitly accepted
-                    ai_prediction = comparison.get('aiPrediction')
-                    if ai_prediction:
-                        # Include if: approved, edited (implies acceptance), or created (not rejected)
-                        if action_taken in ['approved', 'created', 'edited']:
-                            detection_data = {
-                                'image_id': image_id,
-                                'bbox': ai_prediction['bbox'],
-                                'class_id': ai_prediction['classId'],
-                                'class_name': ai_prediction['className'],
-                                'confidence': ai_prediction['confidence'],
-                                'source': f'ai_{action_taken}',
-                                'inspection_id': inspection_id,
-                                'action_taken': action_taken
-                            }
-                            ai_detections.append(detection_data)
-                            self.logger.info(f"Added AI detection: {ai_prediction['className']} ({action_taken}) for image {image_id}")
+                # Process AI detections that were approved or implicitly accepted
+                ai_prediction = comparison.get('aiPrediction')
+                # Include if: approved, edited (implies acceptance), or created (not rejected)
+                if ai_prediction and action_taken in TRAINING_ACTIONS_AI:
+                    detection_data = {
+                        'image_id': image_id,
+                        'bbox': ai_prediction['bbox'],
+                        'class_id': ai_prediction['classId'],
+                        'class_name': ai_prediction['className'],
+                        'confidence': ai_prediction['confidence'],
+                        'source': f'ai_{action_taken}',
+                        'inspection_id': inspection_id,
+                        'action_taken': action_taken
+                    }
+                    ai_detections.append(detection_data)
             
             self.logger.info(f"Collected {len(human_annotations)} human annotations and {len(ai_detections)} AI detections")
             return human_annotations, ai_detections
@@ -313,7 +274,7 @@ class TargetedDatasetCreator:
                 self.logger.info(f"Copied {human_images_count} human-annotated images from existing dataset")
             
             # Now add AI-detected positive examples from current images
-            latest_inspection_dir = self.find_latest_inspection_directory()
+            latest_inspection_dir = self.find_latest_inspection_directory(inspection_number)
             if not latest_inspection_dir:
                 self.logger.warning("No latest inspection directory found, using only existing human annotations")
                 ai_images_count = 0
@@ -335,7 +296,7 @@ class TargetedDatasetCreator:
                 'train': 'images/train',
                 'val': 'images/train',  # Using same for validation (small dataset)
                 'nc': 4,  # Number of classes
-                'names': class_names  # Dynamic class names from app.py
+                'names': class_names  # Class names shared with the service
             }
             
             yaml_path = os.path.join(enhanced_dir, 'dataset.yaml')
@@ -395,7 +356,7 @@ Total Images: {total_images}
         """Add AI-detected positive examples from the latest annotated image with augmentation"""
         try:
             # Get the single latest annotated image from current inspection
-            latest_image = self._get_latest_annotated_image(inspection_dir)
+            latest_image = self._get_latest_annotated_image(inspection_dir, inspection_number)
             
             if not latest_image:
                 self.logger.warning("No latest annotated image found")
@@ -406,9 +367,6 @@ Total Images: {total_images}
             # Create multiple augmented copies from this single latest image
             num_augmentations = 10  # Create 10 augmented versions
             
-            added_images = 0
-            total_annotations = 0
-            
             # Get image dimensions
             img_width, img_height = 640, 640
             try:
@@ -419,33 +377,12 @@ Total Images: {total_images}
                 pass
             
             # Create augmented copies of the latest annotated image
-            for i in range(num_augmentations):
-                try:
-                    # Create augmented image filename
-                    image_filename = f"{inspection_number}_augmented_{start_index + i:03d}.jpg"
-                    dest_image_path = os.path.join(images_dir, image_filename)
-                    
-                    # Apply augmentation and save
-                    self._create_augmented_image(latest_image, dest_image_path, i)
-                    
-                    # Create synthetic positive annotations for this augmented image
-                    annotations = self._generate_positive_annotations(img_width, img_height)
-                    
-                    # Write YOLO label file
-                    label_filename = f"{inspection_number}_augmented_{start_index + i:03d}.txt"
-                    label_path = os.path.join(labels_dir, label_filename)
-                    
-                    with open(label_path, 'w') as f:
-                        for annotation in annotations:
-                            f.write(annotation + '\n')
-                            total_annotations += 1
-                    
-                    added_images += 1
-                    self.logger.info(f"Added augmented image {added_images}: {image_filename} with {len(annotations)} annotations")
-                    
-                except Exception as e:
-                    self.logger.warning(f"Failed to create augmentation {i}: {e}")
-                    continue
+            stems = [f"{inspection_number}_augmented_{start_index + i:03d}" for i in range(num_augmentations)]
+            added_images, total_annotations = self._build_augmented_set(
+                latest_image, images_dir, labels_dir, stems,
+                # Create synthetic positive annotations for each augmented image
+                lambda i: self._generate_positive_annotations(img_width, img_height)
+            )
             
             return added_images, total_annotations
             
@@ -490,166 +427,77 @@ Total Images: {total_images}
         
         return annotations
 
-    def _get_latest_annotated_image(self, inspection_dir: str) -> Optional[str]:
+    def _get_latest_annotated_image(self, inspection_dir: str, inspection_number: str = None) -> Optional[str]:
         """Get the single latest annotated image from the inspection directory"""
         try:
-            all_images = []
-            
-            # Check both baseline and inspection folders
-            for subdir in ['baseline', 'inspection']:
-                search_dir = os.path.join(inspection_dir, subdir)
-                if os.path.exists(search_dir):
-                    for file in os.listdir(search_dir):
-                        if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                            file_path = os.path.join(search_dir, file)
-                            file_time = os.path.getmtime(file_path)
-                            all_images.append((file_path, file_time))
-            
-            if not all_images:
+            entry = None
+            if inspection_number:
+                entry = self.uploads_catalog.latest_for_inspection(inspection_number)
+                if entry and os.path.dirname(entry['folder']) != os.path.abspath(inspection_dir):
+                    entry = None
+            entry = entry or self.uploads_catalog.latest_image(transformer_id=os.path.basename(inspection_dir))
+            if not entry:
                 return None
             
-            # Sort by modification time (latest first) and return the most recent
-            all_images.sort(key=lambda x: x[1], reverse=True)
-            latest_image = all_images[0][0]
-            
-            self.logger.info(f"Found latest annotated image: {latest_image}")
-            return latest_image
+            self.logger.info(f"Found latest annotated image: {entry['path']}")
+            return entry['path']
             
         except Exception as e:
             self.logger.error(f"Error finding latest annotated image: {e}")
             return None
     
-    def _create_augmented_image(self, source_image: str, dest_path: str, augmentation_index: int):
-        """Create an augmented version of the source image"""
-        try:
-            import cv2
-            
-            # Read the source image
-            img = cv2.imread(source_image)
-            if img is None:
-                raise Exception(f"Could not read image: {source_image}")
-            
-            # Apply different augmentations based on index
-            augmented_img = self._apply_augmentation(img, augmentation_index)
+    def _build_augmented_set(self, source_image: str, images_dir: str, labels_dir: str,
+                             stems: List[str], make_annotations, blob_owner: str = None) -> Tuple[int, int]:
+        """
+        Render all augmented variants of source_image in parallel, then write their labels in bulk
+        
+        Labels are given in source image coordinates and follow each variant's geometric
+        augmentation (rotation, flip, scale) through its affine matrix.
+        
+        Args:
+            stems: File stems of the variants; position i is augmentation index i
+            make_annotations: Callable(index) -> YOLO label lines for that variant (source coordinates)
+            blob_owner: Store the variants in the blob store under this owner and link them
             
-            # Save the augmented image
-            success = cv2.imwrite(dest_path, augmented_img)
-            if not success:
-                raise Exception(f"Failed to save augmented image: {dest_path}")
-                
-        except Exception as e:
-            self.logger.error(f"Error creating augmented image: {e}")
-            # Fallback: just copy the original image
-            shutil.copy2(source_image, dest_path)
-    
-    def _apply_augmentation(self, img, augmentation_index: int):
-        """Apply different augmentations based on index"""
-        import cv2
-        import numpy as np
+        Returns:
+            Tuple of (images written, annotations written)
+        """
+        image_paths = [os.path.join(images_dir, f"{stem}.jpg") for stem in stems]
+        rendered = self.augmentation_engine.render(
+            source_image, image_paths, self._apply_augmentation,
+            blob_store=self.training_corpus.blob_store if blob_owner else None, owner=blob_owner
+        )
         
-        # Different augmentation types
-        augmentations = [
-            self._rotate_image,
-            self._flip_image,
-            self._brightness_adjustment,
-            self._contrast_adjustment,
-            self._noise_addition,
-            self._blur_image,
-            self._gamma_correction,
-            self._saturation_adjustment,
-            self._hue_shift,
-            self._scale_image
-        ]
+        labels = {}
+        for i, (stem, variant) in enumerate(zip(stems, rendered)):
+            if not variant.written:
+                self.logger.warning(f"Failed to create augmentation {i}")
+                continue
+            try:
+                labels[os.path.join(labels_dir, f"{stem}.txt")] = transform_yolo_lines(
+                    make_annotations(i), variant.matrix, variant.width, variant.height
+                )
+            except Exception as e:
+                self.logger.warning(f"Failed to create labels for augmentation {i}: {e}")
+                os.remove(image_paths[i])
         
-        # Apply augmentation based on index (cycle through available augmentations)
-        augmentation_func = augmentations[augmentation_index % len(augmentations)]
-        return augmentation_func(img.copy())
-    
-    def _rotate_image(self, img):
-        """Rotate image by small angle"""
-        import cv2
-        angle = random.uniform(-15, 15)  # Random rotation between -15 to 15 degrees
-        h, w = img.shape[:2]
-        center = (w // 2, h // 2)
-        matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-        return cv2.warpAffine(img, matrix, (w, h))
-    
-    def _flip_image(self, img):
-        """Flip image horizontally"""
-        import cv2
-        return cv2.flip(img, 1)
-    
-    def _brightness_adjustment(self, img):
-        """Adjust brightness"""
-        import cv2
-        import numpy as np
-        beta = random.uniform(-30, 30)  # Brightness adjustment
-        return cv2.convertScaleAbs(img, alpha=1.0, beta=beta)
-    
-    def _contrast_adjustment(self, img):
-        """Adjust contrast"""
-        import cv2
-        alpha = random.uniform(0.8, 1.2)  # Contrast adjustment
-        return cv2.convertScaleAbs(img, alpha=alpha, beta=0)
-    
-    def _noise_addition(self, img):
-        """Add random noise"""
-        import cv2
-        import numpy as np
-        noise = np.random.randint(0, 25, img.shape, dtype=np.uint8)
-        return cv2.add(img, noise)
-    
-    def _blur_image(self, img):
-        """Apply slight blur"""
-        import cv2
-        kernel_size = random.choice([3, 5])
-        return cv2.GaussianBlur(img, (kernel_size, kernel_size), 0)
-    
-    def _gamma_correction(self, img):
-        """Apply gamma correction"""
-        import cv2
-        import numpy as np
-        gamma = random.uniform(0.8, 1.2)
-        inv_gamma = 1.0 / gamma
-        table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in np.arange(0, 256)]).astype("uint8")
-        return cv2.LUT(img, table)
+        total_annotations = write_label_files(labels)
+        self.logger.info(f"Created {len(labels)} augmented images with {total_annotations} annotations "
+                         f"({self.augmentation_engine.max_workers} workers)")
+        return len(labels), total_annotations
     
-    def _saturation_adjustment(self, img):
-        """Adjust saturation"""
-        import cv2
-        import numpy as np
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        saturation_scale = random.uniform(0.8, 1.2)
-        hsv[:, :, 1] = np.clip(hsv[:, :, 1] * saturation_scale, 0, 255)
-        return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
-    
-    def _hue_shift(self, img):
-        """Shift hue slightly"""
-        import cv2
-        import numpy as np
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        hue_shift = random.uniform(-10, 10)
-        hsv[:, :, 0] = (hsv[:, :, 0] + hue_shift) % 180
-        return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
-    
-    def _scale_image(self, img):
-        """Scale image slightly"""
-        import cv2
-        scale = random.uniform(0.9, 1.1)
-        h, w = img.shape[:2]
-        new_h, new_w = int(h * scale), int(w * scale)
-        scaled = cv2.resize(img, (new_w, new_h))
+    def _apply_augmentation(self, img, augmentation_index: int, rng=random):
+        """
+        Apply different augmentations based on index (rng supplies the random parameters)
         
-        # If scaled up, crop to original size
-        if scale > 1.0:
-            start_y = (new_h - h) // 2
-            start_x = (new_w - w) // 2
-            return scaled[start_y:start_y+h, start_x:start_x+w]
-        else:
-            # If scaled down, pad to original size
-            pad_y = (h - new_h) // 2
-            pad_x = (w - new_w) // 2
-            return cv2.copyMakeBorder(scaled, pad_y, h-new_h-pad_y, pad_x, w-new_w-pad_x, cv2.BORDER_CONSTANT, value=[0,0,0])
+        The image is the calling thread's scratch buffer, reused by its next variant;
+        the render engine encodes it before asking for another one.
+        
+        Returns:
+            tuple: (augmented image, 2x3 affine matrix of its geometric op or None)
+        """
+        out = kernels().buffer('render', img.shape)
+        return apply_augmentation(img, augmentation_index, rng, out=out)
 
     def create_dataset(self, inspection_number: str, dataset_name: str = None, enhance_existing: bool = True) -> str:
         """
@@ -679,12 +527,12 @@ Total Images: {total_images}
             self.logger.info(f"Creating dataset from feedback and latest image: {dataset_name}")
             
             # Find latest inspection directory
-            latest_inspection_dir = self.find_latest_inspection_directory()
+            latest_inspection_dir = self.find_latest_inspection_directory(inspection_number)
             if not latest_inspection_dir:
                 raise Exception("No inspection directory found")
             
             # Get the latest annotated image
-            latest_image = self._get_latest_annotated_image(latest_inspection_dir)
+            latest_image = self._get_latest_annotated_image(latest_inspection_dir, inspection_number)
             if not latest_image:
                 raise Exception("No latest annotated image found")
             
@@ -716,38 +564,14 @@ Total Images: {total_images}
             
             # Create augmented dataset from the single latest image
             num_augmentations = max(20, feedback_annotation_count * 2)  # At least 20 images or 2x feedback count
-            successful_images = 0
-            total_annotations_written = 0
-            
-            for i in range(num_augmentations):
-                try:
-                    # Create augmented image filename
-                    image_filename = f"{inspection_number}_latest_{i:03d}.jpg"
-                    dest_image_path = os.path.join(images_dir, image_filename)
-                    
-                    # Apply augmentation and save
-                    self._create_augmented_image(latest_image, dest_image_path, i)
-                    
-                    # Create realistic fault annotations based on feedback patterns
-                    annotations = self._generate_feedback_based_annotations(
-                        img_width, img_height, human_annotations, ai_detections
-                    )
-                    
-                    # Write YOLO label file
-                    label_filename = f"{inspection_number}_latest_{i:03d}.txt"
-                    label_path = os.path.join(labels_dir, label_filename)
-                    
-                    with open(label_path, 'w') as f:
-                        for annotation in annotations:
-                            f.write(annotation + '\n')
-                            total_annotations_written += 1
-                    
-                    successful_images += 1
-                    self.logger.info(f"Created augmented image {successful_images}: {image_filename} with {len(annotations)} annotations")
-                    
-                except Exception as e:
-                    self.logger.warning(f"Failed to create augmentation {i}: {e}")
-                    continue
+            stems = [f"{inspection_number}_latest_{i:03d}" for i in range(num_augmentations)]
+            successful_images, total_annotations_written = self._build_augmented_set(
+                latest_image, images_dir, labels_dir, stems,
+                # Create realistic fault annotations based on feedback patterns
+                lambda i: self._generate_feedback_based_annotations(
+                    img_width, img_height, human_annotations, ai_detections
+                )
+            )
             
             # Create dataset.yaml
             dataset_yaml = {
@@ -943,12 +767,12 @@ Total Annotations: {total_annotations_written}
             self.logger.info(f"Creating dataset from current feedback: {dataset_name}")
             
             # Find latest inspection directory
-            latest_inspection_dir = self.find_latest_inspection_directory()
+            latest_inspection_dir = self.find_latest_inspection_directory(inspection_number)
             if not latest_inspection_dir:
                 raise Exception("No inspection directory found")
             
             # Get the latest annotated image
-            latest_image = self._get_latest_annotated_image(latest_inspection_dir)
+            latest_image = self._get_latest_annotated_image(latest_inspection_dir, inspection_number)
             if not latest_image:
                 raise Exception("No latest annotated image found")
             
@@ -979,44 +803,23 @@ Total Annotations: {total_annotations_written}
             
             # Create augmented dataset from the single latest image using real annotations
             num_augmentations = max(20, len(real_annotations) * 3)  # At least 20 images or 3x annotation count
-            successful_images = 0
-            total_annotations_written = 0
-            
-            for i in range(num_augmentations):
-                try:
-                    # Create augmented image filename
-                    image_filename = f"{inspection_number}_real_{i:03d}.jpg"
-                    dest_image_path = os.path.join(images_dir, image_filename)
-                    
-                    # Apply augmentation and save
-                    self._create_augmented_image(latest_image, dest_image_path, i)
-                    
-                    # Use real annotations from feedback (with slight variations for augmentation)
-                    annotations = self._apply_real_annotations_with_variation(
-                        img_width, img_height, real_annotations, i
-                    )
-                    
-                    # Write YOLO label file
-                    label_filename = f"{inspection_number}_real_{i:03d}.txt"
-                    label_path = os.path.join(labels_dir, label_filename)
-                    
-                    with open(label_path, 'w') as f:
-                        for annotation in annotations:
-                            f.write(annotation + '\n')
-                            total_annotations_written += 1
-                    
-                    successful_images += 1
-                    self.logger.info(f"Created image {successful_images}: {image_filename} with {len(annotations)} real annotations")
-                    
-                except Exception as e:
-                    self.logger.warning(f"Failed to create augmentation {i}: {e}")
-                    continue
+            stems = [f"{inspection_number}_real_{i:03d}" for i in range(num_augmentations)]
+            # Real annotations from feedback; each variant's labels follow its augmentation
+            source_labels = self._real_annotation_labels(img_width, img_height, real_annotations)
+            successful_images, total_annotations_written = self._build_augmented_set(
+                latest_image, images_dir, labels_dir, stems, lambda i: source_labels
+            )
+            
+            # Validate on the corpus's held-out historical samples instead of the training images
+            val_images = self.training_corpus.link_split(
+                self.training_corpus.validation(), dataset_dir, 'val', owner=f"dataset:{dataset_name}"
+            )
             
             # Create dataset.yaml
             dataset_yaml = {
                 'path': dataset_dir,
                 'train': 'images/train',
-                'val': 'images/train',
+                'val': 'images/val' if val_images else 'images/train',
                 'nc': 1,
                 'names': ['Faulty']
             }
@@ -1052,6 +855,7 @@ Total Annotations: {total_annotations_written}
                 'total_images': successful_images,
                 'total_annotations': total_annotations_written,
                 'real_annotations_count': len(real_annotations),
+                'validation_images': val_images,
                 'source_inspection_dir': latest_inspection_dir,
                 'feedback_source': 'current_upload'
             }
@@ -1077,6 +881,121 @@ Total Annotations: {total_annotations_written}
             self.logger.error(f"Error creating dataset from current feedback: {e}")
             raise
     
+    def create_dataset_from_corpus(self, inspection_number: str, dataset_name: str, feedback_data: Dict) -> Optional[str]:
+        """
+        Add the current feedback to the training corpus and build the next incremental run
+        
+        The dataset holds every corpus sample not trained on yet (with augmented
+        variants) plus a class-stratified replay of earlier samples, and validates on
+        the corpus's held-out split. By default only a
+        manifest is written and the variants are rendered in the dataloader
+        (ML_INMEMORY_AUGMENT=0 links them into images/ from the blob store instead).
+        The training run commits it back with TrainingCorpus.commit_run.
+        
+        Args:
+            inspection_number: The inspection number
+            dataset_name: Name for the dataset
+            feedback_data: The actual feedback data from the upload
+            
+        Returns:
+            Path to created dataset directory, or None when no corpus sample is pending
+        """
+        dataset_dir = None
+        try:
+            self.logger.info(f"Creating incremental corpus dataset: {dataset_name}")
+            
+            latest_inspection_dir = self.find_latest_inspection_directory(inspection_number)
+            if not latest_inspection_dir:
+                raise Exception("No inspection directory found")
+            
+            latest_image = self._get_latest_annotated_image(latest_inspection_dir, inspection_number)
+            if not latest_image:
+                raise Exception("No latest annotated image found")
+            
+            real_annotations = self._extract_real_annotations_from_feedback(feedback_data)
+            if not real_annotations:
+                raise Exception("Feedback contains no usable annotations")
+            
+            img_width, img_height = 640, 640
+            try:
+                from PIL import Image
+                with Image.open(latest_image) as img:
+                    img_width, img_height = img.size
+            except Exception as e:
+                self.logger.warning(f"Could not read image dimensions, using default: {e}")
+            
+            sample = self.training_corpus.add_sample(
+                latest_image,
+                self._real_annotations_to_yolo(img_width, img_height, real_annotations),
+                width=img_width, height=img_height,
+                inspection_number=inspection_number,
+                source=feedback_data.get('inspectionId')
+            )
+            self.logger.info(f"{'Added' if sample['is_new'] else 'Updated'} corpus sample {sample['sample_id'][:12]} "
+                             f"from {latest_image}")
+            
+            plan = self.training_corpus.plan_run(seed=self.augmentation_engine.seed)
+            if not plan['new']:
+                self.logger.info("Feedback adds nothing new to the training corpus, no dataset needed")
+                return None
+            
+            dataset_dir = os.path.join(self.base_dir, dataset_name)
+            if IN_MEMORY_AUGMENT:
+                # Variants are rendered by FeedbackAugmentDataset in the dataloader
+                manifest = self.training_corpus.write_in_memory_manifest(
+                    plan, dataset_dir, NEW_SAMPLE_AUGMENTS, seed=self.augmentation_engine.seed
+                )
+                train_source = RUN_MANIFEST
+            else:
+                manifest = self._materialize_corpus_run(plan, dataset_dir)
+                train_source = 'images/train'
+            if manifest['val_images']:
+                val_source = 'images/val'
+            else:
+                val_source = train_source
+                self.logger.warning("Corpus has no held-out validation samples yet, validating on the training set")
+            
+            class_names = [self.class_mapping.get(i, f'class_{i}') for i in range(4)]
+            yaml_path = os.path.join(dataset_dir, 'dataset.yaml')
+            with open(yaml_path, 'w') as f:
+                f.write(f"# Incremental corpus dataset for {inspection_number}\n")
+                f.write(f"# Created: {datetime.now().isoformat()}\n")
+                f.write(f"# Corpus run: {plan['run_id']}\n")
+                f.write(f"# New samples: {len(plan['new'])}, replayed samples: {len(plan['replay'])}, "
+                        f"validation samples: {manifest['val_images']}\n")
+                f.write(f"# Total images: {manifest['images']}{' (augmented in memory)' if IN_MEMORY_AUGMENT else ''}\n\n")
+                f.write(f"path: '{dataset_dir}'\n")
+                f.write(f"train: '{train_source}'\n")
+                f.write(f"val: '{val_source}'\n")
+                f.write(f"nc: {len(class_names)}\n")
+                f.write(f"names: {class_names}\n")
+            
+            self.logger.info(f"Corpus dataset {dataset_name}: {len(plan['new'])} new + {len(plan['replay'])} replayed "
+                             f"samples, {manifest['images']} images, {manifest['annotations']} annotations, "
+                             f"{manifest['val_images']} held-out validation images "
+                             f"(corpus: {self.training_corpus.stats()})")
+            return dataset_dir
+            
+        except Exception as e:
+            self.logger.error(f"Error creating corpus dataset: {e}")
+            if dataset_dir and os.path.exists(dataset_dir):
+                # Do not leave a half-written run (and its blob references) behind
+                self.training_corpus.discard_dataset(dataset_dir, gc=False)
+            raise
+    
+    def _materialize_corpus_run(self, plan: Dict, dataset_dir: str) -> Dict:
+        """Write the run to disk, augmented variants included (ML_INMEMORY_AUGMENT=0)"""
+        def render_new(new_sample, source_path, images_dir, labels_dir, owner):
+            # Variants start from the stored labels and follow their augmentation
+            stems = [f"{new_sample['sample_id'][:16]}_aug_{i:02d}" for i in range(NEW_SAMPLE_AUGMENTS)]
+            return self._build_augmented_set(
+                source_path, images_dir, labels_dir, stems,
+                lambda i: new_sample['labels'] or ["0 0.5 0.5 0.1 0.1"],
+                blob_owner=owner
+            )
+        
+        return self.training_corpus.materialize(plan, dataset_dir, render_new=render_new)
+    
     def _extract_real_annotations_from_feedback(self, feedback_data: Dict) -> List[Dict]:
         """Extract real annotations from the current feedback data"""
         annotations = []
@@ -1120,30 +1039,24 @@ Total Annotations: {total_annotations_written}
             self.logger.error(f"Error extracting annotations from feedback: {e}")
             return []
     
-    def _apply_real_annotations_with_variation(self, img_width: int, img_height: int, 
-                                             real_annotations: List[Dict], variation_index: int) -> List[str]:
-        """Apply real annotations with slight variations for augmentation, preserving correct class IDs for all anomaly types."""
-        annotations = []
-        
+    def _real_annotation_labels(self, img_width: int, img_height: int, 
+                                real_annotations: List[Dict]) -> List[str]:
+        """Real annotations as YOLO label lines, preserving correct class IDs for all anomaly types."""
         if not real_annotations:
             # Fallback to single default annotation
-            annotation = f"0 0.5 0.5 0.1 0.1"
-            annotations.append(annotation)
-            return annotations
+            return ["0 0.5 0.5 0.1 0.1"]
+        return self._real_annotations_to_yolo(img_width, img_height, real_annotations)
+    
+    def _real_annotations_to_yolo(self, img_width: int, img_height: int,
+                                  real_annotations: List[Dict]) -> List[str]:
+        """Convert real annotations (pixel bboxes) to YOLO label lines"""
+        annotations = []
         
-        # Apply real bounding boxes with slight variations
         for annotation in real_annotations:
             try:
                 bbox = annotation['bbox']
                 x1, y1, x2, y2 = bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2']
                 
-                # Add slight variation based on augmentation index
-                variation = (variation_index % 10) - 5  # -5 to +5 pixel variation
-                x1 += variation
-                y1 += variation
-                x2 += variation
-                y2 += variation
-                
                 # Ensure bounds are valid
                 x1 = max(0, min(x1, img_width - 10))
                 y1 = max(0, min(y1, img_height - 10))
@@ -0,0 +1,47 @@
+"""
+Service tests run app.py in stub model mode (stub_model.StubYOLO, no weights or torch)
+with its feedback store and uploads catalog in scratch directories.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+pytest.importorskip('flask_cors')
+pytest.importorskip('cv2')
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH_DIR = tempfile.mkdtemp(prefix='ml_service_tests_')
+
+# Read at import of app.py, so set before the first test imports it
+os.environ.update({
+    'ML_STUB_MODEL': '1',
+    'ML_STARTUP_MODE': 'lazy',
+    'ML_FEEDBACK_DIR': os.path.join(SCRATCH_DIR, 'feedback'),
+    'ML_UPLOADS_DIR': os.path.join(SCRATCH_DIR, 'uploads'),
+    'ML_UPLOADS_CATALOG': os.path.join(SCRATCH_DIR, 'uploads_catalog.sqlite3')
+})
+os.makedirs(os.environ['ML_UPLOADS_DIR'], exist_ok=True)
+sys.path.insert(0, SERVICE_DIR)
+sys.path.insert(0, os.path.join(SERVICE_DIR, '..', 'Faulty_Detection'))
+
+
+@pytest.fixture(scope='session')
+def service():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(service):
+    return service.app.test_client()
+
+
+@pytest.fixture
+def image_pair(tmp_path):
+    """(baseline path, inspection path): a synthetic thermal scene and the same scene with new hotspots"""
+    from synthetic_thermal import make_variant_pairs, write_pair
+    pair = make_variant_pairs((320, 240), variants=['hotspots'])['hotspots']
+    return write_pair(pair, str(tmp_path), 'pair')
@@ -0,0 +1,27 @@
+"""/api/admin/profile parameter validation"""
+
+import pytest
+
+
+@pytest.fixture
+def admin(client, service, monkeypatch):
+    monkeypatch.setattr(service, 'ADMIN_TOKEN', 'secret')
+
+    def get(query):
+        return client.get(f"/api/admin/profile{query}", headers={'X-Admin-Token': 'secret'})
+    return get
+
+
+@pytest.mark.parametrize('query', ['?seconds=abc', '?interval_ms=5ms', '?seconds=', '?seconds=0', '?interval_ms=0.1'])
+def test_invalid_parameters_are_rejected(admin, query):
+    response = admin(query)
+
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
+
+
+def test_profile_returns_collapsed_stacks(admin):
+    response = admin('?seconds=0.2&interval_ms=10')
+
+    assert response.status_code == 200
+    assert int(response.headers['X-Profile-Samples']) > 0
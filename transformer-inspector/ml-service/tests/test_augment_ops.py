@@ -0,0 +1,79 @@
+"""Geometric augmentations: boxes follow the pixels they label, clipped or dropped at the image edge"""
+
+import random
+
+import cv2
+import numpy as np
+import pytest
+
+from augment_kernels import AFFINE, kernels
+from augment_ops import (AUGMENTATIONS, MIN_VISIBLE_FRACTION, apply_augmentation, flip_image,
+                         transform_boxes, transform_yolo)
+
+WIDTH, HEIGHT = 160, 120
+
+
+def render(boxes):
+    """Filled white rectangles; box x1, y1, x2, y2 covers pixels x1..x2-1, y1..y2-1"""
+    img = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    for x1, y1, x2, y2 in boxes:
+        img[y1:y2, x1:x2] = 255
+    return img
+
+
+def mask_box(img):
+    x, y, w, h = cv2.boundingRect((img[:, :, 0] > 127).astype(np.uint8))
+    return np.array([x, y, x + w, y + h], dtype=np.float64)
+
+
+def to_yolo(box):
+    x1, y1, x2, y2 = box
+    return [(x1 + x2) / 2 / WIDTH, (y1 + y2) / 2 / HEIGHT, (x2 - x1) / WIDTH, (y2 - y1) / HEIGHT]
+
+
+def to_xyxy(xywhn):
+    cx, cy, w, h = np.asarray(xywhn) * [WIDTH, HEIGHT, WIDTH, HEIGHT]
+    return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+
+@pytest.mark.parametrize('op', ['rotate_image', 'flip_image', 'scale_image'])
+@pytest.mark.parametrize('seed', range(5))
+def test_yolo_box_matches_the_warped_rectangle(op, seed):
+    box = (30, 25, 75, 60)
+    index = [a.__name__ for a in AUGMENTATIONS].index(op)
+
+    img, matrix = apply_augmentation(render([box]), index, rng=random.Random(seed))
+
+    boxes, keep = transform_yolo([to_yolo(box)], matrix, WIDTH, HEIGHT)
+    assert keep.tolist() == [True]
+    np.testing.assert_allclose(to_xyxy(boxes[0]), mask_box(img), atol=1.0)
+
+
+def test_boxes_are_clipped_at_the_edge_and_dropped_when_mostly_outside():
+    shift = np.array([[1.0, 0.0, 30.0], [0.0, 1.0, 0.0]])
+    kept_box = (100, 40, 150, 80)  # 30 of 50 columns stay inside
+    mostly_out = (128, 90, 148, 110)  # 2 of 20 columns stay inside
+
+    img, matrix = kernels().run(render([kept_box]), [(AFFINE, shift)])
+
+    boxes, keep = transform_boxes([kept_box, mostly_out], matrix, WIDTH, HEIGHT)
+    assert keep.tolist() == [True, False]
+    np.testing.assert_allclose(boxes[0], [130, 40, WIDTH, 80])
+    np.testing.assert_allclose(boxes[0], mask_box(img), atol=1.0)
+    assert (2 / 20) < MIN_VISIBLE_FRACTION < (30 / 50)
+
+
+def test_flip_matrix_uses_the_same_half_pixel_convention_as_cv2_flip():
+    img = np.random.default_rng(0).integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    (kind, matrix), = flip_image(HEIGHT, WIDTH)
+
+    flipped, _ = kernels().run(img.copy(), [(kind, matrix)])
+    # A matrix that is not exactly the flip takes the warpAffine path instead of cv2.flip
+    nudged = matrix + [[0.0, 0.0, 1e-9], [0.0, 0.0, 0.0]]
+    warped, _ = kernels().run(img.copy(), [(AFFINE, nudged)])
+
+    np.testing.assert_array_equal(flipped, cv2.flip(img, 1))
+    np.testing.assert_array_equal(warped, cv2.flip(img, 1))
+    # x -> w - x: the box over columns 0..9 lands on columns w-10..w-1
+    boxes, _ = transform_boxes([(0, 0, 10, 10)], matrix, WIDTH, HEIGHT)
+    np.testing.assert_allclose(boxes[0], [WIDTH - 10, 0, WIDTH, 10])
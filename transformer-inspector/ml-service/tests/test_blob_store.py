@@ -0,0 +1,54 @@
+"""BlobStore: gc running concurrently with put + link never leaves a dangling materialization"""
+
+import os
+import threading
+
+import pytest
+
+from blob_store import BlobStore
+
+
+def test_gc_does_not_collect_between_put_and_link(tmp_path):
+    store = BlobStore(str(tmp_path / 'blobs'))
+    dest_dir = tmp_path / 'dataset'
+    dest_dir.mkdir()
+    stop = threading.Event()
+
+    def collect():
+        while not stop.is_set():
+            store.gc(grace_seconds=0)
+
+    collector = threading.Thread(target=collect)
+    collector.start()
+    try:
+        for n in range(200):
+            dest = str(dest_dir / f"{n}.jpg")
+            store.link_bytes(b'variant %d' % n, dest, owner='dataset:run')
+            with open(dest, 'rb') as f:
+                assert f.read() == b'variant %d' % n
+            # Drop the reference straight away, so the next gc pass may collect the blob
+            store.release('dataset:run', dest)
+            os.remove(dest)
+        sha256, mode = store.link_bytes(b'kept', str(dest_dir / 'kept.jpg'), owner='dataset:run')
+    finally:
+        stop.set()
+        collector.join()
+
+    assert mode == 'hardlink' and (dest_dir / 'kept.jpg').read_bytes() == b'kept'
+    assert store.refcount(sha256) == 1
+
+
+def test_link_to_a_missing_blob_raises_instead_of_dangling(tmp_path):
+    store = BlobStore(str(tmp_path / 'blobs'))
+    sha256 = store.put_bytes(b'image')
+    os.chmod(store.path(sha256), 0o644)
+    os.remove(store.path(sha256))
+    dest = str(tmp_path / 'image.jpg')
+
+    with pytest.raises(FileNotFoundError):
+        store.link(sha256, dest, owner='dataset:run')
+    assert not os.path.lexists(dest)
+    # link_bytes has the content, so it stores the blob again
+    assert store.link_bytes(b'image', dest, owner='dataset:run') == (sha256, 'hardlink')
+    with open(dest, 'rb') as f:
+        assert f.read() == b'image'
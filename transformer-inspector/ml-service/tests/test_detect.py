@@ -0,0 +1,44 @@
+"""/api/detect through the similarity pipeline and its input modes"""
+
+import pytest
+
+
+def detections_without_ids(response):
+    """Detections minus their ids, which are random per response"""
+    return [dict(d, id=None) for d in response.get_json()['detections']]
+
+
+@pytest.mark.parametrize('change_guided', [False, True])
+def test_similarity_result_is_served(client, image_pair, change_guided):
+    baseline, inspection = image_pair
+    response = client.post('/api/detect', json={
+        'inspection_image_path': inspection,
+        'baseline_image_path': baseline,
+        'change_guided': change_guided
+    })
+
+    assert response.status_code == 200
+    body = response.get_json()
+    # The standard-YOLO fallback answers with type YOLOv8 and no similarity_analysis
+    assert body['model_info']['type'] == 'SimilarityBasedYOLO'
+    assert isinstance(body['similarity_analysis']['is_similar'], bool)
+    assert all(d['source'] == 'similarity_ai' for d in body['detections'])
+    for detection in body['detections']:
+        box = detection['bbox']
+        assert 0 <= box['x1'] < box['x2'] and 0 <= box['y1'] < box['y2']
+
+
+def test_path_and_hash_mix(client, image_pair):
+    baseline, inspection = image_pair
+    with open(baseline, 'rb') as f:
+        sent = client.post('/api/detect', data=f.read(), content_type='image/png')
+    assert sent.status_code == 200
+    baseline_sha256 = sent.get_json()['image_sha256']['inspection']
+
+    by_path = client.post('/api/detect', json={'inspection_image_path': inspection, 'baseline_image_path': baseline})
+    mixed = client.post('/api/detect', json={'inspection_image_path': inspection,
+                                             'baseline_image_sha256': baseline_sha256})
+
+    assert mixed.status_code == 200
+    assert mixed.get_json()['model_info']['type'] == 'SimilarityBasedYOLO'
+    assert detections_without_ids(mixed) == detections_without_ids(by_path)
@@ -0,0 +1,42 @@
+"""FeedbackJobQueue journal: concurrent appends against compaction, jobs from other processes"""
+
+import threading
+import time
+
+import feedback_jobs
+from feedback_jobs import FeedbackJobQueue
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_submits_race_compaction_and_reach_the_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(feedback_jobs, 'COMPACT_SLACK', 20)
+    monkeypatch.setattr(feedback_jobs, 'POLL_INTERVAL', 0.05)
+    jobs_dir = str(tmp_path / 'jobs')
+    worker = FeedbackJobQueue(jobs_dir, lambda job, payload, update: {'n': payload['n']})
+    # A second service process: accepts jobs, never runs them (the worker picks them up)
+    other = FeedbackJobQueue(jobs_dir, None, autostart=False)
+
+    def submit_many(queue, offset):
+        for n in range(offset, offset + 30):
+            queue.submit({'n': n})
+
+    threads = [threading.Thread(target=submit_many, args=(q, i * 30)) for i, q in enumerate([worker, other, worker])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+        assert not thread.is_alive(), 'submit deadlocked'
+
+    assert wait_for(lambda: worker.stats()['states'] == {'completed': 90})
+    assert sorted(job['result']['n'] for job in worker.recent(limit=None)) == list(range(90))
+    # Each job journals queued, running and completed; compaction keeps about one line per job
+    assert wait_for(lambda: sum(1 for _ in open(worker.journal_path)) < 90 + feedback_jobs.COMPACT_SLACK)
+    assert other.stats()['states'] == {'completed': 90}
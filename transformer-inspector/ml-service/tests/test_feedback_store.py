@@ -0,0 +1,87 @@
+"""FeedbackStore: superseding re-uploads, retried uploads, watermarks and recovery after a torn append"""
+
+import json
+import os
+
+from feedback_store import FeedbackStore, LatestFeedbackView
+
+
+def feedback(inspection_id, *actions):
+    return {
+        'inspectionId': inspection_id,
+        'transformerCode': 'T1',
+        'comparisons': [{'imageId': f"{inspection_id}-{n}", 'actionTaken': action,
+                         'aiPrediction': {'classId': 0, 'className': 'Faulty'}}
+                        for n, action in enumerate(actions)]
+    }
+
+
+def actions(records):
+    return [(r['inspection_id'], r['comparison']['actionTaken']) for r in records]
+
+
+def test_reupload_supersedes_the_older_upload(tmp_path):
+    store = FeedbackStore(str(tmp_path / 'store'))
+    view = LatestFeedbackView(store)
+    store.append_upload(feedback('INS-1', 'approved', 'rejected'), upload_id='a')
+    store.append_upload(feedback('INS-2', 'edited'), upload_id='b')
+    assert view.refresh() == 3
+
+    store.append_upload(feedback('INS-1', 'added'), upload_id='c')
+
+    assert actions(store.query()) == [('INS-2', 'edited'), ('INS-1', 'added')]
+    assert len(store.query(latest_only=False)) == 4
+    assert view.refresh() == 1
+    assert actions(view.records()) == [('INS-2', 'edited'), ('INS-1', 'added')]
+
+
+def test_retried_upload_id_is_a_no_op(tmp_path):
+    store = FeedbackStore(str(tmp_path / 'store'))
+    first = store.append_upload(feedback('INS-1', 'approved', 'rejected'), upload_id='job-1')
+
+    retry = store.append_upload(feedback('INS-1', 'approved', 'rejected'), upload_id='job-1')
+
+    assert retry['duplicate'] and retry['records'] == 0
+    assert (retry['first_seq'], retry['last_seq']) == (first['first_seq'], first['last_seq'])
+    assert store.stats()['uploads'] == 1 and store.stats()['records'] == 2
+
+
+def test_read_since_returns_only_records_after_the_watermark(tmp_path):
+    store = FeedbackStore(str(tmp_path / 'store'))
+    store.append_upload(feedback('INS-1', 'approved', 'rejected'), upload_id='a')
+    records, watermark = store.read_since('dataset_creator')
+    assert len(records) == 2 and watermark == 2
+
+    store.append_upload(feedback('INS-1', 'edited'), upload_id='b')
+
+    # Without commit the watermark stays, so the same records come back
+    assert actions(store.read_since('dataset_creator', commit=False)[0]) == [('INS-1', 'edited')]
+    records, watermark = store.read_since('dataset_creator')
+    assert actions(records) == [('INS-1', 'edited')] and watermark == 3
+    assert store.read_since('dataset_creator') == ([], 3)
+
+
+def test_reopen_after_a_torn_final_line(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    store = FeedbackStore(store_dir)
+    store.append_upload(feedback('INS-1', 'approved'), upload_id='a')
+    segment = os.path.join(store.segment_dir, 'seg-000001.jsonl')
+    # A crash after one record reached the segment but not the index, then one mid-write
+    unindexed = {'upload_id': 'b', 'received_at': '2024-01-01T00:00:00', 'inspection_id': 'INS-2',
+                 'seq': 2, 'comparison': feedback('INS-2', 'rejected')['comparisons'][0]}
+    with open(segment, 'ab') as f:
+        f.write(json.dumps(unindexed).encode() + b'\n')
+        f.write(b'{"upload_id":"c","seq":3,"comparison":{"actio')
+
+    reopened = FeedbackStore(store_dir)
+    assert actions(reopened.query()) == [('INS-1', 'approved'), ('INS-2', 'rejected')]
+
+    appended = reopened.append_upload(feedback('INS-3', 'edited'), upload_id='d')
+    assert (appended['first_seq'], appended['last_seq']) == (3, 3)
+    view = LatestFeedbackView(FeedbackStore(store_dir))
+    assert view.refresh() == 3
+    assert actions(view.records()) == [('INS-1', 'approved'), ('INS-2', 'rejected'), ('INS-3', 'edited')]
+    # The torn fragment stays on its own line, between the recovered and the new records
+    with open(segment, 'rb') as f:
+        lines = f.read().split(b'\n')
+    assert lines[2].startswith(b'{"upload_id":"c"') and json.loads(lines[3])['upload_id'] == 'd'
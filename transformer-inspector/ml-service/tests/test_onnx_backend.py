@@ -0,0 +1,84 @@
+"""OnnxYOLO decoding against a fake ONNX Runtime session: letterbox undo and class-aware NMS"""
+
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from onnx_backend import OnnxYOLO
+
+# 200x90 image at imgsz 320: ratio 1.6, resized to 320x144, rect padding 8px top and bottom
+WIDTH, HEIGHT = 200, 90
+RATIO, PAD_TOP = 1.6, 8
+
+
+class FakeSession:
+    """Returns a fixed (1, 4 + nc, anchors) prediction for whatever batch it is given"""
+
+    def __init__(self, prediction):
+        self.prediction = prediction
+        self.batches = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name='images', shape=['batch', 3, 'height', 'width'])]
+
+    def get_outputs(self):
+        return [SimpleNamespace(name='output0')]
+
+    def get_modelmeta(self):
+        return SimpleNamespace(custom_metadata_map={
+            'names': "{0: 'Faulty', 1: 'faulty_loose_joint'}", 'stride': '32', 'imgsz': '[320, 320]'})
+
+    def run(self, output_names, feeds):
+        self.batches.append(feeds['images'])
+        return [self.prediction]
+
+
+def anchor(box, class_id, score, num_classes=2):
+    """Prediction column for an xyxy box in original image pixels"""
+    x1, y1, x2, y2 = box
+    scores = [0.0] * num_classes
+    scores[class_id] = score
+    return [(x1 + x2) / 2 * RATIO, (y1 + y2) / 2 * RATIO + PAD_TOP, (x2 - x1) * RATIO, (y2 - y1) * RATIO] + scores
+
+
+@pytest.fixture
+def onnx_model(monkeypatch):
+    prediction = np.array([[
+        anchor((20, 10, 60, 50), 0, 0.9),
+        anchor((22, 11, 61, 52), 0, 0.8),     # Overlaps the first box of its class: suppressed
+        anchor((20, 10, 60, 50), 1, 0.7),     # Same place, other class: kept
+        anchor((100, 20, 140, 60), 1, 0.1),   # Below the confidence threshold
+        anchor((180, 40, 230, 80), 0, 0.6),   # Past the right edge: clipped
+    ]], dtype=np.float32).transpose(0, 2, 1)
+    session = FakeSession(prediction)
+    fake_ort = SimpleNamespace(
+        SessionOptions=SimpleNamespace,
+        ExecutionMode=SimpleNamespace(ORT_SEQUENTIAL=0),
+        GraphOptimizationLevel=SimpleNamespace(ORT_ENABLE_ALL=99),
+        InferenceSession=lambda path, options, providers: session)
+    monkeypatch.setitem(sys.modules, 'onnxruntime', fake_ort)
+    return OnnxYOLO('model.onnx', intra_op_threads=1), session
+
+
+def test_boxes_are_mapped_back_and_suppressed_per_class(onnx_model):
+    model, session = onnx_model
+    image = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+    result, = model(image, conf=0.25, iou=0.5)
+
+    assert session.batches[0].shape == (1, 3, 144 + 2 * PAD_TOP, 320)
+    assert result.orig_shape == (HEIGHT, WIDTH) and result.names[1] == 'faulty_loose_joint'
+    np.testing.assert_allclose(result.boxes.xyxy.numpy(),
+                               [[20, 10, 60, 50], [20, 10, 60, 50], [180, 40, WIDTH, 80]], atol=1e-3)
+    np.testing.assert_allclose(result.boxes.conf.numpy(), [0.9, 0.7, 0.6], atol=1e-6)
+    assert result.boxes.cls.numpy().tolist() == [0, 1, 0]
+
+
+def test_nothing_above_the_threshold_gives_empty_boxes(onnx_model):
+    model, _ = onnx_model
+
+    result, = model(np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8), conf=0.95)
+
+    assert len(result.boxes) == 0 and result.boxes.xyxy.numpy().shape == (0, 4)
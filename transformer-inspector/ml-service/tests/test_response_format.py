@@ -0,0 +1,62 @@
+"""/api/detect response format negotiation: ?format=, the Accept header and the columnar payload"""
+
+import pytest
+
+import response_format
+
+COLUMNAR_MIMETYPE = 'application/vnd.transx.columnar+json'
+
+
+@pytest.fixture
+def detect(client, image_pair):
+    baseline, inspection = image_pair
+
+    def post(query='', **headers):
+        return client.post(f"/api/detect{query}", headers=headers, json={
+            'inspection_image_path': inspection,
+            'baseline_image_path': baseline
+        })
+    return post
+
+
+def test_format_parameter_wins_over_accept(detect):
+    verbose = detect('?format=json', Accept=COLUMNAR_MIMETYPE)
+    compact = detect('?format=columnar', Accept='application/json')
+
+    assert verbose.status_code == 200 and verbose.mimetype == 'application/json'
+    assert isinstance(verbose.get_json()['detections'], list)
+    assert compact.status_code == 200 and compact.mimetype == COLUMNAR_MIMETYPE
+    assert compact.get_json()['format'] == 'columnar'
+
+
+def test_accept_header_picks_the_format_without_a_parameter(detect):
+    assert detect(Accept=COLUMNAR_MIMETYPE).mimetype == COLUMNAR_MIMETYPE
+    # A wildcard, or no header at all, keeps the verbose default
+    assert detect(Accept='*/*').mimetype == 'application/json'
+    assert detect().mimetype == 'application/json'
+
+
+def test_unavailable_formats_are_rejected(detect, monkeypatch):
+    unknown = detect('?format=protobuf')
+    assert unknown.status_code == 400 and 'protobuf' in unknown.get_json()['error']
+
+    monkeypatch.setattr(response_format, 'MSGPACK_AVAILABLE', False)
+    without_msgpack = detect('?format=msgpack')
+    assert without_msgpack.status_code == 400 and 'msgpack' in without_msgpack.get_json()['error']
+
+
+def test_columnar_arrays_match_the_verbose_detections(detect):
+    verbose = detect().get_json()
+    compact = detect('?format=columnar').get_json()
+
+    detections = compact['detections']
+    assert compact['count'] == len(verbose['detections']) > 0
+    assert set(detections) == set(response_format.COLUMNS)
+    for n, detection in enumerate(verbose['detections']):
+        assert detections['classId'][n] == detection['classId']
+        assert detections['confidence'][n] == detection['confidence']
+        assert detections['source'][n] == detection['source']
+        assert [detections[key][n] for key in ('x1', 'y1', 'x2', 'y2')] == \
+               [detection['bbox'][key] for key in ('x1', 'y1', 'x2', 'y2')]
+    assert 'classes' not in compact['model_info']
+    assert compact['similarity_analysis'] == verbose['similarity_analysis']
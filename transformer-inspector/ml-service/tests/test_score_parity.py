@@ -0,0 +1,16 @@
+"""Similarity scores against Faulty_Detection/golden/score_parity.json (see score_parity.py)"""
+
+import json
+
+from score_parity import GOLDEN_PATH, check_parity, compute_scores
+
+
+def test_scores_match_the_golden_outputs():
+    with open(GOLDEN_PATH, 'r') as f:
+        golden = json.load(f)
+
+    rows = check_parity(golden['cases'], compute_scores())
+
+    drifted = [f"{row['case']} {row['metric']}: {row['golden']} -> {row['current']} {row.get('reason', '')}"
+               for row in rows if not row['ok']]
+    assert not drifted, 'Scores drifted (re-record with score_parity.py --update if intended):\n' + '\n'.join(drifted)
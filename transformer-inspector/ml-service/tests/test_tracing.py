@@ -0,0 +1,12 @@
+"""Trace context headers on service responses"""
+
+
+def test_response_names_the_server_span_in_traceresponse(client):
+    trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+    response = client.get('/api/classes', headers={'traceparent': f"00-{trace_id}-00f067aa0ba902b7-01"})
+
+    assert response.headers['X-Trace-Id'] == trace_id
+    assert 'traceparent' not in response.headers
+    version, response_trace_id, span_id, flags = response.headers['traceresponse'].split('-')
+    assert (version, response_trace_id, flags) == ('00', trace_id, '01')
+    assert span_id != '00f067aa0ba902b7'
@@ -0,0 +1,51 @@
+"""TrainingCorpus run planning: what trains, what is held out, and cleanup of failed runs"""
+
+import os
+
+import pytest
+
+from blob_store import BlobStore
+from training_corpus import TrainingCorpus
+
+
+def test_failed_materialize_releases_the_run(tmp_path):
+    blobs = BlobStore(str(tmp_path / 'blobs'))
+    corpus = TrainingCorpus(str(tmp_path / 'corpus'), blob_store=blobs)
+    for n in range(4):
+        image = tmp_path / f"{n}.jpg"
+        image.write_bytes(b'image %d' % n)
+        corpus.add_sample(str(image), ['0 0.5 0.5 0.1 0.1'], width=64, height=64)
+    plan = corpus.plan_run()
+    owner = corpus.dataset_owner(plan['run_id'])
+    dataset_dir = str(tmp_path / 'dataset')
+
+    def render_new(sample, source_path, images_dir, labels_dir, owner):
+        raise OSError('disk full')
+
+    with pytest.raises(OSError):
+        corpus.materialize(plan, dataset_dir, render_new=render_new)
+
+    assert not os.path.exists(dataset_dir)
+    assert blobs.release(owner) == 0
+
+
+def test_new_feedback_always_trains_and_validation_comes_from_earlier_samples(tmp_path):
+    corpus = TrainingCorpus(str(tmp_path / 'corpus'), blob_store=BlobStore(str(tmp_path / 'blobs')))
+
+    def upload(n):
+        image = tmp_path / f"{n}.jpg"
+        image.write_bytes(b'correction %d' % n)
+        return corpus.add_sample(str(image), ['0 0.5 0.5 0.1 0.1'], width=64, height=64)
+
+    for n in range(20):
+        sample = upload(n)
+        plan = corpus.plan_run()
+        assert sample['sample_id'] in [s['sample_id'] for s in plan['new']]
+        assert sample['sample_id'] not in [s['sample_id'] for s in plan['val']]
+        dataset_dir = str(tmp_path / f"run_{n}")
+        corpus.write_in_memory_manifest(plan, dataset_dir, new_sample_augments=0)
+        corpus.commit_run(dataset_dir)
+
+    # Earlier, already-trained corrections fill the held-out split (20% of the 20 samples)
+    val = corpus.validation()
+    assert len(val) == 4 and all(s['trained_runs'] > 0 for s in val)
@@ -0,0 +1,36 @@
+"""UploadsCatalog "latest" queries against files written since the last rescan"""
+
+import os
+
+from uploads_catalog import UploadsCatalog
+
+FILE_ID = '0b6f6c2e-3f0a-4c1e-9d7a-{:012d}'
+
+
+def store(folder, n, name):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{FILE_ID.format(n)}_{name}")
+    with open(path, 'wb') as f:
+        f.write(b'not decoded by these queries')
+    # Move the folder mtime on explicitly: two writes can share a coarse timestamp
+    os.utime(folder, (1_700_000_000 + n, 1_700_000_000 + n))
+    return path
+
+
+def test_latest_queries_see_files_newer_than_the_rescan(tmp_path):
+    uploads = str(tmp_path / 'uploads')
+    folder = os.path.join(uploads, 'T1', 'inspection')
+    store(folder, 1, 'annotated_INS-7_1700000000000.png')
+    catalog = UploadsCatalog(uploads, str(tmp_path / 'catalog.sqlite3'), rescan_interval=3600, watch=False)
+    try:
+        assert catalog.latest_for_inspection('INS-7')['annotated_at'] == 1700000000000
+
+        # Within the rescan interval: only the stat of the folder notices the new export
+        newer = store(folder, 2, 'annotated_INS-7_1700000999000.png')
+        assert catalog.latest_for_inspection('INS-7')['path'] == newer
+
+        newest = store(folder, 3, 'inspection.png')
+        os.utime(newest, (1_800_000_000, 1_800_000_000))
+        assert catalog.latest_image(transformer_id='T1')['path'] == newest
+    finally:
+        catalog.close()
@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+"""
+Cumulative Training Corpus with Replay Sampling
+
+Every feedback upload adds its labelled image to a persistent corpus instead of a
+throwaway dataset. Images live in the content-addressed blob store (re-annotating the
+same image replaces its labels), and each fine-tune trains on the new samples plus
+a class-stratified replay of samples earlier runs already saw. Runs therefore stay
+short and incremental without forgetting the classes the new feedback lacks.
+
+A class-stratified share of earlier feedback is held out as a persistent validation
+split when a run is planned: samples earlier runs trained on stop being replayed and
+validate instead, so early stopping and the per-run mAP recorded in the runs table
+measure how well a run keeps earlier feedback and stay comparable from run to run.
+New feedback always trains first; the correction that triggered a run is never held out.
+"""
+
+import os
+import json
+import random
+import shutil
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from blob_store import BlobStore, open_blob_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CORPUS_DIR = os.environ.get(
+    'ML_TRAINING_CORPUS_DIR', str(Path(__file__).resolve().parent / 'training_corpus'))
+
+# Replayed historical samples per new sample in a fine-tune run
+REPLAY_RATIO = float(os.environ.get('ML_REPLAY_RATIO', '4'))
+# Cap on replayed samples per run (keeps incremental runs short as the corpus grows)
+REPLAY_MAX = int(os.environ.get('ML_REPLAY_MAX', '200'))
+# Augmented variants written per new sample (replayed samples are used as stored)
+NEW_SAMPLE_AUGMENTS = int(os.environ.get('ML_NEW_SAMPLE_AUGMENTS', '8'))
+# Render augmented variants in the dataloader instead of writing them (feedback_dataset.py)
+IN_MEMORY_AUGMENT = os.environ.get('ML_INMEMORY_AUGMENT', '1') == '1'
+
+# Share of each class's samples held out for validation, once the class has enough
+# training samples (rare classes keep all of theirs for training)
+VAL_FRACTION = float(os.environ.get('ML_VAL_FRACTION', '0.2'))
+VAL_MIN_CLASS_TRAIN = int(os.environ.get('ML_VAL_MIN_CLASS_TRAIN', '3'))
+VAL_MAX = int(os.environ.get('ML_VAL_MAX', '200'))
+
+RUN_MANIFEST = 'corpus_run.json'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    sample_id TEXT PRIMARY KEY,
+    ext TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    labels TEXT NOT NULL,
+    classes TEXT NOT NULL,
+    inspection_number TEXT,
+    source TEXT,
+    added_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    trained_runs INTEGER NOT NULL DEFAULT 0,
+    last_run TEXT,
+    split TEXT NOT NULL DEFAULT 'train'
+);
+CREATE INDEX IF NOT EXISTS idx_samples_pending ON samples (trained_runs);
+CREATE INDEX IF NOT EXISTS idx_samples_split ON samples (split);
+
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    committed_at TEXT,
+    new_samples INTEGER,
+    replay_samples INTEGER,
+    dataset_path TEXT,
+    model TEXT,
+    val_samples INTEGER,
+    epochs INTEGER,
+    best_epoch INTEGER,
+    val_map50 REAL,
+    val_map REAL,
+    train_seconds REAL,
+    stop_reason TEXT
+);
+"""
+
+# Columns added after the first release (ALTER TABLE for existing corpora)
+MIGRATIONS = {
+    'samples': [('split', "TEXT NOT NULL DEFAULT 'train'")],
+    'runs': [('val_samples', 'INTEGER'), ('epochs', 'INTEGER'), ('best_epoch', 'INTEGER'),
+             ('val_map50', 'REAL'), ('val_map', 'REAL'), ('train_seconds', 'REAL'), ('stop_reason', 'TEXT')]
+}
+
+
+def label_classes(labels: List[str]) -> List[int]:
+    """Distinct class ids in YOLO label lines"""
+    return sorted({int(line.split()[0]) for line in labels if line.strip()})
+
+
+def is_in_memory_manifest(path: str) -> bool:
+    """True for a run manifest written by write_in_memory_manifest()"""
+    try:
+        with open(path, 'r') as f:
+            return bool(json.load(f).get('in_memory', False))
+    except (OSError, ValueError):
+        return False
+
+
+class TrainingCorpus:
+    def __init__(self, corpus_dir: str = DEFAULT_CORPUS_DIR, blob_store: BlobStore = None):
+        """
+        Persistent, deduplicated training corpus
+
+        Args:
+            corpus_dir: Holds corpus.sqlite3
+            blob_store: Where sample images are stored (default: the shared blob store)
+        """
+        self.corpus_dir = corpus_dir
+        self.index_path = os.path.join(corpus_dir, 'corpus.sqlite3')
+        self.blob_store = blob_store or open_blob_store()
+
+        os.makedirs(corpus_dir, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            for table, columns in MIGRATIONS.items():
+                existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+                for name, definition in columns:
+                    if existing and name not in existing:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._conn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def image_path(self, sample: Dict) -> str:
+        return self.blob_store.path(sample['sample_id'])
+
+    def add_sample(self, image_path: str, labels: List[str], width: int = None, height: int = None,
+                   inspection_number: str = None, source: str = None) -> Dict:
+        """
+        Add (or re-label) the image; the image bytes are stored once per content hash
+
+        A re-labelled sample becomes pending again, so the next run trains on the new labels
+        (a held-out sample returns to the training split; plan_run holds out another one).
+
+        Returns:
+            dict: The sample row plus 'is_new'
+        """
+        sample_id = self.blob_store.put_file(image_path)
+        self.blob_store.add_ref(sample_id, owner='corpus', name=sample_id)
+        ext = os.path.splitext(image_path)[1].lower() or '.jpg'
+
+        now = datetime.now().isoformat()
+        labels_json = json.dumps(list(labels))
+        classes = ','.join(str(c) for c in label_classes(labels))
+        with self._connection() as conn:
+            existing = conn.execute('SELECT labels FROM samples WHERE sample_id = ?', (sample_id,)).fetchone()
+            if existing is None:
+                conn.execute(
+                    'INSERT INTO samples (sample_id, ext, width, height, labels, classes, '
+                    'inspection_number, source, added_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (sample_id, ext, width, height, labels_json, classes,
+                     inspection_number, source, now, now)
+                )
+            elif existing['labels'] != labels_json:
+                conn.execute(
+                    'UPDATE samples SET labels = ?, classes = ?, inspection_number = ?, source = ?, '
+                    "updated_at = ?, trained_runs = 0, split = 'train' WHERE sample_id = ?",
+                    (labels_json, classes, inspection_number, source, now, sample_id)
+                )
+        sample = self.get(sample_id)
+        sample['is_new'] = existing is None
+        return sample
+
+    @staticmethod
+    def _hold_out(conn: sqlite3.Connection) -> int:
+        """
+        Move earlier, already-trained samples to the validation split: a sample is held
+        out when every one of its classes keeps VAL_MIN_CLASS_TRAIN training samples
+        without it and stays within its VAL_FRACTION share of validation samples.
+        Pending samples (new feedback) and background-only samples always train; the
+        least-replayed, oldest samples are held out first.
+
+        Returns:
+            int: Number of samples moved to the validation split
+        """
+        if VAL_FRACTION <= 0:
+            return 0
+        rows = conn.execute('SELECT sample_id, classes, split, trained_runs FROM samples '
+                            'ORDER BY trained_runs, added_at').fetchall()
+        counts: Dict[int, Dict[str, int]] = {}
+        for row in rows:
+            for class_id in (int(c) for c in row['classes'].split(',') if c):
+                class_counts = counts.setdefault(class_id, {'train': 0, 'val': 0})
+                class_counts[row['split']] += 1
+        held = sum(1 for row in rows if row['split'] == 'val')
+
+        moved = []
+        for row in rows:
+            if held >= VAL_MAX:
+                break
+            classes = [int(c) for c in row['classes'].split(',') if c]
+            if row['split'] != 'train' or row['trained_runs'] == 0 or not classes:
+                continue
+            if all(counts[c]['train'] - 1 >= VAL_MIN_CLASS_TRAIN and
+                   counts[c]['val'] + 1 <= VAL_FRACTION * (counts[c]['train'] + counts[c]['val'])
+                   for c in classes):
+                for c in classes:
+                    counts[c]['train'] -= 1
+                    counts[c]['val'] += 1
+                moved.append((row['sample_id'],))
+                held += 1
+        conn.executemany("UPDATE samples SET split = 'val' WHERE sample_id = ?", moved)
+        return len(moved)
+
+    def get(self, sample_id: str) -> Optional[Dict]:
+        row = self._conn().execute('SELECT * FROM samples WHERE sample_id = ?', (sample_id,)).fetchone()
+        return self._row(row) if row else None
+
+    @staticmethod
+    def _row(row) -> Dict:
+        sample = dict(row)
+        sample['labels'] = json.loads(sample['labels'])
+        sample['classes'] = [int(c) for c in sample['classes'].split(',') if c]
+        return sample
+
+    def pending(self) -> List[Dict]:
+        """Samples no committed run has trained on yet (new feedback)"""
+        rows = self._conn().execute(
+            "SELECT * FROM samples WHERE trained_runs = 0 AND split = 'train' ORDER BY added_at")
+        return [self._row(row) for row in rows]
+
+    def validation(self, limit: int = VAL_MAX) -> List[Dict]:
+        """The held-out validation samples (newest first when capped)"""
+        rows = self._conn().execute(
+            "SELECT * FROM samples WHERE split = 'val' ORDER BY added_at DESC LIMIT ?", (limit,))
+        return [self._row(row) for row in rows]
+
+    def sample_replay(self, count: int, rng: random.Random = None, exclude=()) -> List[Dict]:
+        """
+        Class-stratified sample of already-trained samples
+
+        Each class gets an equal share of the budget (rare classes first, so they are
+        not crowded out); within a class the least-replayed samples are preferred.
+
+        Args:
+            count: Number of samples to draw
+            rng: Random source for tie-breaking (deterministic runs pass a seeded one)
+            exclude: Sample ids not to draw (e.g. the run's new samples)
+        """
+        rng = rng or random.Random()
+        exclude = set(exclude)
+        rows = self._conn().execute(
+            "SELECT sample_id, classes, trained_runs FROM samples WHERE trained_runs > 0 AND split = 'train'").fetchall()
+        candidates = [dict(r) for r in rows if r['sample_id'] not in exclude]
+        if count <= 0 or not candidates:
+            return []
+
+        by_class: Dict[int, List[Dict]] = {}
+        for candidate in candidates:
+            candidate['tiebreak'] = rng.random()
+            for class_id in (int(c) for c in candidate['classes'].split(',') if c):
+                by_class.setdefault(class_id, []).append(candidate)
+        for members in by_class.values():
+            members.sort(key=lambda c: (c['trained_runs'], c['tiebreak']))
+
+        chosen: List[str] = []
+        chosen_set = set()
+        classes = sorted(by_class, key=lambda c: len(by_class[c]))
+        # Round-robin over classes (rarest first) until the budget is spent
+        cursors = {c: 0 for c in classes}
+        while len(chosen) < count and classes:
+            for class_id in list(classes):
+                members = by_class[class_id]
+                while cursors[class_id] < len(members) and members[cursors[class_id]]['sample_id'] in chosen_set:
+                    cursors[class_id] += 1
+                if cursors[class_id] >= len(members):
+                    classes.remove(class_id)
+                    continue
+                sample_id = members[cursors[class_id]]['sample_id']
+                chosen.append(sample_id)
+                chosen_set.add(sample_id)
+                if len(chosen) >= count:
+                    break
+
+        # Background-only samples (no labels) fill what the classes could not
+        if len(chosen) < count:
+            rest = sorted((c for c in candidates if c['sample_id'] not in chosen_set),
+                          key=lambda c: (c['trained_runs'], c['tiebreak']))
+            chosen.extend(c['sample_id'] for c in rest[:count - len(chosen)])
+
+        return [self.get(sample_id) for sample_id in chosen]
+
+    def plan_run(self, replay_ratio: float = REPLAY_RATIO, replay_max: int = REPLAY_MAX,
+                 seed: int = 0) -> Dict:
+        """
+        Pick the samples of the next fine-tune: all pending samples plus replay, and
+        the held-out validation samples (topped up from earlier samples first, see _hold_out)
+
+        Returns:
+            dict: run_id, new (samples), replay (samples), val (samples)
+        """
+        run_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        with self._connection() as conn:
+            held_out = self._hold_out(conn)
+        if held_out:
+            logger.info(f"Held out {held_out} earlier corpus sample(s) for validation")
+        new = self.pending()
+        replay_count = min(replay_max, int(round(len(new) * replay_ratio)))
+        committed_runs = self._conn().execute(
+            'SELECT COUNT(*) FROM runs WHERE committed_at IS NOT NULL').fetchone()[0]
+        replay = self.sample_replay(replay_count, random.Random(f"{seed}:{committed_runs}"),
+                                    exclude=[s['sample_id'] for s in new])
+        return {'run_id': run_id, 'new': new, 'replay': replay, 'val': self.validation()}
+
+    def materialize(self, plan: Dict, dataset_dir: str, render_new=None) -> Dict:
+        """
+        Write the run's YOLO dataset (images/train, labels/train and the validation
+        split in images/val, labels/val); sample images are linked from the blob
+        store, never copied
+
+        Args:
+            plan: Result of plan_run()
+            dataset_dir: Target dataset directory
+            render_new: Optional callable(sample, source_path, images_dir, labels_dir, owner) -> (images, labels)
+                        producing augmented variants of a new sample (blob references go to
+                        owner, the run's dataset owner); without it the
+                        new sample is linked once like the replayed ones
+
+        Returns:
+            dict: Counts of images and label lines written
+        """
+        with self._building_run(plan['run_id'], dataset_dir):
+            images_dir = os.path.join(dataset_dir, 'images', 'train')
+            labels_dir = os.path.join(dataset_dir, 'labels', 'train')
+            os.makedirs(images_dir, exist_ok=True)
+            os.makedirs(labels_dir, exist_ok=True)
+
+            owner = self.dataset_owner(plan['run_id'])
+            new_ids = {s['sample_id'] for s in plan['new']}
+            images = annotations = 0
+            for sample in plan['new'] + plan['replay']:
+                source_path = self.image_path(sample)
+                stem = sample['sample_id'][:16]
+                self.blob_store.link(sample['sample_id'], os.path.join(images_dir, stem + sample['ext']), owner)
+                with open(os.path.join(labels_dir, f"{stem}.txt"), 'w') as f:
+                    f.write(''.join(line + '\n' for line in sample['labels']))
+                images += 1
+                annotations += len(sample['labels'])
+
+                if render_new is not None and sample['sample_id'] in new_ids:
+                    rendered_images, rendered_annotations = render_new(sample, source_path,
+                                                                       images_dir, labels_dir, owner)
+                    images += rendered_images
+                    annotations += rendered_annotations
+
+            manifest = {
+                'run_id': plan['run_id'],
+                'corpus_dir': self.corpus_dir,
+                'new_samples': [s['sample_id'] for s in plan['new']],
+                'replay_samples': [s['sample_id'] for s in plan['replay']],
+                'images': images,
+                'annotations': annotations,
+                'val_samples': [s['sample_id'] for s in plan.get('val', [])],
+                'val_images': self.link_split(plan.get('val', []), dataset_dir, 'val', owner)
+            }
+            self._record_run(plan, dataset_dir, manifest)
+            return manifest
+
+    def link_split(self, samples: List[Dict], dataset_dir: str, split: str, owner: str) -> int:
+        """
+        Link samples as-is into images/<split> with their labels in labels/<split>
+
+        Returns:
+            int: Number of images linked
+        """
+        if not samples:
+            return 0
+        images_dir = os.path.join(dataset_dir, 'images', split)
+        labels_dir = os.path.join(dataset_dir, 'labels', split)
+        os.makedirs(images_dir, exist_ok=True)
+        os.makedirs(labels_dir, exist_ok=True)
+        for sample in samples:
+            stem = sample['sample_id'][:16]
+            self.blob_store.link(sample['sample_id'], os.path.join(images_dir, stem + sample['ext']), owner)
+            with open(os.path.join(labels_dir, f"{stem}.txt"), 'w') as f:
+                f.write(''.join(line + '\n' for line in sample['labels']))
+        return len(samples)
+
+    def _record_run(self, plan: Dict, dataset_dir: str, manifest: Dict):
+        with open(os.path.join(dataset_dir, RUN_MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO runs (run_id, created_at, new_samples, replay_samples, val_samples, '
+                'dataset_path) VALUES (?, ?, ?, ?, ?, ?)',
+                (plan['run_id'], datetime.now().isoformat(), len(plan['new']), len(plan['replay']),
+                 len(plan.get('val', [])), dataset_dir)
+            )
+
+    def write_in_memory_manifest(self, plan: Dict, dataset_dir: str,
+                                 new_sample_augments: int = NEW_SAMPLE_AUGMENTS, seed: int = 0) -> Dict:
+        """
+        Describe the run for FeedbackAugmentDataset instead of materializing it; only
+        the manifest is written, images are read straight from the blob store and
+        augmented in the dataloader. The validation split is linked into images/val
+        like in materialize(), so validation and INT8 checks can read it as usual.
+
+        Args:
+            plan: Result of plan_run()
+            dataset_dir: Target dataset directory (receives corpus_run.json only)
+            new_sample_augments: Augmented variants per new sample (replay uses the original only)
+            seed: Seed of the per-variant augmentation parameters
+
+        Returns:
+            dict: The manifest
+        """
+        with self._building_run(plan['run_id'], dataset_dir):
+            os.makedirs(dataset_dir, exist_ok=True)
+            new_ids = {s['sample_id'] for s in plan['new']}
+            samples = []
+            annotations = 0
+            for sample in plan['new'] + plan['replay']:
+                variants = 1 + (new_sample_augments if sample['sample_id'] in new_ids else 0)
+                samples.append({
+                    'sample_id': sample['sample_id'],
+                    'image': self.image_path(sample),
+                    'width': sample['width'],
+                    'height': sample['height'],
+                    'labels': sample['labels'],
+                    'variants': variants
+                })
+                annotations += len(sample['labels']) * variants
+
+            manifest = {
+                'run_id': plan['run_id'],
+                'corpus_dir': self.corpus_dir,
+                'in_memory': True,
+                'seed': seed,
+                'new_samples': [s['sample_id'] for s in plan['new']],
+                'replay_samples': [s['sample_id'] for s in plan['replay']],
+                'images': sum(s['variants'] for s in samples),
+                'annotations': annotations,
+                'val_samples': [s['sample_id'] for s in plan.get('val', [])],
+                'val_images': self.link_split(plan.get('val', []), dataset_dir, 'val',
+                                              self.dataset_owner(plan['run_id'])),
+                'samples': samples
+            }
+            self._record_run(plan, dataset_dir, manifest)
+            return manifest
+
+    def commit_run(self, dataset_dir: str, model: str = None, metrics: Dict = None) -> Optional[Dict]:
+        """
+        Record that training on a materialized dataset succeeded; its samples stop
+        being pending and count as replayed once more
+
+        Args:
+            metrics: Optional training outcome (epochs, best_epoch, val_map50, val_map,
+                     train_seconds, stop_reason) stored with the run
+
+        Returns:
+            dict: The run manifest, or None if the dataset did not come from the corpus
+        """
+        manifest_path = os.path.join(dataset_dir, RUN_MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+        now = datetime.now().isoformat()
+        sample_ids = manifest['new_samples'] + manifest['replay_samples']
+        with self._connection() as conn:
+            conn.executemany('UPDATE samples SET trained_runs = trained_runs + 1, last_run = ? WHERE sample_id = ?',
+                             [(manifest['run_id'], sample_id) for sample_id in sample_ids])
+            conn.execute('UPDATE runs SET committed_at = ?, model = ? WHERE run_id = ?',
+                         (now, model, manifest['run_id']))
+            if metrics:
+                columns = [c for c in ('epochs', 'best_epoch', 'val_map50', 'val_map', 'train_seconds', 'stop_reason')
+                           if metrics.get(c) is not None]
+                if columns:
+                    conn.execute(f"UPDATE runs SET {', '.join(f'{c} = ?' for c in columns)} WHERE run_id = ?",
+                                 [metrics[c] for c in columns] + [manifest['run_id']])
+        logger.info(f"Corpus run {manifest['run_id']} committed: {len(manifest['new_samples'])} new, "
+                    f"{len(manifest['replay_samples'])} replayed samples")
+        return manifest
+
+    @staticmethod
+    def dataset_owner(run_id: str) -> str:
+        return f"dataset:{run_id}"
+
+    @contextmanager
+    def _building_run(self, run_id: str, dataset_dir: str):
+        """Delete a half-built run directory and release its blob references when building fails"""
+        try:
+            yield
+        except BaseException:
+            shutil.rmtree(dataset_dir, ignore_errors=True)
+            self.blob_store.release(self.dataset_owner(run_id))
+            raise
+
+    def discard_dataset(self, dataset_dir: str, gc: bool = True):
+        """Delete a materialized dataset, release its blob references and reclaim unused blobs"""
+        manifest_path = os.path.join(dataset_dir, RUN_MANIFEST)
+        run_id = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                run_id = json.load(f)['run_id']
+        shutil.rmtree(dataset_dir)
+        if run_id:
+            self.blob_store.release(self.dataset_owner(run_id))
+        if gc:
+            self.blob_store.gc()
+
+    def stats(self) -> Dict:
+        conn = self._conn()
+        per_class: Dict[int, int] = {}
+        for row in conn.execute('SELECT classes FROM samples'):
+            for class_id in (int(c) for c in row['classes'].split(',') if c):
+                per_class[class_id] = per_class.get(class_id, 0) + 1
+        return {
+            'samples': conn.execute('SELECT COUNT(*) FROM samples').fetchone()[0],
+            'pending': conn.execute(
+                "SELECT COUNT(*) FROM samples WHERE trained_runs = 0 AND split = 'train'").fetchone()[0],
+            'validation': conn.execute("SELECT COUNT(*) FROM samples WHERE split = 'val'").fetchone()[0],
+            'runs': conn.execute('SELECT COUNT(*) FROM runs WHERE committed_at IS NOT NULL').fetchone()[0],
+            'samples_per_class': per_class
+        }
+
+    def recent_runs(self, limit: int = 20) -> List[Dict]:
+        """Committed runs with their training outcome, newest first"""
+        rows = self._conn().execute(
+            'SELECT run_id, committed_at, new_samples, replay_samples, val_samples, epochs, best_epoch, '
+            'val_map50, val_map, train_seconds, stop_reason FROM runs WHERE committed_at IS NOT NULL '
+            'ORDER BY committed_at DESC LIMIT ?', (limit,))
+        return [dict(row) for row in rows]
+
+
+_corpora: Dict[str, TrainingCorpus] = {}
+_corpora_lock = threading.Lock()
+
+
+def open_corpus(corpus_dir: str = DEFAULT_CORPUS_DIR) -> TrainingCorpus:
+    """Shared corpus per directory within a process"""
+    key = os.path.abspath(corpus_dir)
+    with _corpora_lock:
+        corpus = _corpora.get(key)
+        if corpus is None:
+            corpus = _corpora[key] = TrainingCorpus(key)
+        return corpus
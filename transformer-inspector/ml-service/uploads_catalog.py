@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Uploads Catalog
+
+SQLite index of the backend upload store (<root>/<transformerId>/{baseline,inspection}/<fileId>_<name>)
+mapping image ids and inspection numbers to file path, dimensions and content hash.
+Rescans are incremental: only folders whose mtime changed are listed again, and only
+new or modified files are opened. With the optional `watchdog` package the folders are
+marked dirty by filesystem events instead of being stat'ed on every rescan. "Latest"
+queries always stat the folders they read from first, so they never answer from an
+index that predates the newest file.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVICE_DIR = Path(__file__).resolve().parent
+DEFAULT_INDEX_PATH = os.environ.get('ML_UPLOADS_CATALOG', str(SERVICE_DIR / 'cache' / 'uploads_catalog.sqlite3'))
+
+# Minimum seconds between polling rescans (lookups that miss always rescan)
+RESCAN_INTERVAL = float(os.environ.get('ML_UPLOADS_RESCAN_INTERVAL', '30'))
+# Use watchdog filesystem events when the package is installed ('0' disables)
+WATCH_UPLOADS = os.environ.get('ML_UPLOADS_WATCH', '1') != '0'
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+UPLOAD_KINDS = ('baseline', 'inspection')
+
+# <fileId>_<original name>, fileId being the UUID the backend prefixes to every stored file
+STORED_NAME_RE = re.compile(r'^([0-9a-fA-F-]{36})_(.+)$')
+# Annotated exports from the frontend: annotated_<inspectionNumber>_<epoch ms>.png
+ANNOTATED_NAME_RE = re.compile(r'^annotated_(.+)_(\d{13})\.\w+$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    transformer_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    file_id TEXT,
+    original_name TEXT,
+    inspection_number TEXT,
+    annotated_at INTEGER,
+    size INTEGER,
+    mtime REAL,
+    width INTEGER,
+    height INTEGER,
+    sha256 TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_file_id ON files (file_id);
+CREATE INDEX IF NOT EXISTS idx_files_inspection ON files (inspection_number, annotated_at);
+CREATE INDEX IF NOT EXISTS idx_files_folder ON files (folder);
+CREATE INDEX IF NOT EXISTS idx_files_mtime ON files (mtime);
+CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files (sha256);
+
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+"""
+
+
+def resolve_uploads_dir(base_dir: str = None) -> str:
+    """
+    Upload store root: ML_UPLOADS_DIR, else app.storage.root from the backend's
+    application.properties when that path exists here, else backend/uploads
+    """
+    if os.environ.get('ML_UPLOADS_DIR'):
+        return os.environ['ML_UPLOADS_DIR']
+
+    base_dir = base_dir or str(SERVICE_DIR)
+    properties_path = os.path.join(base_dir, '..', 'backend', 'src', 'main', 'resources', 'application.properties')
+    if os.path.exists(properties_path):
+        try:
+            with open(properties_path, 'r') as prop_file:
+                for line in prop_file:
+                    if line.strip().startswith('app.storage.root'):
+                        value = line.strip().split('=', 1)[1].strip()
+                        if os.path.isdir(value):
+                            return value
+                        break
+        except Exception as e:
+            logger.warning(f"Could not read application.properties: {e}")
+
+    return os.path.abspath(os.path.join(base_dir, '..', 'backend', 'uploads'))
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_size(path: str):
+    """(width, height) from the image header, (None, None) if unreadable"""
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None, None
+
+
+def parse_stored_name(filename: str) -> Dict:
+    """Split a stored upload name into file id, original name and annotation metadata"""
+    match = STORED_NAME_RE.match(filename)
+    file_id, original_name = (match.group(1).lower(), match.group(2)) if match else (None, filename)
+    annotated = ANNOTATED_NAME_RE.match(original_name)
+    return {
+        'file_id': file_id,
+        'original_name': original_name,
+        'inspection_number': annotated.group(1) if annotated else None,
+        'annotated_at': int(annotated.group(2)) if annotated else None
+    }
+
+
+class UploadsCatalog:
+    def __init__(self, uploads_dir: str = None, index_path: str = DEFAULT_INDEX_PATH,
+                 rescan_interval: float = RESCAN_INTERVAL, watch: bool = WATCH_UPLOADS):
+        """
+        Indexed view of the upload store
+
+        Args:
+            uploads_dir: Upload store root (default: resolve_uploads_dir())
+            index_path: SQLite index file
+            rescan_interval: Minimum seconds between polling rescans
+            watch: Use watchdog events (if installed) to find changed folders
+        """
+        self.uploads_dir = os.path.abspath(uploads_dir or resolve_uploads_dir())
+        self.index_path = index_path
+        self.rescan_interval = rescan_interval
+
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        self._local = threading.local()
+        self._scan_lock = threading.Lock()
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._last_scan = 0.0
+        self._observer = None
+
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+        if watch:
+            self._start_watcher()
+
+    # ------------------------------------------------------------------ internals
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._conn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _start_watcher(self):
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return  # Polling rescans only
+        if not os.path.isdir(self.uploads_dir):
+            return
+
+        catalog = self
+
+        class DirtyFolderHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                for path in (event.src_path, getattr(event, 'dest_path', None)):
+                    if path:
+                        catalog._mark_dirty(os.path.dirname(path) if not event.is_directory else path)
+
+        self._observer = Observer()
+        self._observer.daemon = True
+        self._observer.schedule(DirtyFolderHandler(), self.uploads_dir, recursive=True)
+        self._observer.start()
+        logger.info(f"Watching {self.uploads_dir} for uploads")
+
+    def _mark_dirty(self, folder: str):
+        with self._dirty_lock:
+            self._dirty.add(os.path.abspath(folder))
+
+    def _candidate_folders(self) -> List[str]:
+        """<transformerId>/{baseline,inspection} folders of the upload store"""
+        folders = []
+        with os.scandir(self.uploads_dir) as transformers:
+            for transformer in transformers:
+                if not transformer.is_dir():
+                    continue
+                for kind in UPLOAD_KINDS:
+                    folder = os.path.join(transformer.path, kind)
+                    if os.path.isdir(folder):
+                        folders.append(folder)
+        return folders
+
+    def _scan_folder(self, conn, folder: str, folder_mtime: float) -> int:
+        """Reconcile one folder with the index; returns the number of (re)indexed files"""
+        known = {row['path']: (row['size'], row['mtime'])
+                 for row in conn.execute('SELECT path, size, mtime FROM files WHERE folder = ?', (folder,))}
+        transformer_id = os.path.basename(os.path.dirname(folder))
+        kind = os.path.basename(folder)
+
+        indexed = 0
+        seen = set()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                seen.add(entry.path)
+                stat = entry.stat()
+                if known.get(entry.path) == (stat.st_size, stat.st_mtime):
+                    continue
+                width, height = image_size(entry.path)
+                meta = parse_stored_name(entry.name)
+                conn.execute(
+                    'INSERT OR REPLACE INTO files (path, folder, transformer_id, kind, file_id, original_name, '
+                    'inspection_number, annotated_at, size, mtime, width, height, sha256) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (entry.path, folder, transformer_id, kind, meta['file_id'], meta['original_name'],
+                     meta['inspection_number'], meta['annotated_at'], stat.st_size, stat.st_mtime,
+                     width, height, file_sha256(entry.path))
+                )
+                indexed += 1
+
+        removed = [path for path in known if path not in seen]
+        conn.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in removed])
+        conn.execute('INSERT OR REPLACE INTO folders (path, mtime) VALUES (?, ?)', (folder, folder_mtime))
+        return indexed + len(removed)
+
+    def _check_folder(self, conn, folder: str, known_mtime: Optional[float]) -> int:
+        """Rescan a folder whose mtime differs from the index (one stat), or drop it if gone"""
+        try:
+            folder_mtime = os.stat(folder).st_mtime
+        except FileNotFoundError:
+            return self._drop_folder(conn, folder)
+        # New files get fresh UUID names, so a folder whose mtime is unchanged has no new files
+        if known_mtime != folder_mtime:
+            return self._scan_folder(conn, folder, folder_mtime)
+        return 0
+
+    @staticmethod
+    def _drop_folder(conn, folder: str) -> int:
+        removed = conn.execute('DELETE FROM files WHERE folder = ?', (folder,)).rowcount
+        conn.execute('DELETE FROM folders WHERE path = ?', (folder,))
+        return removed
+
+    def _refresh_folders(self, folders: List[str]) -> int:
+        """Bring just these folders up to date, regardless of the rescan interval"""
+        if not os.path.isdir(self.uploads_dir):
+            return 0
+        changed = 0
+        with self._scan_lock, self._connection() as conn:
+            for folder in folders:
+                row = conn.execute('SELECT mtime FROM folders WHERE path = ?', (folder,)).fetchone()
+                changed += self._check_folder(conn, folder, row['mtime'] if row else None)
+        if changed:
+            logger.info(f"Uploads catalog updated: {changed} file(s) changed")
+        return changed
+
+    # ------------------------------------------------------------------ public API
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Bring the index up to date with the upload store
+
+        Without a watcher every folder's mtime is compared with the index (one stat per
+        folder, no per-file work); with a watcher only folders reported dirty are checked.
+
+        Args:
+            force: Rescan even if the last rescan is recent
+
+        Returns:
+            int: Number of files added, changed or removed
+        """
+        if not os.path.isdir(self.uploads_dir):
+            return 0
+        with self._scan_lock:
+            watching = self._observer is not None and self._last_scan > 0
+            with self._dirty_lock:
+                dirty, self._dirty = self._dirty, set()
+            if not force and not dirty and time.monotonic() - self._last_scan < self.rescan_interval:
+                return 0
+
+            if watching and not force:
+                folders = [f for f in dirty if os.path.dirname(os.path.dirname(f)) == self.uploads_dir
+                           and os.path.basename(f) in UPLOAD_KINDS]
+            else:
+                folders = self._candidate_folders()
+
+            changed = 0
+            with self._connection() as conn:
+                known = {row['path']: row['mtime'] for row in conn.execute(
+                    'SELECT path, mtime FROM folders WHERE path LIKE ?', (self.uploads_dir + os.sep + '%',))}
+                gone = set() if watching and not force else set(known) - set(folders)
+                for folder in folders:
+                    changed += self._check_folder(conn, folder, known.get(folder))
+                for folder in gone:
+                    changed += self._drop_folder(conn, folder)
+            self._last_scan = time.monotonic()
+
+        if changed:
+            logger.info(f"Uploads catalog updated: {changed} file(s) changed")
+        return changed
+
+    def _lookup(self, sql: str, params=()) -> Optional[Dict]:
+        """Run a single-row lookup; on a miss rescan once (the file may be brand new) and retry"""
+        self.refresh()
+        row = self._conn().execute(sql, params).fetchone()
+        if row is None and self.refresh(force=True):
+            row = self._conn().execute(sql, params).fetchone()
+        return dict(row) if row else None
+
+    def get_image(self, image_id: str, transformer_id: str = None) -> Optional[Dict]:
+        """Catalog entry of the stored file whose backend file id is image_id"""
+        if transformer_id:
+            return self._lookup('SELECT * FROM files WHERE file_id = ? AND transformer_id = ?',
+                                (image_id.lower(), transformer_id))
+        return self._lookup('SELECT * FROM files WHERE file_id = ?', (image_id.lower(),))
+
+    def latest_for_inspection(self, inspection_number: str) -> Optional[Dict]:
+        """Newest annotated export of the inspection"""
+        # Its folders are stat'ed first: a rescan-interval old index may miss the newest export
+        folders = [row['folder'] for row in self._conn().execute(
+            'SELECT DISTINCT folder FROM files WHERE inspection_number = ?', (inspection_number,))]
+        self._refresh_folders(folders)
+        return self._lookup('SELECT * FROM files WHERE inspection_number = ? '
+                            'ORDER BY annotated_at DESC LIMIT 1', (inspection_number,))
+
+    def latest_image(self, transformer_id: str = None) -> Optional[Dict]:
+        """Most recently modified image, optionally within one transformer's folders"""
+        if transformer_id:
+            self._refresh_folders([os.path.join(self.uploads_dir, transformer_id, kind) for kind in UPLOAD_KINDS])
+            return self._lookup('SELECT * FROM files WHERE transformer_id = ? ORDER BY mtime DESC LIMIT 1',
+                                (transformer_id,))
+        self.refresh(force=True)
+        return self._lookup('SELECT * FROM files ORDER BY mtime DESC LIMIT 1')
+
+    def find_by_hash(self, sha256: str) -> List[Dict]:
+        self.refresh()
+        return [dict(row) for row in self._conn().execute('SELECT * FROM files WHERE sha256 = ?', (sha256,))]
+
+    def stats(self) -> Dict:
+        conn = self._conn()
+        return {
+            'uploads_dir': self.uploads_dir,
+            'files': conn.execute('SELECT COUNT(*) FROM files').fetchone()[0],
+            'folders': conn.execute('SELECT COUNT(*) FROM folders').fetchone()[0],
+            'watching': self._observer is not None
+        }
+
+    def close(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+
+_catalogs: Dict[str, UploadsCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def open_catalog(uploads_dir: str = None) -> UploadsCatalog:
+    """Shared catalog per upload store within a process"""
+    uploads_dir = os.path.abspath(uploads_dir or resolve_uploads_dir())
+    with _catalogs_lock:
+        catalog = _catalogs.get(uploads_dir)
+        if catalog is None:
+            catalog = _catalogs[uploads_dir] = UploadsCatalog(uploads_dir)
+        return catalog